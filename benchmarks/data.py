@@ -0,0 +1,100 @@
+"""
+Synthetic data for the benchmarks, generated on the models of the test application
+"""
+import random
+
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import UserObjectPermission, GroupObjectPermission
+
+from tests.app.models import Container, ItemA, ItemB, ItemC, ItemD, ItemE
+
+# name => description of the permissions the user gets
+USER_PROFILES = {
+    'superuser': 'is superuser',
+    'global': 'global view/change permission on Container',
+    'guardian': 'guardian view/change permission on every 10th Container',
+    'group': 'member of a group with guardian view permission on every 20th Container',
+    'owner': 'owner of every 50th Container and ItemE',
+    'nobody': 'no permissions at all',
+}
+
+
+def _bulk_create(model, objects):
+    """
+    bulk creates the objects and returns their primary keys in order of creation (on sqlite bulk_create
+    does not set the primary keys of the created instances). The batch size is left to django, it is limited
+    by the number of query parameters of the database backend
+    """
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    model.objects.bulk_create(objects)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+
+def _permission(codename):
+    return Permission.objects.get(codename=codename)
+
+
+def generate(rows, seed=0):
+    """
+    Generates ``rows`` ItemA and ItemE rows, rows/10 Containers and ItemC, rows/2 ItemB and ItemD rows (each
+    linked to 2 random containers) and users with guardian object and group permissions described
+    by ``USER_PROFILES``.
+
+    :return: dictionary profile name => user
+    """
+    rnd = random.Random(seed)
+
+    users = {}
+    for profile in USER_PROFILES:
+        users[profile] = User.objects.create(username='bench_%s' % profile, is_superuser=(profile == 'superuser'))
+    users['global'].user_permissions.add(_permission('view_container'), _permission('change_container'))
+
+    container_count = max(rows // 10, 1)
+    item_c_ids = _bulk_create(ItemC, [ItemC(name='c%s' % i) for i in range(container_count)])
+    container_ids = _bulk_create(Container, [
+        Container(name='c%s' % i, item_c_id=item_c_ids[i] if i % 2 else None,
+                  owner_id=users['owner'].pk if i % 50 == 0 else None)
+        for i in range(container_count)
+    ])
+
+    _bulk_create(ItemA, [ItemA(name='a%s' % i, parent_id=rnd.choice(container_ids)) for i in range(rows)])
+    _bulk_create(ItemE, [
+        ItemE(name='e%s' % i, parent_id=rnd.choice(container_ids),
+              owner_id=users['owner'].pk if i % 50 == 0 else None)
+        for i in range(rows)
+    ])
+
+    item_b_ids = _bulk_create(ItemB, [ItemB(name='b%s' % i) for i in range(max(rows // 2, 1))])
+    _bulk_create(ItemB.parents.through, [
+        ItemB.parents.through(itemb_id=item_id, container_id=container_id)
+        for item_id in item_b_ids
+        for container_id in set(rnd.sample(container_ids, min(2, len(container_ids))))
+    ])
+
+    item_d_ids = _bulk_create(ItemD, [ItemD(name='d%s' % i) for i in range(max(rows // 2, 1))])
+    _bulk_create(Container.items_d.through, [
+        Container.items_d.through(itemd_id=item_id, container_id=container_id)
+        for item_id in item_d_ids
+        for container_id in set(rnd.sample(container_ids, min(2, len(container_ids))))
+    ])
+
+    container_ct = ContentType.objects.get_for_model(Container)
+    view_container = _permission('view_container')
+    change_container = _permission('change_container')
+    _bulk_create(UserObjectPermission, [
+        UserObjectPermission(user=users['guardian'], permission=permission, content_type=container_ct,
+                             object_pk=str(container_id))
+        for container_id in container_ids[::10]
+        for permission in (view_container, change_container)
+    ])
+
+    group = Group.objects.create(name='bench_group')
+    users['group'].groups.add(group)
+    _bulk_create(GroupObjectPermission, [
+        GroupObjectPermission(group=group, permission=view_container, content_type=container_ct,
+                              object_pk=str(container_id))
+        for container_id in container_ids[::20]
+    ])
+
+    return users
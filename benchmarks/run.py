@@ -0,0 +1,236 @@
+"""
+Benchmarks of queryset filtering and object permission checks on synthetic data.
+
+Runs on an in-memory SQLite database created from the test application, no external services are needed:
+
+    python -m benchmarks.run --rows 10000 --output results.json
+
+For every viewset configuration of ``tests/app/viewsets.py``, filtering mode, user profile and action it measures
+the time to build the SQL of ``create_queryset_factory``, the time to execute it (count + first page), the number
+of queries and peak python memory, and the same for ``has_object_permission`` on a sample of objects. The result
+is a JSON document, so that runs of different releases can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.app.settings')
+    django.setup()
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def get_configurations():
+    from tests.app.models import Container, ItemA, ItemB, ItemC, ItemD, ItemE
+    from tests.app.viewsets import perms, perms1, perms2, perms3, perms4
+
+    # viewset name => (RestPermissions instance, model)
+    return {
+        'ContainerViewSet': (perms, Container),
+        'ItemAViewSet': (perms, ItemA),
+        'ItemBViewSet': (perms, ItemB),
+        'ItemCViewSet': (perms, ItemC),
+        'ItemDViewSet': (perms, ItemD),
+        'DenyAllViewSet': (perms1, ItemA),
+        'AllowOnlyOwnerViewSet': (perms2, ItemE),
+        'DelegatedOwnerViewSet': (perms3, ItemA),
+        'DelegatedOwnerWithAndViewSet': (perms4, ItemA),
+    }
+
+
+MODES = {
+    'querysets': False,     # partial querysets combined by "|" + distinct()
+    'compiled': True,       # RestPermissions(compile_filters=True)
+}
+
+
+class BenchmarkRequest:
+    def __init__(self, user, method):
+        self.user = user
+        self.method = method
+
+
+class BenchmarkView:
+    def __init__(self, request, action, model):
+        self.request = request
+        self.action = action
+        self.queryset = model.objects.all()
+
+
+def measure(func, repeat):
+    """
+    calls func ``repeat`` times, returns (last result, list of durations, query count of the last call,
+    peak memory of the last call)
+    """
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    durations = []
+    result = None
+    queries = 0
+    peak_memory = 0
+    for _ in range(repeat):
+        reset_queries()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            result = func()
+            durations.append(time.perf_counter() - start)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        queries = len(captured)
+    return result, durations, queries, peak_memory
+
+
+def summary(durations):
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+    }
+
+
+def benchmark_queryset(rest_permissions, model, user, action, page_size, repeat):
+    from django.core.exceptions import EmptyResultSet
+
+    def build():
+        qs = rest_permissions.create_queryset_factory(model)(user, action)
+        try:
+            qs.query.get_compiler(qs.db).as_sql()
+        except EmptyResultSet:
+            pass
+        return qs
+
+    qs, build_durations, build_queries, build_memory = measure(build, repeat)
+
+    def execute():
+        return qs.count(), len(list(qs.order_by('pk')[:page_size]))
+
+    (count, _), execute_durations, execute_queries, execute_memory = measure(execute, repeat)
+    return {
+        'rows': count,
+        'build_seconds': summary(build_durations),
+        'build_queries': build_queries,
+        'execute_seconds': summary(execute_durations),
+        'execute_queries': execute_queries,
+        'peak_memory_bytes': max(build_memory, execute_memory),
+    }
+
+
+def benchmark_object_permission(rest_permissions, model, user, action, object_count, repeat):
+    objects = list(model.objects.order_by('pk')[:object_count])
+    if not objects:
+        return None
+    request = BenchmarkRequest(user, 'GET' if action == 'view' else 'PATCH')
+    view = BenchmarkView(request, action, model)
+    permission = rest_permissions.get_model_permissions(model)()
+
+    def check():
+        return sum(1 for obj in objects if permission.has_object_permission(request, view, obj))
+
+    granted, durations, queries, memory = measure(check, repeat)
+    return {
+        'objects': len(objects),
+        'granted': granted,
+        'seconds_per_object': summary([x / len(objects) for x in durations]),
+        'queries_per_object': queries / len(objects),
+        'peak_memory_bytes': memory,
+    }
+
+
+def run(args):
+    from benchmarks.data import generate
+    from rest_delegated_permissions.cache import permission_existence_cache
+
+    start = time.perf_counter()
+    users = generate(args.rows, seed=args.seed)
+    generate_seconds = time.perf_counter() - start
+    permission_existence_cache.warm()
+
+    configurations = get_configurations()
+    results = []
+    for configuration_name in args.configurations or sorted(configurations):
+        rest_permissions, model = configurations[configuration_name]
+        for mode in args.modes:
+            rest_permissions.compile_filters = MODES[mode]
+            try:
+                for profile in args.profiles or sorted(users):
+                    for action in args.actions:
+                        result = {
+                            'configuration': configuration_name,
+                            'model': model.__name__,
+                            'mode': mode,
+                            'profile': profile,
+                            'action': action,
+                            'queryset': benchmark_queryset(rest_permissions, model, users[profile], action,
+                                                           args.page_size, args.repeat),
+                            'object_permission': benchmark_object_permission(
+                                rest_permissions, model, users[profile], action, args.object_checks, args.repeat),
+                        }
+                        results.append(result)
+                        print('%-30s %-10s %-10s %-7s %10.6fs %10.6fs' % (
+                            configuration_name, mode, profile, action,
+                            result['queryset']['build_seconds']['median'],
+                            result['queryset']['execute_seconds']['median']), file=sys.stderr)
+            finally:
+                rest_permissions.compile_filters = False
+
+    return {
+        'meta': {
+            'rows': args.rows,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'page_size': args.page_size,
+            'object_checks': args.object_checks,
+            'generate_seconds': generate_seconds,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='number of ItemA/ItemE rows (default 10000)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generated data')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of every measurement')
+    parser.add_argument('--page-size', type=int, default=50, help='size of the fetched page')
+    parser.add_argument('--object-checks', type=int, default=20, help='objects checked by has_object_permission')
+    parser.add_argument('--configuration', dest='configurations', action='append',
+                        help='viewset configuration to run (default all), can be repeated')
+    parser.add_argument('--mode', dest='modes', action='append', choices=sorted(MODES),
+                        help='filtering mode (default all), can be repeated')
+    parser.add_argument('--profile', dest='profiles', action='append',
+                        help='user profile (default all), can be repeated')
+    parser.add_argument('--action', dest='actions', action='append', help='action (default view and change)')
+    parser.add_argument('--output', help='file to write the JSON results to (default stdout)')
+    args = parser.parse_args(argv)
+    args.modes = args.modes or sorted(MODES)
+    args.actions = args.actions or ['view', 'change']
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_django()
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
-from .permissions import RestPermissions, DelegatedPermission, BasePermission, kwargs_delegated_object_getter
+from .permissions import RestPermissions, DelegatedPermission, HierarchicalDelegatedPermission, BasePermission, \
+    kwargs_delegated_object_getter
 from . import permissions
 
-__all__ = ('permissions', 'BasePermission', 'RestPermissions', 'DelegatedPermission', 'kwargs_delegated_object_getter')
\ No newline at end of file
+__all__ = ('permissions', 'BasePermission', 'RestPermissions', 'DelegatedPermission', 'HierarchicalDelegatedPermission',
+           'kwargs_delegated_object_getter')
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Process-wide caches used by the permission classes
+"""
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+from .signals import has_pending_changes
+from .versions import default_permission_versions
+
+
+class PermissionExistenceCache:
+    """
+    Cache of (content type id, codename) pairs stored in ``auth_permission``. All the pairs are loaded by a single
+    query on the first use (or when ``warm`` is called, for example from ``AppConfig.ready``) so that permission
+    existence checks do not hit the database in steady state. The cache is dropped after migrations and when
+    a permission is created or deleted, it is then lazily reloaded on the next check.
+    """
+
+    def __init__(self):
+        self.permissions = None
+
+    def warm(self):
+        self.permissions = frozenset(Permission.objects.values_list('content_type_id', 'codename'))
+
+    def clear(self):
+        self.permissions = None
+
+    def exists(self, ct, codename):
+        permissions = self.permissions
+        if permissions is None:
+            self.warm()
+            permissions = self.permissions
+        return (ct.pk, codename) in permissions
+
+
+permission_existence_cache = PermissionExistenceCache()
+
+
+def clear_permission_existence_cache(*args, **kwargs):
+    # permissions are created by auth's post_migrate handler and the order of the handlers is not guaranteed,
+    # so just drop the cache here instead of reloading it
+    permission_existence_cache.clear()
+
+
+post_migrate.connect(clear_permission_existence_cache,
+                     dispatch_uid='rest_delegated_permissions.permission_existence_cache')
+post_save.connect(clear_permission_existence_cache, sender=Permission,
+                  dispatch_uid='rest_delegated_permissions.permission_existence_cache')
+post_delete.connect(clear_permission_existence_cache, sender=Permission,
+                    dispatch_uid='rest_delegated_permissions.permission_existence_cache')
+
+
+class UserPermissionCache:
+    """
+    Cross-request cache of the global (model) permissions of users, stored in django's cache framework. Django's
+    ModelBackend caches the permissions on the user instance only, so with token authentication (a new user
+    instance on every request) the permission and group queries would run on every request.
+
+    The permissions are keyed by user id and the global and per user counters of ``PermissionVersions`` (see
+    ``rest_delegated_permissions.versions``), so a change of the permissions or groups of a user invalidates the
+    permissions of that user only, changes of group permissions invalidate all of them. Changes made without signals
+    (raw SQL, ``queryset.update()``, ...) are picked up after ``timeout`` seconds. Inside a transaction that changed
+    permissions (the counters are bumped on commit) the cache is bypassed. If the permissions are stored in a shared
+    cache, ``PermissionVersions`` stored in a shared cache must be used as well.
+
+    The cache is not used unless passed to ``RestPermissions(user_permission_cache=...)`` (or to
+    ``DjangoCombinedPermission``).
+    """
+
+    def __init__(self, cache_alias=None, timeout=300, key_prefix='rest_delegated_permissions.user_permissions',
+                 permission_versions=None):
+        """
+        :param cache_alias:         alias of the cache in ``settings.CACHES``, if None a process local locmem cache
+                                    is used
+        :param timeout:             timeout of the cached permissions in seconds
+        :param key_prefix:          prefix of the cache keys
+        :param permission_versions: ``PermissionVersions`` whose counters invalidate the cached permissions, defaults
+                                    to the process local one. Must be stored in a shared cache if ``cache_alias``
+                                    is given, other processes would not see the bumps otherwise
+        """
+        if cache_alias is None:
+            self.cache = LocMemCache(key_prefix, {'TIMEOUT': timeout})
+        else:
+            self.cache = caches[cache_alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.permission_versions = permission_versions or default_permission_versions()
+        if cache_alias is not None and not self.permission_versions.shared:
+            raise ImproperlyConfigured('UserPermissionCache stored in a shared cache needs permission_versions stored '
+                                       'in a shared cache as well')
+
+    def get_permissions(self, user):
+        """
+        returns a frozenset of 'app_label.codename' strings of the global permissions of the user
+        """
+        if has_pending_changes():
+            return frozenset(user.get_all_permissions())
+        key = '%s:%s:%s:%s' % (self.key_prefix, self.permission_versions.get_global_version(), user.pk,
+                               self.permission_versions.get_user_version(user.pk))
+        permissions = self.cache.get(key)
+        if permissions is None:
+            permissions = frozenset(user.get_all_permissions())
+            self.cache.set(key, permissions, timeout=self.timeout)
+        return permissions
+
+    def has_perm(self, user, perm):
+        """
+        the same as ``user.has_perm(perm)``, only the permissions are read from the cache
+        """
+        return self.has_perms(user, [perm])
+
+    def has_perms(self, user, perms):
+        """
+        the same as ``user.has_perms(perms)``, only the permissions are read from the cache
+        """
+        if not user.is_active:
+            return False
+        if user.is_superuser:
+            return True
+        if user.pk is None:
+            # anonymous user, nothing to cache
+            return user.has_perms(perms)
+        permissions = self.get_permissions(user)
+        return all(perm in permissions for perm in perms)
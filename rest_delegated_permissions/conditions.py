@@ -0,0 +1,143 @@
+"""
+Conditions reordering their short-circuit evaluation by observed cost and outcome of the branches.
+
+``AdaptiveCondition`` evaluates the same branches as ``rest_condition.Condition`` and returns the same decision, only
+the order in which the branches are tried changes. For ``Or`` every branch records how long it took and how often
+it granted the permission, the branches are then tried by ascending ``average time / grant rate`` - the expected
+cost of reaching the deciding branch is minimal. ``And`` is handled the same way with the deny rate. The branches
+must not have side effects the caller relies on (which holds for permissions).
+
+Enable it by ``RestPermissions(adaptive_ordering=True)``; ``branch_stats()`` shows what has been recorded.
+"""
+import operator
+import threading
+import time
+
+from rest_condition import Condition
+from rest_condition.permissions import _is_permission_factory
+
+
+class BranchStats:
+    """
+    Number of evaluations, total time and number of short-circuiting results of a branch
+    """
+
+    __slots__ = ('calls', 'total_time', 'hits')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.hits = 0
+
+    @property
+    def average_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.calls if self.calls else 0.0
+
+    def rank(self):
+        # expected time spent per decision made by this branch, a branch that never decides goes last.
+        # The smoothing keeps a single unlucky sample from sending a branch to the end
+        return self.average_time / ((self.hits + 1) / (self.calls + 2))
+
+
+class AdaptiveCondition(Condition):
+    """
+    ``Condition`` reordering the evaluation of its branches, see the module documentation. Negated conditions and
+    conditions without short-circuiting are evaluated in the declaration order.
+    """
+
+    # number of evaluations of each branch before the branches are reordered by their statistics
+    min_samples = 20
+
+    # the order is recomputed after this many evaluations of the condition
+    reorder_every = 100
+
+    def __init__(self, *perms_or_conds, **kwargs):
+        super().__init__(*perms_or_conds, **kwargs)
+        self.lock = threading.Lock()
+        # permission method name ('has_permission', 'has_object_permission') => [BranchStats] in declaration order
+        self.stats = {}
+        # permission method name => order of branch indices
+        self.orders = {}
+        self.evaluations = {}
+
+    @property
+    def adaptive(self):
+        return (not self.negated and isinstance(self.lazy_until, bool) and
+                self.reduce_op in (operator.or_, operator.and_) and len(self.perms_or_conds) > 1)
+
+    def _get_order(self, permission_name):
+        order = self.orders.get(permission_name)
+        if order is None:
+            order = self.orders[permission_name] = list(range(len(self.perms_or_conds)))
+            self.stats[permission_name] = [BranchStats() for _ in self.perms_or_conds]
+            self.evaluations[permission_name] = 0
+        return order
+
+    def _reorder(self, permission_name):
+        stats = self.stats[permission_name]
+        # branches without enough samples are tried first so that they get measured
+        self.orders[permission_name] = sorted(
+            range(len(stats)),
+            key=lambda idx: (stats[idx].calls >= self.min_samples, stats[idx].rank() if stats[idx].calls else 0, idx))
+
+    def evaluate_permissions(self, permission_name, *args, **kwargs):
+        if not self.adaptive:
+            return super().evaluate_permissions(permission_name, *args, **kwargs)
+
+        with self.lock:
+            order = self._get_order(permission_name)
+            stats = self.stats[permission_name]
+
+        reduced_result = not self.lazy_until
+        for idx in order:
+            condition = self.perms_or_conds[idx]
+            start = time.perf_counter()
+            if hasattr(condition, 'evaluate_permissions'):
+                result = condition.evaluate_permissions(permission_name, *args, **kwargs)
+            else:
+                if _is_permission_factory(condition):
+                    condition = condition()
+                result = getattr(condition, permission_name)(*args, **kwargs)
+            if result is None:
+                result = False
+            elif callable(result):
+                result = result()
+            elapsed = time.perf_counter() - start
+
+            hit = bool(result) is self.lazy_until
+            with self.lock:
+                branch_stats = stats[idx]
+                branch_stats.calls += 1
+                branch_stats.total_time += elapsed
+                branch_stats.hits += hit
+            if hit:
+                reduced_result = self.lazy_until
+                break
+
+        with self.lock:
+            self.evaluations[permission_name] += 1
+            if self.evaluations[permission_name] % self.reorder_every == 0:
+                self._reorder(permission_name)
+
+        return reduced_result
+
+    def branch_stats(self):
+        """
+        returns {permission method name: [dict of statistics of a branch, in the current evaluation order]}
+        """
+        with self.lock:
+            return {
+                permission_name: [
+                    {
+                        'branch': self.perms_or_conds[idx],
+                        'index': idx,
+                        'calls': stats[idx].calls,
+                        'average_time': stats[idx].average_time,
+                        'hit_rate': stats[idx].hit_rate,
+                    } for idx in self.orders[permission_name]
+                ] for permission_name, stats in self.stats.items()
+            }
@@ -0,0 +1,68 @@
+"""
+Request scoped memoization of permission decisions. The cache is opt-in - it is used only on requests it has been
+attached to, either by ``enable_decision_cache(request)`` or by adding ``DecisionCacheMiddleware`` to settings.
+"""
+
+DECISION_CACHE_ATTRIBUTE = 'rest_permissions_decisions'
+
+
+class DecisionCache:
+    """
+    Permission decisions made while processing a single request
+    """
+
+    def __init__(self):
+        self.decisions = {}
+
+    def get_or_compute(self, key, compute):
+        try:
+            return self.decisions[key]
+        except KeyError:
+            decision = self.decisions[key] = compute()
+            return decision
+
+
+def enable_decision_cache(request):
+    """
+    attaches a new decision cache to the request (either django's HttpRequest or rest framework's Request)
+    """
+    cache = DecisionCache()
+    setattr(request, DECISION_CACHE_ATTRIBUTE, cache)
+    return cache
+
+
+def get_decision_cache(request):
+    cache = getattr(request, DECISION_CACHE_ATTRIBUTE, None)
+    # rest framework's Request proxies unknown attributes to the wrapped HttpRequest, mock requests return anything
+    return cache if isinstance(cache, DecisionCache) else None
+
+
+def cached_object_decision(request, permission, obj, action, compute):
+    """
+    returns the decision of ``permission`` on ``obj`` for the action, calling ``compute()`` only if the decision
+    has not been made yet within the request (or if the request has no decision cache)
+
+    :param request:     the request being processed
+    :param permission:  the object making the decision (permission, condition), part of the key
+    :param obj:         model instance the decision is about
+    :param action:      action being performed
+    :param compute:     callable without arguments returning the decision
+    """
+    cache = get_decision_cache(request)
+    if cache is None or obj is None or obj.pk is None:
+        return compute()
+    key = (id(permission), type(obj), obj.pk, action, getattr(request, 'method', None))
+    return cache.get_or_compute(key, compute)
+
+
+class DecisionCacheMiddleware:
+    """
+    Django middleware attaching a decision cache to every request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        enable_decision_cache(request)
+        return self.get_response(request)
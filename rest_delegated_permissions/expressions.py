@@ -0,0 +1,239 @@
+"""
+Helpers for building ``Q`` objects used when permissions are compiled into a single WHERE clause
+(see ``RestPermissions(compile_filters=True)``).
+"""
+import functools
+import operator
+
+import django
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q, Exists, OuterRef, Expression
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import EmptyQuerySet, QuerySet
+
+# django >= 3.0 can use boolean expressions (Exists) directly in .filter() and Q objects. On older versions
+# the correlated subquery is expressed as an equivalent (uncorrelated) "IN (SELECT ...)" semijoin
+FILTER_ON_EXISTS = django.VERSION >= (3, 0)
+
+# django >= 3.0 does not wrap the right hand side of lookups in parentheses, expressions returning a subquery
+# have to do it themselves (django < 3.0 would wrap them twice, turning "IN ((SELECT ...))" into a scalar subquery)
+WRAP_SUBQUERY_EXPRESSIONS = django.VERSION >= (3, 0)
+
+
+def all_rows_q():
+    """
+    returns a ``Q`` object that matches every row. Note that an empty ``Q()`` can not be used for that as
+    ``Q() | Q(x)`` is simplified by django to ``Q(x)``.
+    """
+    return Q(pk__isnull=False)
+
+
+def no_rows_q():
+    """
+    returns a ``Q`` object that matches no row. Django does not even send the query to the database if the
+    whole filter reduces to this condition.
+    """
+    return Q(pk__in=[])
+
+
+def is_all_rows(q):
+    """
+    returns True if the ``Q`` object was created by ``all_rows_q``
+    """
+    return isinstance(q, Q) and not q.negated and q.children == [('pk__isnull', False)]
+
+
+def is_no_rows(q):
+    """
+    returns True if the ``Q`` object was created by ``no_rows_q``
+    """
+    return isinstance(q, Q) and not q.negated and q.children == [('pk__in', [])]
+
+
+def negate_q(q):
+    """
+    returns the negation of the ``Q`` object, folding ``all_rows_q`` and ``no_rows_q`` into each other
+    """
+    if is_all_rows(q):
+        return no_rows_q()
+    if is_no_rows(q):
+        return all_rows_q()
+    return ~q
+
+
+def exists_q(subquery, inner_field='pk', outer_field='pk'):
+    """
+    returns a ``Q`` object that matches rows whose ``outer_field`` is present in the ``inner_field`` column
+    of the ``subquery``. Neither form duplicates the outer rows, so the result never needs ``distinct()``.
+
+    :param subquery:        queryset of the related model
+    :param inner_field:     field (lookup path) on the subquery model
+    :param outer_field:     field on the filtered model
+    :return:                ``Q`` object compiled to ``EXISTS(...)`` or to ``outer_field IN (SELECT ...)``
+    """
+    if FILTER_ON_EXISTS:
+        return Q(Exists(subquery.filter(**{inner_field: OuterRef(outer_field)})))
+    if inner_field != 'pk':
+        # "x NOT IN (SELECT ...)" is never true if the subquery returns a NULL, so keep the condition usable
+        # inside negated permissions
+        subquery = subquery.filter(**{'%s__isnull' % inner_field: False})
+    return Q(**{'%s__in' % outer_field: subquery.values(inner_field)})
+
+
+def _single_valued_lookup(model_class, lookup):
+    """
+    returns True if the lookup path does not traverse a to-many relation (so a filter on it does not duplicate rows)
+    """
+    for part in lookup.split(LOOKUP_SEP):
+        if part == 'pk':
+            return True
+        try:
+            field = model_class._meta.get_field(part)
+        except FieldDoesNotExist:
+            # a lookup or transform, the path has ended
+            return True
+        if not field.is_relation:
+            return True
+        if field.many_to_many or field.one_to_many:
+            return False
+        model_class = field.related_model
+    return True
+
+
+def prefix_q(q, model_class, path):
+    """
+    rewrites ``Q`` on ``model_class`` to an equivalent ``Q`` on a model pointing to ``model_class`` through
+    the single valued relation ``path`` (for example ``parent`` or ``parent__project``) by prefixing its lookups,
+    so that the condition is evaluated on a join instead of in a subquery.
+
+    Returns None if the condition can not be rewritten - it contains expressions (``Exists``, ``F``, ``OuterRef``)
+    that would be resolved against the wrong model or lookups through to-many relations that would duplicate rows.
+    Querysets used as values (``x__in=queryset``) are not correlated and are kept.
+    """
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            child = prefix_q(child, model_class, path)
+            if child is None:
+                return None
+        elif isinstance(child, tuple) and len(child) == 2:
+            lookup, value = child
+            if hasattr(value, 'resolve_expression') and not isinstance(value, QuerySet):
+                return None
+            if not _single_valued_lookup(model_class, lookup):
+                return None
+            child = ('%s%s%s' % (path, LOOKUP_SEP, lookup), value)
+        else:
+            return None
+        children.append(child)
+    prefixed = Q()
+    prefixed.children = children
+    prefixed.connector = q.connector
+    prefixed.negated = q.negated
+    return prefixed
+
+
+class RecursiveRelation(Expression):
+    """
+    Recursive CTE selecting primary keys reachable through a self referencing foreign key, usable as the right hand
+    side of ``pk__in``. Either the descendants of the rows selected by ``queryset`` (including the rows themselves)
+    or the ancestors of the rows selected by ``queryset`` (with ``ancestors=True``) or of the row ``pk``, excluding
+    the rows themselves.
+
+    Without ``max_depth`` the CTE is a ``UNION`` of the keys and terminates even on cyclic data, with ``max_depth``
+    only the rows at most ``max_depth`` levels away are selected.
+    """
+
+    def __init__(self, model_class, parent_field, queryset=None, pk=None, max_depth=None, ancestors=False):
+        """
+        :param model_class:     the model with the self referencing foreign key
+        :param parent_field:    name of the foreign key
+        :param queryset:        queryset of ``model_class`` whose rows and their descendants are selected
+        :param pk:              primary key of the row whose ancestors are selected, if ``queryset`` is None
+        :param max_depth:       maximum number of levels, None for unlimited
+        :param ancestors:       select the ancestors of the rows selected by ``queryset`` instead of descendants
+        """
+        super().__init__(output_field=model_class._meta.pk)
+        self.model_class = model_class
+        self.parent_column = model_class._meta.get_field(parent_field).column
+        self.queryset = queryset
+        self.pk = pk
+        self.max_depth = max_depth
+        self.ancestors = ancestors or queryset is None
+
+    def as_sql(self, compiler, connection):
+        qn = connection.ops.quote_name
+        table = qn(self.model_class._meta.db_table)
+        pk_column = qn(self.model_class._meta.pk.column)
+        parent_column = qn(self.parent_column)
+        depth = self.max_depth is not None
+        params = []
+        if self.queryset is not None:
+            base_sql, base_params = self.queryset.values('pk').query.get_compiler(connection=connection).as_sql()
+            params.extend(base_params)
+        if not self.ancestors:
+            start = 'SELECT base.%s%s FROM (%s) base' % (pk_column, ', 0' if depth else '', base_sql)
+            step = 'SELECT t.%s%s FROM %s t INNER JOIN rdp_related r ON t.%s = r.node_id' % (
+                pk_column, ', r.depth + 1' if depth else '', table, parent_column)
+            step_conditions = []
+        else:
+            if self.queryset is not None:
+                start_condition = '%s IN (%s)' % (pk_column, base_sql)
+            else:
+                params.append(self.pk)
+                start_condition = '%s = %%s' % pk_column
+            start = 'SELECT %s%s FROM %s WHERE %s AND %s IS NOT NULL' % (
+                parent_column, ', 1' if depth else '', table, start_condition, parent_column)
+            step = 'SELECT t.%s%s FROM %s t INNER JOIN rdp_related r ON t.%s = r.node_id' % (
+                parent_column, ', r.depth + 1' if depth else '', table, pk_column)
+            step_conditions = ['t.%s IS NOT NULL' % parent_column]
+        if depth:
+            step_conditions.append('r.depth < %s')
+            params.append(self.max_depth)
+        if step_conditions:
+            step += ' WHERE ' + ' AND '.join(step_conditions)
+        sql = 'WITH RECURSIVE rdp_related(node_id%s) AS (%s UNION %s) SELECT node_id FROM rdp_related' % (
+            ', depth' if depth else '', start, step)
+        if WRAP_SUBQUERY_EXPRESSIONS:
+            sql = '(%s)' % sql
+        return sql, params
+
+
+def needs_distinct(queryset):
+    """
+    returns True if the queryset might return a row more than once - if it joins a to-many relation (reverse
+    foreign key, many to many). Joins of forward foreign keys and one to one relations and conditions in subqueries
+    (``IN``, ``EXISTS``) never duplicate rows.
+    """
+    for join in queryset.query.alias_map.values():
+        join_field = getattr(join, 'join_field', None)
+        if join_field is None:
+            # the base table
+            continue
+        if getattr(join_field, 'one_to_one', False):
+            continue
+        if getattr(join_field, 'concrete', False) and getattr(join_field, 'many_to_one', False):
+            continue
+        return True
+    return False
+
+
+def distinct_if_needed(queryset):
+    """
+    returns ``queryset.distinct()`` if the queryset might return duplicate rows (see ``needs_distinct``),
+    the queryset itself otherwise
+    """
+    return queryset.distinct() if needs_distinct(queryset) else queryset
+
+
+def querysets_to_q(querysets):
+    """
+    converts a sequence of querysets on the same model into a ``Q`` object matching rows present in any of them.
+    Used as a fallback for permissions that provide only ``filter()`` generator.
+    """
+    conditions = [
+        Q(pk__in=qs.values('pk')) for qs in querysets if not isinstance(qs, EmptyQuerySet)
+    ]
+    if not conditions:
+        return no_rows_q()
+    return functools.reduce(operator.or_, conditions)
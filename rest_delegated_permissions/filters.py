@@ -0,0 +1,61 @@
+"""
+Django rest framework filter backend applying the permissions registered in ``RestPermissions``.
+
+Unlike ``RestPermissions.apply()``, which replaces ``get_queryset`` with an already filtered queryset, the backend
+runs as a step of ``filter_backends`` (list it last) - the permissions are compiled into a single ``Q`` (see
+``RestPermissions.get_filter_q``) that is added to the WHERE clause of the queryset produced by the other backends
+(search, ordering, django-filter), without ``DISTINCT`` and annotations, so the database plans all the conditions
+together.
+
+Only querysets passed through ``filter_queryset()`` of the view are restricted - DRF does that for list actions and
+in ``get_object``. ``get_queryset()`` itself returns all the rows, so custom ``@action`` methods (and any other code)
+must use ``self.filter_queryset(self.get_queryset())``, not ``self.get_queryset()``, or they expose rows the user
+is not allowed to see.
+"""
+from rest_framework.filters import BaseFilterBackend
+
+from .expressions import is_all_rows, is_no_rows, distinct_if_needed
+
+
+class DelegatedPermissionFilterBackend(BaseFilterBackend):
+    """
+    Filters the queryset by the permissions of ``rest_permissions`` (set on a subclass, see
+    ``RestPermissions.filter_backend()``, or on the view as ``rest_permissions``)
+    """
+
+    rest_permissions = None
+
+    # if True, the queryset is filtered by the action being performed (see ``RestPermissions.viewset_actions``)
+    # instead of always using 'view'
+    filter_by_action = False
+
+    # if True, detail requests select related the foreign keys the object permissions delegate through
+    select_related_delegations = False
+
+    def get_rest_permissions(self, view):
+        rest_permissions = getattr(view, 'rest_permissions', None) or self.rest_permissions
+        if rest_permissions is None:
+            raise AttributeError('%s needs rest_permissions set on the backend or on the view' % type(self).__name__)
+        return rest_permissions
+
+    def get_action(self, rest_permissions, view):
+        return rest_permissions.get_viewset_action(view.action) if self.filter_by_action else 'view'
+
+    def filter_queryset(self, request, queryset, view):
+        rest_permissions = self.get_rest_permissions(view)
+        model_class = queryset.model
+        action = self.get_action(rest_permissions, view)
+
+        q = None
+        if rest_permissions.pk_set_cache is not None:
+            q = rest_permissions.pk_set_cache.get_filter_q(rest_permissions, model_class, request.user, action)
+        if q is None:
+            q = rest_permissions.get_filter_q(model_class, request.user, action, queryset)
+
+        if is_no_rows(q):
+            return queryset.none()
+        if not is_all_rows(q):
+            queryset = distinct_if_needed(queryset.filter(q))
+        if self.select_related_delegations and rest_permissions.is_detail_request(view):
+            queryset = rest_permissions.select_delegated_related(queryset)
+        return queryset
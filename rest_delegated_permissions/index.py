@@ -0,0 +1,489 @@
+"""
+In-process index of guardian object permissions. The index maps (content type, permission, object pk) to users and
+groups holding the permission and users to their groups, so that object permission checks and filters of small
+tables are answered without a query.
+
+The index is opt-in: create ``ObjectPermissionIndex`` and pass it to ``RestPermissions(object_permission_index=...)``
+(or to ``DjangoCombinedPermission``). It is loaded on the first use (or explicitly by ``load()``, for example from
+``AppConfig.ready``) and then updated incrementally from guardian model signals of the same process, when the
+transaction making the change commits (inside the transaction all checks fall back to the database). Changes that
+do not send signals (``bulk_create``, ``queryset.update()``, raw SQL) and changes made by other processes (other
+workers of the same deployment) are not seen until the index is reloaded - it is reloaded on the first use after
+``max_age`` seconds since the last load, or explicitly by ``reload()``. Keep ``max_age`` short (or do not use
+the index) if a revoked object permission must stop working in all processes immediately.
+
+Pairs of integers are kept in sorted parallel ``array('q')`` - 16 bytes per pair plus a second copy sorted the other
+way round for reverse lookups. Only models with integer primary keys (the field types ``PkSetCache`` supports) are
+indexed, content types of other models are answered from the database. If the number of indexed pairs exceeds ``max_entries`` the index switches itself off (all checks
+fall back to the database) and logs a warning, see ``stats()``.
+"""
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+import weakref
+from array import array
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from guardian.models import UserObjectPermissionBase
+
+from .object_permissions import _through_fields
+from .pksets import has_integer_pk
+from .signals import LazyReceivers, object_permission_models, on_commit, has_pending_changes
+
+log = logging.getLogger(__file__)
+
+
+class PairArray:
+    """
+    Sorted set of (a, b) integer pairs stored in two parallel arrays. Pairs added later are kept in a side dict
+    and merged into the arrays in a single pass once there are ``merge_threshold`` of them, so that a bulk of
+    grants does not insert into the arrays one by one. Removing a pair moves the tail of the arrays.
+    """
+
+    merge_threshold = 1024
+
+    def __init__(self, pairs=()):
+        pairs = sorted(set(pairs))
+        self.first = array('q', (x[0] for x in pairs))
+        self.second = array('q', (x[1] for x in pairs))
+        # a => set of b, pairs added since the last merge
+        self.added = {}
+        self.added_count = 0
+
+    def __len__(self):
+        return len(self.first) + self.added_count
+
+    def _range(self, a):
+        return bisect.bisect_left(self.first, a), bisect.bisect_right(self.first, a)
+
+    def _find(self, a, b):
+        lo, hi = self._range(a)
+        idx = bisect.bisect_left(self.second, b, lo, hi)
+        return idx, idx < hi and self.second[idx] == b
+
+    def add(self, a, b):
+        if (a, b) in self:
+            return False
+        self.added.setdefault(a, set()).add(b)
+        self.added_count += 1
+        if self.added_count >= self.merge_threshold:
+            self._merge()
+        return True
+
+    def remove(self, a, b):
+        added = self.added.get(a)
+        if added is not None and b in added:
+            added.remove(b)
+            if not added:
+                del self.added[a]
+            self.added_count -= 1
+            return True
+        idx, found = self._find(a, b)
+        if found:
+            del self.first[idx]
+            del self.second[idx]
+        return found
+
+    def _merge(self):
+        added = sorted((a, b) for a, values in self.added.items() for b in values)
+        pairs = list(heapq.merge(zip(self.first, self.second), added))
+        self.first = array('q', (x[0] for x in pairs))
+        self.second = array('q', (x[1] for x in pairs))
+        self.added = {}
+        self.added_count = 0
+
+    def __contains__(self, pair):
+        a, b = pair
+        return self._find(a, b)[1] or b in self.added.get(a, ())
+
+    def get(self, a):
+        """
+        returns sorted array of b values paired with a
+        """
+        lo, hi = self._range(a)
+        values = self.second[lo:hi]
+        added = self.added.get(a)
+        if added:
+            values = array('q', sorted(itertools.chain(values, added)))
+        return values
+
+    @property
+    def nbytes(self):
+        return self.first.itemsize * (len(self.first) + len(self.second) + 2 * self.added_count)
+
+
+class PrincipalPermissions:
+    """
+    Object permissions of users or groups for a single permission: (object pk, principal id) pairs indexed both ways
+    """
+
+    def __init__(self, pairs=()):
+        pairs = list(pairs)
+        self.by_object = PairArray(pairs)
+        self.by_principal = PairArray((principal, obj) for obj, principal in pairs)
+
+    def add(self, obj, principal):
+        self.by_principal.add(principal, obj)
+        return self.by_object.add(obj, principal)
+
+    def remove(self, obj, principal):
+        self.by_principal.remove(principal, obj)
+        return self.by_object.remove(obj, principal)
+
+    def __len__(self):
+        return len(self.by_object)
+
+    @property
+    def nbytes(self):
+        return self.by_object.nbytes + self.by_principal.nbytes
+
+
+class ObjectPermissionIndex:
+    """
+    In-process index of guardian user and group object permissions, see the module documentation
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, max_entries=1000000, max_age=300):
+        """
+        :param max_entries: maximum number of indexed (object, principal) and (user, group) pairs. Grants made
+                            after the load are buffered and merged in batches (see ``PairArray``), but each
+                            revocation moves the tail of two arrays of its permission - O(n) under the index lock
+        :param max_age:     number of seconds after which the index is reloaded from the database to pick up
+                            changes made by other processes or without signals, None to never reload
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.loaded_at = None
+        self.overflow = False
+        self._reset()
+        ObjectPermissionIndex.instances.add(self)
+        connect_signals()
+
+    def _reset(self):
+        # permission id => (content type id, codename)
+        self.permissions = {}
+        # (content type id, codename, 'user' or 'group') => PrincipalPermissions
+        self.tables = {}
+        # (user id, group id) pairs
+        self.user_groups = PairArray()
+        # content types with non integer object primary keys (or stale ones), not indexed
+        self.unsupported_content_types = set()
+        # content types whose primary key type has been checked
+        self.checked_content_types = set()
+        self.entries = 0
+
+    def load(self):
+        connect_signals()
+        with self.lock:
+            self.loaded_at = time.monotonic()
+            self._reset()
+            self.overflow = False
+            self._load_permissions()
+            rows = {}
+            for model_class, kind, object_field in object_permission_models():
+                principal_field = 'user_id' if kind == 'user' else 'group_id'
+                for permission_id, object_pk, principal in model_class.objects.values_list(
+                        'permission_id', object_field, principal_field).iterator():
+                    ct_id, codename = self.permissions[permission_id]
+                    if ct_id in self.unsupported_content_types:
+                        continue
+                    object_pk = self._parse_pk(ct_id, object_pk)
+                    if object_pk is None:
+                        continue
+                    rows.setdefault((ct_id, codename, kind), []).append((object_pk, principal))
+                    self.entries += 1
+                    if self.entries > self.max_entries:
+                        self._overflow()
+                        return
+
+            for key, pairs in rows.items():
+                if key[0] not in self.unsupported_content_types:
+                    self.tables[key] = PrincipalPermissions(pairs)
+
+            through, user_field, group_field = _through_fields(get_user_model().groups)
+            self.user_groups = PairArray(through.objects.values_list(user_field, group_field).iterator())
+            self.entries = sum(len(x) for x in self.tables.values()) + len(self.user_groups)
+            if self.entries > self.max_entries:
+                self._overflow()
+                return
+            self.loaded = True
+
+    def _load_permissions(self):
+        self.permissions = {
+            pk: (ct_id, codename)
+            for pk, ct_id, codename in Permission.objects.values_list('pk', 'content_type_id', 'codename')
+        }
+        ct_ids = {x[0] for x in self.permissions.values()} - self.checked_content_types
+        for ct in ContentType.objects.filter(pk__in=ct_ids):
+            model_class = ct.model_class()
+            if model_class is None or not has_integer_pk(model_class):
+                self.unsupported_content_types.add(ct.pk)
+        self.checked_content_types.update(ct_ids)
+
+    def _parse_pk(self, ct_id, object_pk):
+        """
+        returns the integer object primary key or None if the content type is not indexed. Generic permission rows
+        with other strings than the canonical integer ('042', ' 42') do not match the object in the database,
+        the content type is not indexed then
+        """
+        if ct_id in self.unsupported_content_types:
+            return None
+        if isinstance(object_pk, int):
+            return object_pk
+        try:
+            value = int(object_pk)
+        except ValueError:
+            value = None
+        if value is None or str(value) != object_pk:
+            self.unsupported_content_types.add(ct_id)
+            return None
+        return value
+
+    def reload(self):
+        self.load()
+
+    def invalidate(self):
+        """
+        drops the index, it is reloaded on the next use (unless it has been switched off because of its size)
+        """
+        with self.lock:
+            if self.overflow:
+                return
+            self.loaded = False
+            self._reset()
+
+    def _overflow(self):
+        log.warning('Object permission index exceeded %s entries and was disabled, object permissions are checked '
+                    'in the database', self.max_entries)
+        self._reset()
+        self.overflow = True
+        self.loaded = True
+
+    def _expired(self):
+        return self.max_age is not None and not self.overflow and time.monotonic() - self.loaded_at > self.max_age
+
+    def _ensure_loaded(self):
+        if not self.loaded or self._expired():
+            self.load()
+        return not self.overflow
+
+    def _can_answer(self, user, ct):
+        if has_pending_changes():
+            # the changes made by the transaction are applied on commit
+            return False
+        return self._ensure_loaded() and ct.pk not in self.unsupported_content_types and user.pk is not None
+
+    def _group_ids(self, user):
+        return self.user_groups.get(user.pk)
+
+    def has_object_permission(self, user, obj, ct, codenames):
+        """
+        returns True if the user has all the object permissions on the object (directly or via a group), False
+        if not and None if the index can not decide (not loaded because of the size limit, anonymous user, ...)
+
+        :param user:        user for which the check is made
+        :param obj:         model instance
+        :param ct:          content type of the object
+        :param codenames:   codenames of the permissions, without app label
+        """
+        if not user.is_authenticated:
+            # guardian's anonymous user is looked up in the database
+            return None
+        if not user.is_active:
+            return False
+        if user.is_superuser:
+            return True
+        try:
+            object_pk = int(obj.pk)
+        except (TypeError, ValueError):
+            return None
+        with self.lock:
+            if not self._can_answer(user, ct):
+                return None
+            group_ids = self._group_ids(user)
+            for codename in codenames:
+                users = self.tables.get((ct.pk, codename, 'user'))
+                if users is not None and (object_pk, user.pk) in users.by_object:
+                    continue
+                groups = self.tables.get((ct.pk, codename, 'group'))
+                if groups is not None and any((object_pk, group_id) in groups.by_object for group_id in group_ids):
+                    continue
+                return False
+            return True
+
+    def get_object_pks(self, user, ct, codename):
+        """
+        returns sorted list of primary keys of objects the user has the object permission on (directly or via
+        a group), None if the index can not decide
+        """
+        if not user.is_authenticated:
+            return None
+        with self.lock:
+            if not self._can_answer(user, ct):
+                return None
+            pks = set()
+            users = self.tables.get((ct.pk, codename, 'user'))
+            if users is not None:
+                pks.update(users.by_principal.get(user.pk))
+            groups = self.tables.get((ct.pk, codename, 'group'))
+            if groups is not None:
+                for group_id in self._group_ids(user):
+                    pks.update(groups.by_principal.get(group_id))
+            return sorted(pks)
+
+    def memory_usage(self):
+        """
+        returns approximate size of the indexed data in bytes
+        """
+        with self.lock:
+            return sum(x.nbytes for x in self.tables.values()) + self.user_groups.nbytes
+
+    def stats(self):
+        with self.lock:
+            return {
+                'loaded': self.loaded,
+                'overflow': self.overflow,
+                'entries': self.entries,
+                'max_entries': self.max_entries,
+                'memory_bytes': self.memory_usage(),
+                'unsupported_content_types': sorted(self.unsupported_content_types),
+            }
+
+    # incremental updates
+
+    def _add_entries(self, count):
+        self.entries += count
+        if self.entries > self.max_entries:
+            self._overflow()
+
+    def object_permission_added(self, kind, permission_id, object_pk, principal):
+        with self.lock:
+            if not self.loaded or self.overflow:
+                return
+            if permission_id not in self.permissions:
+                # created after the index was loaded
+                self._load_permissions()
+            ct_id, codename = self.permissions[permission_id]
+            object_pk = self._parse_pk(ct_id, object_pk)
+            if object_pk is None:
+                return
+            table = self.tables.setdefault((ct_id, codename, kind), PrincipalPermissions())
+            if table.add(object_pk, principal):
+                self._add_entries(1)
+
+    def object_permission_removed(self, kind, permission_id, object_pk, principal):
+        with self.lock:
+            if not self.loaded or self.overflow or permission_id not in self.permissions:
+                return
+            ct_id, codename = self.permissions[permission_id]
+            table = self.tables.get((ct_id, codename, kind))
+            object_pk = self._parse_pk(ct_id, object_pk)
+            if table is None or object_pk is None:
+                return
+            if table.remove(object_pk, principal):
+                self.entries -= 1
+
+    def user_groups_changed(self, pairs, added):
+        with self.lock:
+            if not self.loaded or self.overflow:
+                return
+            for user_id, group_id in pairs:
+                if added:
+                    if self.user_groups.add(user_id, group_id):
+                        self._add_entries(1)
+                        if self.overflow:
+                            return
+                elif self.user_groups.remove(user_id, group_id):
+                    self.entries -= 1
+
+
+# The receivers change the indices after the transaction commits (see ``signals.on_commit``), rolled back changes
+# are never applied. The values are read from the instance when the signal is sent.
+
+def _object_permission_saved(sender, instance, created, using, raw=False, **kwargs):
+    kind = 'user' if issubclass(sender, UserObjectPermissionBase) else 'group'
+    if created and not raw:
+        on_commit(using, _object_permission_added, kind, instance.permission_id, _object_pk(sender, instance),
+                  _principal(kind, instance))
+    else:
+        # the old values are not known
+        on_commit(using, _invalidate_indices)
+
+
+def _object_permission_deleted(sender, instance, using, **kwargs):
+    kind = 'user' if issubclass(sender, UserObjectPermissionBase) else 'group'
+    on_commit(using, _object_permission_removed, kind, instance.permission_id, _object_pk(sender, instance),
+              _principal(kind, instance))
+
+
+def _object_permission_added(*args):
+    for index in list(ObjectPermissionIndex.instances):
+        index.object_permission_added(*args)
+
+
+def _object_permission_removed(*args):
+    for index in list(ObjectPermissionIndex.instances):
+        index.object_permission_removed(*args)
+
+
+def _object_pk(sender, instance):
+    return instance.object_pk if sender.objects.is_generic() else instance.content_object_id
+
+
+def _principal(kind, instance):
+    return instance.user_id if kind == 'user' else instance.group_id
+
+
+def _user_groups_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        on_commit(using, _invalidate_indices)
+    elif reverse:
+        on_commit(using, _user_groups_updated, [(user_id, instance.pk) for user_id in pk_set], action == 'post_add')
+    else:
+        on_commit(using, _user_groups_updated, [(instance.pk, group_id) for group_id in pk_set], action == 'post_add')
+
+
+def _user_groups_updated(pairs, added):
+    for index in list(ObjectPermissionIndex.instances):
+        index.user_groups_changed(pairs, added)
+
+
+def _invalidate_indices():
+    for index in list(ObjectPermissionIndex.instances):
+        index.invalidate()
+
+
+def _invalidate_indices_on_delete(sender, using, **kwargs):
+    # deletes cascade to the group memberships without m2m_changed and ids might be reused
+    on_commit(using, _invalidate_indices)
+
+
+def _connect_receivers():
+    # update the indices
+    for model_class, kind, object_field in object_permission_models():
+        dispatch_uid = 'rest_delegated_permissions.index.%s' % model_class._meta.label_lower
+        post_save.connect(_object_permission_saved, sender=model_class, dispatch_uid=dispatch_uid)
+        post_delete.connect(_object_permission_deleted, sender=model_class, dispatch_uid=dispatch_uid)
+    user_model = get_user_model()
+    m2m_changed.connect(_user_groups_changed, sender=user_model.groups.through,
+                        dispatch_uid='rest_delegated_permissions.index.groups')
+    post_delete.connect(_invalidate_indices_on_delete, sender=user_model,
+                        dispatch_uid='rest_delegated_permissions.index.user')
+    post_delete.connect(_invalidate_indices_on_delete, sender=Group,
+                        dispatch_uid='rest_delegated_permissions.index.group')
+
+
+receivers = LazyReceivers(_connect_receivers)
+connect_signals = receivers.connect
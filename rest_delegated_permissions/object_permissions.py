@@ -0,0 +1,262 @@
+"""
+Queries over django auth and django-guardian permission tables
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models import Q, CharField, Exists, OuterRef, QuerySet
+from django.db.models.functions import Cast
+from guardian.shortcuts import get_objects_for_user
+from guardian.conf import settings as guardian_settings
+from guardian.ctypes import get_content_type
+from guardian.utils import get_user_obj_perms_model, get_group_obj_perms_model, get_anonymous_user
+
+from .expressions import FILTER_ON_EXISTS, no_rows_q
+
+
+def _through_fields(m2m_descriptor):
+    """
+    returns (through model, name of the fk to the source model, name of the fk to the target model)
+    """
+    field = m2m_descriptor.field
+    return field.remote_field.through, field.m2m_field_name(), field.m2m_reverse_field_name()
+
+
+def group_users_q(groups_qs):
+    """
+    returns ``Q`` on the user model matching members of the groups
+    """
+    through, user_field, group_field = _through_fields(get_user_model().groups)
+    return Q(pk__in=through.objects.filter(**{'%s__in' % group_field: groups_qs}).values(user_field))
+
+
+def users_with_model_permission_q(ct, codename):
+    """
+    returns ``Q`` on the user model matching users that have the global (model) permission, either directly,
+    via a group or by being a superuser. Whether the user is active is not checked here.
+    """
+    user_model = get_user_model()
+    through, user_field, permission_field = _through_fields(user_model.user_permissions)
+    user_permissions = through.objects.filter(**{
+        '%s__content_type' % permission_field: ct,
+        '%s__codename' % permission_field: codename
+    })
+    group_through, group_field, group_permission_field = _through_fields(Group.permissions)
+    group_permissions = group_through.objects.filter(**{
+        '%s__content_type' % group_permission_field: ct,
+        '%s__codename' % group_permission_field: codename
+    })
+    return Q(is_superuser=True) | \
+        Q(pk__in=user_permissions.values(user_field)) | \
+        group_users_q(group_permissions.values(group_field))
+
+
+def _object_permissions(obj_perms_model, ct, codenames, objects):
+    """
+    returns queryset of guardian object permissions with the codename(s) on the objects
+
+    :param obj_perms_model: guardian's user or group object permission model
+    :param ct:              content type of the objects
+    :param codenames:       a codename or a set of codenames (without app label)
+    :param objects:         queryset of the objects or a single model instance
+    """
+    if isinstance(codenames, str):
+        codenames = [codenames]
+    obj_perms = obj_perms_model.objects.filter(permission__content_type=ct, permission__codename__in=codenames)
+    if obj_perms_model.objects.is_generic():
+        obj_perms = obj_perms.filter(content_type=ct)
+        if isinstance(objects, QuerySet):
+            return obj_perms.filter(object_pk__in=objects.annotate(
+                object_pk_str=Cast('pk', output_field=CharField())).values('object_pk_str'))
+        return obj_perms.filter(object_pk=str(objects.pk))
+    if isinstance(objects, QuerySet):
+        return obj_perms.filter(content_object__in=objects.values('pk'))
+    return obj_perms.filter(content_object=objects.pk)
+
+
+def users_with_object_permission_q(ct, codename, objects_qs):
+    """
+    returns ``Q`` on the user model matching users that have a guardian object permission (directly or via
+    a group) on at least one of the objects.
+
+    :param ct:          content type of the objects
+    :param codename:    codename of the permission, without app label
+    :param objects_qs:  queryset of the objects
+    """
+    model_class = objects_qs.model
+    user_permissions = _object_permissions(get_user_obj_perms_model(model_class), ct, codename, objects_qs)
+    group_permissions = _object_permissions(get_group_obj_perms_model(model_class), ct, codename, objects_qs)
+    return Q(pk__in=user_permissions.values('user')) | group_users_q(group_permissions.values('group'))
+
+
+def _concrete_field(model_class, field_name):
+    """
+    returns the field holding the value of ``field_name`` in the database (the target field for foreign keys)
+    """
+    field = model_class._meta.pk if field_name == 'pk' else model_class._meta.get_field(field_name)
+    while field.is_relation:
+        field = field.target_field
+    return field
+
+
+def _correlated_object_permissions_q(obj_perms_model, obj_perms, model_class, outer_field):
+    """
+    returns ``Q`` on ``model_class`` matching rows whose ``outer_field`` is referenced by ``obj_perms``
+    (a queryset on guardian's user or group object permission model)
+    """
+    if obj_perms_model.objects.is_generic():
+        # object_pk is a varchar - compare it with the outer value cast to string so that the index
+        # on the permission table is usable, or cast object_pk to the type of the outer field in the semijoin
+        if FILTER_ON_EXISTS:
+            return Q(Exists(obj_perms.filter(object_pk=Cast(OuterRef(outer_field), output_field=CharField()))))
+        return Q(**{'%s__in' % outer_field: obj_perms.annotate(
+            typed_object_pk=Cast('object_pk', output_field=_concrete_field(model_class, outer_field))
+        ).values('typed_object_pk')})
+    if FILTER_ON_EXISTS:
+        return Q(Exists(obj_perms.filter(content_object=OuterRef(outer_field))))
+    return Q(**{'%s__in' % outer_field: obj_perms.values('content_object')})
+
+
+def has_direct_object_permissions(model_class):
+    """
+    returns True if guardian stores object permissions of the model (of users, groups or both) in a table
+    with a direct foreign key to the model (``UserObjectPermissionBase``/``GroupObjectPermissionBase`` subclass)
+    instead of the generic ``object_pk`` table
+    """
+    return not get_user_obj_perms_model(model_class).objects.is_generic() or \
+        not get_group_obj_perms_model(model_class).objects.is_generic()
+
+
+def user_has_object_permissions(user, obj, codenames):
+    """
+    returns True if the user has all the guardian object permissions on the object, with the same semantics as
+    guardian's ``ObjectPermissionChecker`` (inactive users have no permissions, superusers have all, anonymous
+    users are checked as guardian's anonymous user). Unlike the checker it does not load all the permissions
+    of the object, only the required ones are looked up in a single query.
+
+    :param user:        user for which the check is made
+    :param obj:         model instance
+    :param codenames:   codenames of the permissions, without app label
+    """
+    codenames = set(codenames)
+    if not codenames:
+        return True
+    if not user.is_authenticated:
+        if guardian_settings.ANONYMOUS_USER_NAME is None:
+            return False
+        user = get_anonymous_user()
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+
+    model_class = type(obj)
+    ct = get_content_type(obj)
+    user_perms_model = get_user_obj_perms_model(model_class)
+    group_perms_model = get_group_obj_perms_model(model_class)
+    user_perms = _object_permissions(user_perms_model, ct, codenames, obj).filter(user=user)
+    group_perms = _object_permissions(group_perms_model, ct, codenames, obj).filter(**{
+        'group__%s' % get_user_model().groups.field.related_query_name(): user
+    })
+    granted = Permission.objects.filter(content_type=ct, codename__in=codenames).filter(
+        Q(pk__in=user_perms.values('permission')) | Q(pk__in=group_perms.values('permission')))
+    return granted.count() == len(codenames)
+
+
+def objects_with_object_permission_q(model_class, ct, codename, user, outer_field='pk'):
+    """
+    returns ``Q`` on ``model_class`` matching objects on which the user has a guardian object permission, either
+    directly or via a group. The permission tables are queried by correlated ``EXISTS`` subqueries
+    (``IN (SELECT ...)`` on django < 3.0), both generic (``object_pk``) and direct foreign key tables are supported.
+    Global permissions and superusers are not handled here.
+
+    :param model_class: model being filtered
+    :param ct:          content type of the model
+    :param codename:    codename of the permission, without app label
+    :param user:        user for which the check is made
+    :param outer_field: field of ``model_class`` referenced by the object permissions
+    """
+    if user.is_anonymous:
+        if guardian_settings.ANONYMOUS_USER_NAME is None:
+            return no_rows_q()
+        user = get_anonymous_user()
+
+    user_perms_model = get_user_obj_perms_model(model_class)
+    user_perms = user_perms_model.objects.filter(
+        user=user, permission__content_type=ct, permission__codename=codename)
+
+    group_perms_model = get_group_obj_perms_model(model_class)
+    group_perms = group_perms_model.objects.filter(**{
+        'group__%s' % get_user_model().groups.field.related_query_name(): user,
+        'permission__content_type': ct,
+        'permission__codename': codename
+    })
+    if user_perms_model.objects.is_generic():
+        user_perms = user_perms.filter(content_type=ct)
+    if group_perms_model.objects.is_generic():
+        group_perms = group_perms.filter(content_type=ct)
+
+    return _correlated_object_permissions_q(user_perms_model, user_perms, model_class, outer_field) | \
+        _correlated_object_permissions_q(group_perms_model, group_perms, model_class, outer_field)
+
+
+class GuardianShortcutsBackend:
+    """
+    Filters objects by guardian object permissions using ``guardian.shortcuts.get_objects_for_user``. Guardian
+    evaluates the permission tables eagerly and filters the queryset by the list of primary keys. Models with
+    direct foreign key permission tables are filtered by typed subqueries instead, see
+    ``objects_with_object_permission_q``.
+    """
+
+    def filter(self, qs, user, ct, codename):
+        if has_direct_object_permissions(qs.model):
+            return qs.filter(objects_with_object_permission_q(qs.model, ct, codename, user))
+        return get_objects_for_user(user, [codename], qs)
+
+    def get_filter_q(self, qs, user, ct, codename):
+        if has_direct_object_permissions(qs.model):
+            return objects_with_object_permission_q(qs.model, ct, codename, user)
+        return Q(pk__in=self.filter(qs, user, ct, codename).values('pk'))
+
+
+class GuardianExistsBackend:
+    """
+    Filters objects by guardian object permissions using correlated subqueries against the permission tables,
+    see ``objects_with_object_permission_q``. Nothing is evaluated before the filtered queryset itself.
+    """
+
+    def filter(self, qs, user, ct, codename):
+        return qs.filter(self.get_filter_q(qs, user, ct, codename))
+
+    def get_filter_q(self, qs, user, ct, codename):
+        return objects_with_object_permission_q(qs.model, ct, codename, user)
+
+
+class GuardianIndexBackend:
+    """
+    Filters objects by guardian object permissions read from ``ObjectPermissionIndex`` - the permission tables
+    are not queried, the queryset is filtered by the list of primary keys. Falls back to ``fallback_backend`` if the
+    index can not decide or if the list is longer than ``max_params``.
+    """
+
+    def __init__(self, index, fallback_backend=None, max_params=500):
+        self.index = index
+        self.fallback_backend = fallback_backend or GuardianExistsBackend()
+        self.max_params = max_params
+
+    def _pks(self, qs, user, ct, codename):
+        pks = self.index.get_object_pks(user, ct, codename)
+        if pks is None or len(pks) > self.max_params:
+            return None
+        return pks
+
+    def filter(self, qs, user, ct, codename):
+        pks = self._pks(qs, user, ct, codename)
+        if pks is None:
+            return self.fallback_backend.filter(qs, user, ct, codename)
+        return qs.filter(pk__in=pks)
+
+    def get_filter_q(self, qs, user, ct, codename):
+        pks = self._pks(qs, user, ct, codename)
+        if pks is None:
+            return self.fallback_backend.get_filter_q(qs, user, ct, codename)
+        return Q(pk__in=pks)
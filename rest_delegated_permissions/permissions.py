@@ -1,17 +1,31 @@
 import functools
+import hashlib
 import inspect
 import logging
 import operator
+import threading
 from abc import abstractmethod
 
-from django.contrib.auth.models import Permission
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Exists, OuterRef, Value, ExpressionWrapper, BooleanField
-from django.db.models.query import EmptyQuerySet
-from guardian.shortcuts import get_objects_for_user
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Exists, OuterRef, Value, ExpressionWrapper, BooleanField, Q, Case, When, Prefetch
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import EmptyQuerySet, ModelIterable
 from rest_condition import Condition
 from rest_framework import permissions
 
+from .cache import permission_existence_cache
+from .conditions import AdaptiveCondition
+from .decisions import cached_object_decision
+from .expressions import all_rows_q, no_rows_q, is_all_rows, is_no_rows, negate_q, querysets_to_q, exists_q, \
+    distinct_if_needed, RecursiveRelation
+from .filters import DelegatedPermissionFilterBackend
+from .object_permissions import users_with_model_permission_q, users_with_object_permission_q, \
+    GuardianShortcutsBackend, GuardianIndexBackend, has_direct_object_permissions, user_has_object_permissions
+from .plans import EmptyPlan, ConditionPlan, NotPlan, PermissionPlan, DelegatedPlan
+from .versions import default_permission_versions, track_model, track_m2m
+
 log = logging.getLogger(__file__)
 
 
@@ -66,16 +80,61 @@ class BasePermission(permissions.BasePermission):
         that needs to put the exists query into an annotation and later filter on that annotation. As we need to
         have all the querysets returning the same columns (otherwise django silently ignores some of the querysets),
         we need to wrap all the querysets with an extra ``__extra_condition`` annotation defaulting to ``True``.
+
+        If RestPermissions is created with ``annotate_conditions=False``, no permission annotates the querysets
+        and those returned with ``returns__extra_condition`` are moved into a ``pk IN (...)`` subquery.
         """
         returns_extra_condition = getattr(self, 'returns__extra_condition', False)
+        annotate_conditions = getattr(rest_permissions, 'annotate_conditions', True)
         # because of filtering on delegated field which requires OuterRef we need to add
         # an extra annotation. If the implementor of the BasePermission does not supply
         # it, just add a True.
-        for qs in self.filter(rest_permissions, qs, user, action):
-            if returns_extra_condition:
-                yield qs
+        for filtered_qs in self.filter(rest_permissions, qs, user, action):
+            if not annotate_conditions:
+                if returns_extra_condition and not isinstance(filtered_qs, EmptyQuerySet):
+                    # the annotation stays inside the subquery
+                    yield qs.filter(pk__in=filtered_qs.values('pk'))
+                else:
+                    yield filtered_qs
+            elif returns_extra_condition:
+                yield filtered_qs
             else:
-                yield qs.annotate(__extra_condition=ExpressionWrapper(Value(True), output_field=BooleanField()))
+                yield filtered_qs.annotate(
+                    __extra_condition=ExpressionWrapper(Value(True), output_field=BooleanField()))
+
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        """
+        returns a ``Q`` object selecting the rows of ``qs`` the user has access to. Used instead of
+        ``get_queryset_filters`` when RestPermissions is created with ``compile_filters=True`` - then the whole
+        permission tree is compiled into a single WHERE clause, without annotations. ``distinct()`` is added only if
+        the condition joins a to-many relation (for example ``Q(items__name=...)``), prefer subqueries for these.
+
+        The default implementation wraps the querysets returned by ``filter`` into ``pk IN (...)`` conditions.
+        Override it if the permission can be expressed as a plain condition on the model, for example
+        ``Q(owner=user)``.
+        """
+        return querysets_to_q(self.filter(rest_permissions, qs, user, action))
+
+    def get_filter_plan(self, rest_permissions, model_class, action):
+        """
+        returns a ``FilterPlan`` for the given model and action. Plans are cached by RestPermissions, so anything
+        that does not depend on the user should be resolved here. The default plan calls ``get_filter_q``.
+        """
+        return PermissionPlan(self, action)
+
+    @abstractmethod
+    def get_users_q(self, rest_permissions, objects_qs, action, single_object=False):
+        """
+        returns a ``Q`` object on the user model selecting users that have the permission to perform the action
+        on at least one of the objects. Used by ``RestPermissions.get_users_with_permission``, which raises
+        ``NotImplementedError`` for permissions that do not implement it.
+
+        :param rest_permissions:    An instance of RestPermissions class, giving the "permission context"
+        :param objects_qs:          queryset of the objects being checked
+        :param action:              view, change, delete
+        :param single_object:       True if ``objects_qs`` is known to contain at most one object
+        """
+        return no_rows_q()
 
 
 class DelegatedPermission(BasePermission):
@@ -94,29 +153,47 @@ class DelegatedPermission(BasePermission):
             return self.rest_permissions.create_queryset_factory(self.model_class)(self.request.user, self.action)
 
     def __init__(self, rest_permissions, *delegated_fields, mapping=None, delegated_objects_getter=None,
-                 allowed_safe_actions=('get', 'list')):
+                 allowed_safe_actions=('get', 'list'), query_object_checks=False):
         """
 
         :param rest_permissions:
         :param delegated_fields:
         :param mapping: either a string (all actions will be mapped to this string), dict or
-                        callable taking an action and returning mapped action name
+                        callable taking an action and returning mapped action name. Dict keys are viewset actions
+                        ('update', 'destroy', ...) - when a queryset is filtered by 'view', 'change' or 'delete'
+                        (see ``RestPermissions.apply(filter_by_action=True)``), the viewset actions standing for it
+                        are mapped instead and must map to the same action, ``ImproperlyConfigured`` is raised
+                        otherwise. Standard viewset actions missing in the dict are delegated unchanged, other
+                        missing actions raise ``ImproperlyConfigured``.
         :param delegated_objects_getter:
         :param allowed_safe_actions:  If set, these actions will be granted initial access for the processing.
                                       Later filtering is then used for estimating if user has permissions.
+        :param query_object_checks:   If set, object permissions delegated through one-to-many and many-to-many
+                                      fields are decided by a single ``EXISTS`` query on the related model's
+                                      filtered queryset instead of loading all the related objects and checking
+                                      them one by one. Not used together with ``delegated_objects_getter``.
         """
         self.rest_permissions = rest_permissions
         self.delegated_fields = delegated_fields
         self.mapping = mapping
         self.delegated_objects_getter = delegated_objects_getter
         self.allowed_safe_actions = allowed_safe_actions
+        self.query_object_checks = query_object_checks
 
     def has_object_permission(self, request, view, obj):
-        return self._internal_has_permission(request, view, obj)
+        return cached_object_decision(request, self, obj, getattr(view, 'action', None),
+                                      lambda: self._internal_has_permission(request, view, obj))
 
     def _internal_has_permission(self, request, view, obj):
+        if obj is not None and self.query_object_checks and not self.delegated_objects_getter:
+            return self._query_has_permission(request, view, obj)
+
         getter = self.delegated_objects_getter or DelegatedPermission.get_delegated_objects
-        for delegated_obj in getter(request, view, obj, self.delegated_fields):
+        return self._delegated_objects_have_permission(request, view,
+                                                       getter(request, view, obj, self.delegated_fields))
+
+    def _delegated_objects_have_permission(self, request, view, delegated_objects):
+        for delegated_obj in delegated_objects:
             if not delegated_obj:
                 continue
             delegated_permissions = self.rest_permissions.permissions_for_model(delegated_obj)
@@ -124,7 +201,25 @@ class DelegatedPermission(BasePermission):
             delegated_view = DelegatedPermission.DelegatedView(
                 self.rest_permissions, type(delegated_obj), request, delegated_action)
 
-            if delegated_permissions.has_object_permission(request, delegated_view, delegated_obj):
+            if cached_object_decision(
+                    request, delegated_permissions, delegated_obj, delegated_action,
+                    lambda: delegated_permissions.has_object_permission(request, delegated_view, delegated_obj)):
+                return True
+        return False
+
+    def _query_has_permission(self, request, view, obj):
+        delegated_action = self._get_delegated_action(view.action)
+        for delegated_field_name in self.delegated_fields:
+            fld = obj._meta.get_field(delegated_field_name)
+            if fld.one_to_many or fld.many_to_many:
+                outer_field, inner_field = DelegatedPermission.get_relation_fields(fld)
+                related_qs = self.rest_permissions.create_queryset_factory(fld.related_model)(
+                    request.user, delegated_action)
+                if related_qs.filter(**{inner_field: getattr(obj, outer_field)}).exists():
+                    return True
+            elif self._delegated_objects_have_permission(
+                    request, view,
+                    DelegatedPermission.get_delegated_objects(request, view, obj, (delegated_field_name,))):
                 return True
         return False
 
@@ -139,10 +234,31 @@ class DelegatedPermission(BasePermission):
                 return self.mapping(action)
             if isinstance(self.mapping, str):
                 action = self.mapping
-            else:
+            elif action in self.mapping:
                 action = self.mapping[action]
+            else:
+                action = self._map_queryset_action(action)
         return action
 
+    def _map_queryset_action(self, action):
+        # querysets are filtered by 'view', 'change' or 'delete' (see RestPermissions.viewset_actions) while dict
+        # mappings are keyed by viewset actions - the viewset actions standing for the queryset action must all map
+        # to the same action, which is then translated back. Standard viewset actions missing in the dict are
+        # delegated unchanged.
+        viewset_actions = self.rest_permissions.viewset_actions
+        standing_for = sorted(x for x, queryset_action in viewset_actions.items() if queryset_action == action)
+        if not standing_for:
+            if action in viewset_actions:
+                return action
+            raise ImproperlyConfigured('Action mapping of DelegatedPermission(%s) has no entry for action %r' % (
+                ', '.join(self.delegated_fields), action))
+        mapped = {viewset_actions.get(x, x) for x in (self.mapping.get(y, y) for y in standing_for)}
+        if len(mapped) > 1:
+            raise ImproperlyConfigured(
+                'Action mapping of DelegatedPermission(%s) maps %s to different actions, add an entry for %r' % (
+                    ', '.join(self.delegated_fields), ', '.join(standing_for), action))
+        return mapped.pop()
+
     @staticmethod
     def get_delegated_objects(request, view, obj, field_names):
         if not obj:
@@ -165,12 +281,153 @@ class DelegatedPermission(BasePermission):
             related_model_qs = \
                 rest_permissions.create_queryset_factory(related_model)(user, self._get_delegated_action(action))
 
+            if not rest_permissions.annotate_conditions:
+                yield qs.filter(exists_q(related_model_qs, 'pk', delegated_field_name))
+                continue
+
             filtered_qs = \
                 qs.annotate(
                     __extra_condition=Exists(related_model_qs.filter(pk=OuterRef(delegated_field_name)))).filter(
                     __extra_condition=True)
             yield filtered_qs
 
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        return self.get_filter_plan(rest_permissions, qs.model, action).bind(rest_permissions, qs, user)
+
+    def get_filter_plan(self, rest_permissions, model_class, action):
+        delegated_action = self._get_delegated_action(action)
+        subplans = []
+        for delegated_field_name in self.delegated_fields:
+            fld = model_class._meta.get_field(delegated_field_name)
+            outer_field, inner_field = DelegatedPermission.get_relation_fields(fld)
+            forward_key = fld.concrete and (fld.many_to_one or fld.one_to_one)
+            subplans.append(DelegatedPlan(fld.related_model, delegated_action, outer_field, inner_field,
+                                          forward_key=forward_key, null=fld.null))
+        return ConditionPlan(operator.or_, subplans)
+
+    def get_users_q(self, rest_permissions, objects_qs, action, single_object=False):
+        delegated_action = self._get_delegated_action(action)
+        conditions = []
+        for delegated_field_name in self.delegated_fields:
+            fld = objects_qs.model._meta.get_field(delegated_field_name)
+            outer_field, inner_field = DelegatedPermission.get_relation_fields(fld)
+            related_qs = rest_permissions.get_base_queryset(fld.related_model).filter(**{
+                '%s__in' % inner_field: objects_qs.values(outer_field)
+            })
+            conditions.append(rest_permissions.get_users_q(
+                fld.related_model, related_qs, delegated_action,
+                single_object=single_object and not (fld.one_to_many or fld.many_to_many)))
+        if not conditions:
+            return no_rows_q()
+        return functools.reduce(operator.or_, conditions)
+
+    @staticmethod
+    def get_relation_fields(fld):
+        """
+        returns a tuple (outer_field, inner_field) - an object is delegated to the related object if
+        ``obj.<outer_field> == related_obj.<inner_field>``
+
+        :param fld: the delegated field (forward or reverse relation)
+        """
+        if fld.concrete and (fld.many_to_one or fld.one_to_one):
+            # forward foreign key - compare the column directly, no join is needed
+            return fld.name, fld.target_field.name
+        if fld.concrete:
+            # forward m2m, the related model sees it under its related query name
+            return 'pk', fld.related_query_name()
+        # reverse relation - the relation is represented by a field on the related model
+        return fld.field.target_field.name, fld.field.name
+
+
+class HierarchicalDelegatedPermission(BasePermission):
+    """
+    Delegates permissions within a tree of objects linked by a self referencing foreign key (folders, categories,
+    ...): the user has the permission on an object if any of its ancestors is granted by the other permissions
+    registered for the model.
+
+    Querysets are filtered by a recursive CTE selecting the descendants of the granted objects, an object check
+    walks the ancestors of the object in a single query, users having the permission are looked up through the
+    ancestors of the objects. All of them follow at most ``max_depth`` levels.
+    """
+
+    def __init__(self, rest_permissions, parent_field='parent', max_depth=32, allowed_safe_actions=('get', 'list')):
+        """
+
+        :param rest_permissions:
+        :param parent_field:            name of the self referencing foreign key
+        :param max_depth:               maximum number of levels between the object and the granted ancestor.
+                                        Bounds the work of the recursive CTE on deep or corrupted trees, None for
+                                        unlimited (the CTE then stops only when no new rows are found)
+        :param allowed_safe_actions:    see ``DelegatedPermission``
+        """
+        self.rest_permissions = rest_permissions
+        self.parent_field = parent_field
+        self.max_depth = max_depth
+        self.allowed_safe_actions = allowed_safe_actions
+        # set while the other permissions of the model are evaluated, the nested evaluation of this permission
+        # then grants nothing instead of recursing
+        self._local = threading.local()
+
+    def _granted_by_other_permissions(self, compute):
+        if getattr(self._local, 'active', False):
+            return None
+        self._local.active = True
+        try:
+            return compute()
+        finally:
+            self._local.active = False
+
+    def has_object_permission(self, request, view, obj):
+        return cached_object_decision(request, self, obj, getattr(view, 'action', None),
+                                      lambda: self._ancestors_have_permission(request, view, obj))
+
+    def _ancestors_have_permission(self, request, view, obj):
+        if obj is None or getattr(obj, obj._meta.get_field(self.parent_field).attname) is None:
+            return False
+        model_class = type(obj)
+        granted_q = self._granted_by_other_permissions(
+            lambda: self.rest_permissions.get_filter_q(model_class, request.user, view.action))
+        if granted_q is None or is_no_rows(granted_q):
+            return False
+        ancestors = self.rest_permissions.get_base_queryset(model_class).filter(
+            pk__in=RecursiveRelation(model_class, self.parent_field, pk=obj.pk, max_depth=self.max_depth))
+        if not is_all_rows(granted_q):
+            ancestors = ancestors.filter(granted_q)
+        return ancestors.exists()
+
+    def has_permission(self, request, view):
+        return view.action in self.allowed_safe_actions
+
+    def filter(self, rest_permissions, filtered_queryset, user, action):
+        model_class = filtered_queryset.model
+        # not through create_queryset_factory - a cache of accessible keys would store the partial result
+        granted = self._granted_by_other_permissions(
+            lambda: rest_permissions.filter_queryset(
+                model_class, rest_permissions.get_base_queryset(model_class), user, action))
+        if granted is not None and not isinstance(granted, EmptyQuerySet):
+            yield filtered_queryset.filter(pk__in=RecursiveRelation(
+                model_class, self.parent_field, queryset=granted, max_depth=self.max_depth))
+
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        model_class = qs.model
+        granted_q = self._granted_by_other_permissions(
+            lambda: rest_permissions.get_filter_q(model_class, user, action))
+        if granted_q is None or is_no_rows(granted_q):
+            return no_rows_q()
+        if is_all_rows(granted_q):
+            return all_rows_q()
+        granted = rest_permissions.get_base_queryset(model_class).filter(granted_q)
+        return Q(pk__in=RecursiveRelation(model_class, self.parent_field, queryset=granted,
+                                          max_depth=self.max_depth))
+
+    def get_users_q(self, rest_permissions, objects_qs, action, single_object=False):
+        model_class = objects_qs.model
+        ancestors = rest_permissions.get_base_queryset(model_class).filter(pk__in=RecursiveRelation(
+            model_class, self.parent_field, queryset=objects_qs, max_depth=self.max_depth, ancestors=True))
+        users_q = self._granted_by_other_permissions(
+            lambda: rest_permissions.get_users_q(model_class, ancestors, action))
+        return no_rows_q() if users_q is None else users_q
+
 
 def kwargs_delegated_object_getter(field_name_to_kwarg_name_map,
                                    instantiator=lambda clazz, value, fldname: clazz.objects.get(pk=value)):
@@ -192,6 +449,26 @@ class RestrictedViewDjangoModelPermissions(permissions.DjangoModelPermissions):
     perms_map['OPTIONS'] = ['%(app_label)s.view_%(model_name)s']
     perms_map['HEAD'] = ['%(app_label)s.view_%(model_name)s']
 
+    def __init__(self, user_permission_cache=None):
+        """
+        :param user_permission_cache:   ``UserPermissionCache`` the permissions of users are read from, if None
+                                        ``user.has_perms`` is called
+        """
+        self.user_permission_cache = user_permission_cache
+
+    def has_permission(self, request, view):
+        if self.user_permission_cache is None:
+            return super().has_permission(request, view)
+
+        # the same as DjangoModelPermissions.has_permission, only the permissions are read from the cache
+        if getattr(view, '_ignore_model_permissions', False):
+            return True
+        if not request.user or (not request.user.is_authenticated and self.authenticated_users_only):
+            return False
+        queryset = self._queryset(view)
+        perms = self.get_required_permissions(request.method, queryset.model)
+        return self.user_permission_cache.has_perms(request.user, perms)
+
 
 class RestrictedViewDjangoObjectPermissions(permissions.DjangoObjectPermissions):
     perms_map = {}
@@ -200,40 +477,103 @@ class RestrictedViewDjangoObjectPermissions(permissions.DjangoObjectPermissions)
     perms_map['OPTIONS'] = ['%(app_label)s.view_%(model_name)s']
     perms_map['HEAD'] = ['%(app_label)s.view_%(model_name)s']
 
+    def __init__(self, object_permission_index=None):
+        """
+        :param object_permission_index: ``ObjectPermissionIndex`` answering the checks without a query whenever
+                                        it can
+        """
+        self.object_permission_index = object_permission_index
+
     def has_object_permission(self, request, view, obj):
         queryset = self._queryset(view)
         model_cls = queryset.model
         user = request.user
         perms = self.get_required_object_permissions(request.method, model_cls)
+        if self.object_permission_index is not None:
+            decision = self.object_permission_index.has_object_permission(
+                user, obj, ContentType.objects.get_for_model(model_cls), [perm.split('.', 1)[-1] for perm in perms])
+            if decision is not None:
+                return decision
+        if has_direct_object_permissions(model_cls):
+            # guardian's checker would load all the permissions of the object, query just the required ones
+            return user_has_object_permissions(user, obj, [perm.split('.', 1)[-1] for perm in perms])
         return user.has_perms(perms, obj)
 
 
 class DjangoCombinedPermission:
 
-    def __init__(self):
-        self.model_permissions = RestrictedViewDjangoModelPermissions()
-        self.object_permissions = RestrictedViewDjangoObjectPermissions()
+    def __init__(self, object_permission_backend=None, user_permission_cache=None, object_permission_index=None):
+        """
+        :param object_permission_backend:   filters querysets by guardian object permissions, an instance of
+                                            ``GuardianShortcutsBackend``, ``GuardianExistsBackend`` or
+                                            ``GuardianIndexBackend``. Defaults to ``GuardianIndexBackend`` if
+                                            ``object_permission_index`` is set, ``GuardianShortcutsBackend`` otherwise
+        :param user_permission_cache:       ``UserPermissionCache`` global permissions of users are read from,
+                                            if None ``user.has_perm`` is called
+        :param object_permission_index:     ``ObjectPermissionIndex`` answering object permission checks
+        """
+        if object_permission_backend is None:
+            if object_permission_index is not None:
+                object_permission_backend = GuardianIndexBackend(object_permission_index)
+            else:
+                object_permission_backend = GuardianShortcutsBackend()
+        self.object_permission_backend = object_permission_backend
+        self.user_permission_cache = user_permission_cache
+        self.model_permissions = RestrictedViewDjangoModelPermissions(user_permission_cache=user_permission_cache)
+        self.object_permissions = RestrictedViewDjangoObjectPermissions(object_permission_index=object_permission_index)
 
     def has_object_permission(self, request, view, obj):
-        return self.model_permissions.has_permission(request, view) or \
-               self.object_permissions.has_object_permission(request, view, obj)
+        return cached_object_decision(
+            request, self, obj, getattr(view, 'action', None),
+            lambda: self.model_permissions.has_permission(request, view) or
+                    self.object_permissions.has_object_permission(request, view, obj))
+
+    known_operations = {'retrieve': 'view', 'view': 'view', 'update': 'change', 'change': 'change',
+                        'delete': 'delete',
+                        'destroy': 'delete', 'partial_update': 'change'}
+
+    def get_permission_name(self, ct, action):
+        operation = self.known_operations.get(action, action)
+        return '%s_%s' % (operation, ct.model)
 
     def get_queryset_filters(self, rest_permissions, qs, user, action):
-        known_operations = {'retrieve': 'view', 'view': 'view', 'update': 'change', 'change': 'change',
-                            'delete': 'delete',
-                            'destroy': 'delete', 'partial_update': 'change'}
-        operation = known_operations.get(action, action)
         ct = ContentType.objects.get_for_model(qs.model)
-        perm = '%s_%s' % (operation, ct.model)
+        perm = self.get_permission_name(ct, action)
 
         if DjangoCombinedPermission.check_permission_exists(ct, perm):
-            if user.has_perm(perm):
-                yield qs.annotate(__extra_condition=ExpressionWrapper(Value(True), output_field=BooleanField()))
+            if self.has_model_permission(user, ct, perm):
+                granted_qs = qs
             else:
                 # add queryset for guardian
-                guardian_qs = get_objects_for_user(user, [perm], qs) \
-                    .annotate(__extra_condition=ExpressionWrapper(Value(True), output_field=BooleanField()))
-                yield guardian_qs
+                granted_qs = self.object_permission_backend.filter(qs, user, ct, perm)
+            if rest_permissions.annotate_conditions:
+                granted_qs = granted_qs.annotate(
+                    __extra_condition=ExpressionWrapper(Value(True), output_field=BooleanField()))
+            yield granted_qs
+
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        ct = ContentType.objects.get_for_model(qs.model)
+        perm = self.get_permission_name(ct, action)
+
+        if not DjangoCombinedPermission.check_permission_exists(ct, perm):
+            return no_rows_q()
+        if self.has_model_permission(user, ct, perm):
+            return all_rows_q()
+        return self.object_permission_backend.get_filter_q(qs, user, ct, perm)
+
+    def has_model_permission(self, user, ct, perm):
+        perm = '%s.%s' % (ct.app_label, perm)
+        if self.user_permission_cache is not None:
+            return self.user_permission_cache.has_perm(user, perm)
+        return user.has_perm(perm)
+
+    def get_users_q(self, rest_permissions, objects_qs, action, single_object=False):
+        ct = ContentType.objects.get_for_model(objects_qs.model)
+        perm = self.get_permission_name(ct, action)
+
+        if not DjangoCombinedPermission.check_permission_exists(ct, perm):
+            return no_rows_q()
+        return users_with_model_permission_q(ct, perm) | users_with_object_permission_q(ct, perm, objects_qs)
 
     def has_permission(self, request, view):
         # let it pass, filter() method will handle rest apart of "create" which has to be dealt with in the code
@@ -241,16 +581,80 @@ class DjangoCombinedPermission:
 
     @staticmethod
     def check_permission_exists(ct, perm_name):
-        return Permission.objects.filter(content_type=ct, codename=perm_name).exists()
+        return permission_existence_cache.exists(ct, perm_name)
 
 
 class RestPermissions:
+    # viewset action => action used for filtering the viewset's queryset when apply(filter_by_action=True)
+    viewset_actions = {
+        'list': 'view',
+        'retrieve': 'view',
+        'update': 'change',
+        'partial_update': 'change',
+        'destroy': 'delete',
+    }
+
     def __init__(self, default_queryset_factory=lambda model: model.objects.all(),
                  initial_permissions=None,
-                 add_django_permissions=False):
+                 add_django_permissions=False,
+                 compile_filters=False,
+                 object_permission_backend=None,
+                 user_permission_cache=None,
+                 permission_versions=None,
+                 pk_set_cache=None,
+                 object_permission_index=None,
+                 adaptive_ordering=False,
+                 annotate_conditions=True):
+        """
+
+        :param default_queryset_factory:    lambda model => queryset used as a base for filtering
+        :param initial_permissions:         dictionary model_class => permission(s), see ``update_permissions``
+        :param add_django_permissions:      if True, DjangoCombinedPermission is implicitly added to all models
+        :param compile_filters:             if True, querysets are filtered by a single WHERE clause compiled from
+                                            the whole permission tree (see ``get_filter_q``) instead of combining
+                                            partial querysets via "|". In both cases ``distinct()`` is called only
+                                            if the filter joins a to-many relation, see ``needs_distinct``
+        :param object_permission_backend:   backend of the implicitly added DjangoCombinedPermission, see its
+                                            constructor
+        :param user_permission_cache:       ``UserPermissionCache`` of the implicitly added DjangoCombinedPermission
+        :param permission_versions:         ``PermissionVersions`` used by ``get_permission_version``, defaults
+                                            to a process local one. If given (or if ``pk_set_cache`` is given),
+                                            saves and deletes of the registered models are tracked from the start,
+                                            otherwise only after the first ``get_permission_version`` call
+        :param pk_set_cache:                ``PkSetCache`` - if set, querysets are filtered by cached sets
+                                            of accessible primary keys, see ``rest_delegated_permissions.pksets``.
+                                            If the sets are stored in a shared cache, ``permission_versions`` must
+                                            be stored in a shared cache as well
+        :param object_permission_index:     ``ObjectPermissionIndex`` of the implicitly added
+                                            DjangoCombinedPermission, see ``rest_delegated_permissions.index``
+        :param adaptive_ordering:           if True, permissions of a model are checked in the order given by their
+                                            observed cost and grant rate instead of the declaration order, see
+                                            ``rest_delegated_permissions.conditions``. The decisions do not change.
+        :param annotate_conditions:         if False, the partial querysets combined when ``compile_filters`` is not
+                                            set are filtered without the ``__extra_condition`` annotation - delegated
+                                            permissions use ``EXISTS`` (``IN`` on django < 3.0) directly in WHERE, so
+                                            the subqueries are not repeated in the SELECT clause
+        """
         self.default_queryset_factory = default_queryset_factory
         self.add_django_permissions = add_django_permissions
+        self.compile_filters = compile_filters
+        self.object_permission_backend = object_permission_backend
+        self.user_permission_cache = user_permission_cache
+        if pk_set_cache is not None and pk_set_cache.shared and not getattr(permission_versions, 'shared', False):
+            raise ImproperlyConfigured('pk_set_cache stored in a shared cache needs permission_versions stored in '
+                                       'a shared cache as well')
+        self.permission_versions = permission_versions
+        self.pk_set_cache = pk_set_cache
+        self.object_permission_index = object_permission_index
+        self.adaptive_ordering = adaptive_ordering
+        self.annotate_conditions = annotate_conditions
         self.model_permission_map = {}
+        # (model_class, action) => FilterPlan, see get_filter_plan
+        self.filter_plans = {}
+        # model_class => select_related paths, see get_delegated_select_related
+        self.select_related_paths = {}
+        # models whose dependencies are tracked for get_permission_version
+        self.tracked_models = set()
         if initial_permissions:
             self.update_permissions(initial_permissions)
 
@@ -267,10 +671,172 @@ class RestPermissions:
 
         if self.add_django_permissions and force_add_django_permissions is None or force_add_django_permissions:
             perms = list(model_permissions)
-            perms.insert(0, DjangoCombinedPermission())
+            perms.insert(0, DjangoCombinedPermission(object_permission_backend=self.object_permission_backend,
+                                                     user_permission_cache=self.user_permission_cache,
+                                                     object_permission_index=self.object_permission_index))
         else:
             perms = model_permissions
-        self.model_permission_map[model_class] = Condition.Or(*perms)
+        condition_class = AdaptiveCondition if self.adaptive_ordering else Condition
+        self.model_permission_map[model_class] = condition_class.Or(*perms)
+        # plans of other models might delegate to this one, so drop them all
+        self.filter_plans.clear()
+        self.select_related_paths.clear()
+        self.tracked_models.clear()
+        if self.permission_versions is not None or self.pk_set_cache is not None:
+            # the receivers disable fast deletes of the models, so they are connected only if the versions are used
+            self._track_model_versions(model_class)
+
+    @staticmethod
+    def _non_negated(condition):
+        """
+        returns a copy of the negated ``Condition`` without the negation
+        """
+        return Condition(*condition.perms_or_conds, reduce_op=condition.reduce_op, lazy_until=condition.lazy_until)
+
+    @staticmethod
+    def _iter_permissions(perm):
+        """
+        yields the leaf permissions of a Condition tree
+        """
+        if isinstance(perm, Condition):
+            for subperm in perm.perms_or_conds:
+                yield from RestPermissions._iter_permissions(subperm)
+        else:
+            yield perm
+
+    def _iter_delegated_fields(self, model_class):
+        """
+        yields (DelegatedPermission, field) for all fields the permissions of the model delegate through
+        """
+        for perm in self._iter_permissions(self.model_permission_map[model_class]):
+            if isinstance(perm, DelegatedPermission):
+                for delegated_field_name in perm.delegated_fields:
+                    yield perm, model_class._meta.get_field(delegated_field_name)
+
+    def get_delegated_select_related(self, model_class, max_depth=5):
+        """
+        returns the paths (``parent``, ``parent__item_c``, ...) of forward foreign keys the object permissions
+        of the model delegate through, transitively. Loading an object with ``select_related(*paths)`` lets
+        the delegated object checks run on the already loaded instances instead of fetching each parent.
+
+        :param model_class: the model whose object permissions are checked
+        :param max_depth:   maximum length of a path
+        """
+        paths = self.select_related_paths.get(model_class)
+        if paths is None:
+            paths = self.select_related_paths[model_class] = sorted(
+                self._delegated_foreign_key_paths(self, model_class, '', {model_class}, max_depth))
+        return paths
+
+    def select_delegated_related(self, qs):
+        """
+        returns the queryset with ``select_related`` of the paths returned by ``get_delegated_select_related``.
+        Paths through fields deferred by ``only()`` or ``defer()`` can not be selected and are skipped, querysets
+        not returning model instances (``values()``, ...) are returned unchanged.
+        """
+        if qs._iterable_class is not ModelIterable:
+            return qs
+        paths = [x for x in self.get_delegated_select_related(qs.model)
+                 if not self._is_deferred_path(qs.query.deferred_loading, x)]
+        if not paths:
+            return qs
+        return qs.select_related(*paths)
+
+    @staticmethod
+    def _is_deferred_path(deferred_loading, path):
+        field_names, defer = deferred_loading
+        prefix = ''
+        for hop in path.split(LOOKUP_SEP):
+            if defer:
+                if prefix + hop in field_names:
+                    return True
+            else:
+                # only() - if some fields of this level are listed, the others are deferred
+                loaded = {x[len(prefix):].split(LOOKUP_SEP)[0] for x in field_names if x.startswith(prefix)}
+                if loaded and hop not in loaded:
+                    return True
+            prefix += hop + LOOKUP_SEP
+        return False
+
+    @staticmethod
+    def _delegated_foreign_key_paths(rest_permissions, model_class, prefix, visited, max_depth):
+        if max_depth <= 0 or model_class not in rest_permissions.model_permission_map:
+            return
+        for perm, fld in rest_permissions._iter_delegated_fields(model_class):
+            if perm.delegated_objects_getter or not fld.concrete or not (fld.many_to_one or fld.one_to_one):
+                continue
+            if fld.related_model in visited:
+                # delegation cycle
+                continue
+            path = prefix + fld.name
+            yield path
+            yield from RestPermissions._delegated_foreign_key_paths(
+                perm.rest_permissions, fld.related_model, path + '__', visited | {fld.related_model}, max_depth - 1)
+
+    def _track_model_versions(self, model_class):
+        # bump the model version when the model, a related model or a many to many relation used for delegation
+        # changes, see get_permission_version
+        track_model(model_class)
+        for perm, fld in self._iter_delegated_fields(model_class):
+            track_model(fld.related_model)
+            if fld.many_to_many:
+                track_m2m(fld.remote_field.through if fld.concrete else fld.through)
+
+    def _track_dependent_models(self, model_class):
+        # starts tracking the versions of all the models the permissions of model_class depend on
+        if model_class in self.tracked_models:
+            return
+        visited = {model_class}
+        pending = [(self, model_class)]
+        while pending:
+            rest_permissions, current_model = pending.pop()
+            if current_model not in rest_permissions.model_permission_map:
+                track_model(current_model)
+                continue
+            rest_permissions._track_model_versions(current_model)
+            for perm, fld in rest_permissions._iter_delegated_fields(current_model):
+                if fld.related_model not in visited:
+                    visited.add(fld.related_model)
+                    pending.append((perm.rest_permissions, fld.related_model))
+        self.tracked_models.add(model_class)
+
+    def get_dependent_models(self, model_class):
+        """
+        returns the set of models whose data the permissions of ``model_class`` depend on - the model itself
+        and all the models it (transitively) delegates to
+        """
+        models = {model_class}
+        pending = [(self, model_class)]
+        while pending:
+            rest_permissions, current_model = pending.pop()
+            if current_model not in rest_permissions.model_permission_map:
+                continue
+            for perm, fld in rest_permissions._iter_delegated_fields(current_model):
+                if fld.related_model not in models:
+                    models.add(fld.related_model)
+                    pending.append((perm.rest_permissions, fld.related_model))
+        return models
+
+    def get_permission_version(self, model_class, user=None):
+        """
+        Returns a token that changes whenever the result of filtering ``model_class`` for the user might change -
+        when permissions of the user, group permissions, guardian object permissions or any instance of the models
+        the permissions depend on (see ``get_dependent_models``) change. Use it in cache keys of results computed
+        from the permissions or in ETags. The token changes when the transaction making the change commits, do not
+        cache results computed while ``rest_delegated_permissions.signals.has_pending_changes()`` is True.
+
+        :param model_class: the model being filtered
+        :param user:        the user, if None the token covers the models and global changes only
+        :return:            string token
+        """
+        self._track_dependent_models(model_class)
+        versions = self.permission_versions or default_permission_versions()
+        parts = ['g%s' % versions.get_global_version()]
+        if user is not None and user.pk is not None:
+            parts.append('u%s:%s' % (user.pk, versions.get_user_version(user.pk)))
+        for dependent_model in sorted(self.get_dependent_models(model_class), key=lambda x: x._meta.label_lower):
+            parts.append('%s:%s' % (dependent_model._meta.label_lower, versions.get_model_version(dependent_model)))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
 
     def filtered_model_queryset(self, model_class, root_queryset, user, action):
         perms = self.model_permission_map[model_class].perms_or_conds
@@ -290,7 +856,22 @@ class RestPermissions:
         """
         if isinstance(perm, Condition):
             if perm.negated:
-                log.error('Negated subcondition is not implemented in .queryset(), expect narrower results')
+                if perm.reduce_op not in (operator.or_, operator.and_):
+                    log.error('Subconditions are not implemented in .queryset(), expect narrower results')
+                    return
+                if not perm.perms_or_conds:
+                    # rest_condition denies an empty condition even if negated
+                    return
+                # rows of the root queryset not granted by the non negated condition
+                granted_querysets = [
+                    x for x in self._permission_to_queryset(self._non_negated(perm), root_queryset, user, action)
+                    if not isinstance(x, EmptyQuerySet)
+                ]
+                if granted_querysets:
+                    yield root_queryset.exclude(
+                        pk__in=functools.reduce(operator.or_, granted_querysets).values('pk'))
+                else:
+                    yield root_queryset
             elif perm.reduce_op == operator.or_:
                 for subperm in perm.perms_or_conds:
                     yield from self._permission_to_queryset(subperm, root_queryset, user, action)
@@ -317,6 +898,113 @@ class RestPermissions:
             # (faster for cases where user is assigned rights directly)
             yield from perm.get_queryset_filters(self, root_queryset, user, action)
 
+    def get_filter_q(self, model_class, user, action, root_queryset=None):
+        """
+        Compiles the permissions registered for the model into a single ``Q`` object. Delegated permissions
+        are represented by ``EXISTS`` (``IN`` on django < 3.0) subqueries, so the result can be used in
+        ``.filter()`` without annotations and, unless a permission filters through a to-many relation,
+        without ``distinct()``.
+
+        :param model_class:     model whose permissions are compiled
+        :param user:            user for which the check is made
+        :param action:          action being performed (such as view, change, ...)
+        :param root_queryset:   queryset passed to the permissions, defaults to ``get_base_queryset``
+        :return:                ``Q`` object
+        """
+        if root_queryset is None:
+            root_queryset = self.get_base_queryset(model_class)
+        return self.get_filter_plan(model_class, action).bind(self, root_queryset, user)
+
+    def get_filter_plan(self, model_class, action):
+        """
+        Returns a cached ``FilterPlan`` for the model and action. The plan is built on the first call and dropped
+        whenever the permissions are changed via ``set_model_permissions`` or ``update_permissions``.
+        """
+        key = (model_class, action)
+        plan = self.filter_plans.get(key)
+        if plan is None:
+            plan = self._permission_to_plan(self.model_permission_map[model_class], model_class, action)
+            self.filter_plans[key] = plan
+        return plan
+
+    def _permission_to_plan(self, perm, model_class, action):
+        if isinstance(perm, Condition):
+            if perm.reduce_op not in (operator.or_, operator.and_):
+                log.error('Subconditions are not implemented in .get_filter_q(), expect narrower results')
+                return EmptyPlan()
+            plan = ConditionPlan(perm.reduce_op, [
+                self._permission_to_plan(subperm, model_class, action) for subperm in perm.perms_or_conds
+            ])
+            # rest_condition denies an empty condition even if negated
+            return NotPlan(plan) if perm.negated and perm.perms_or_conds else plan
+        if hasattr(perm, 'get_filter_plan'):
+            return perm.get_filter_plan(self, model_class, action)
+        # permission classes not derived from BasePermission
+        return PermissionPlan(perm, action)
+
+    def get_users_with_permission(self, obj, action):
+        """
+        Returns a queryset of active users that have the permission to perform the action on the object. Model
+        permissions, guardian user/group object permissions and delegated permissions are all resolved in a single
+        query, so for example users to be notified about a change of the object are found without checking
+        every user separately.
+
+        All the permissions registered for the model (and the models it delegates to) must implement
+        ``get_users_q``, otherwise ``NotImplementedError`` is raised.
+
+        :param obj:     model instance
+        :param action:  action being performed (such as view, change, ...)
+        :return:        queryset of user model
+        """
+        model_class = type(obj)
+        objects_qs = model_class._default_manager.filter(pk=obj.pk)
+        users_q = self.get_users_q(model_class, objects_qs, action, single_object=True)
+        return get_user_model().objects.filter(is_active=True).filter(users_q)
+
+    def get_users_q(self, model_class, objects_qs, action, single_object=False):
+        """
+        Compiles the permissions registered for the model into a ``Q`` object on the user model selecting
+        users that have the permission on at least one of the objects in ``objects_qs``.
+        """
+        return self._permission_to_users_q(self.model_permission_map[model_class], objects_qs, action,
+                                           single_object)
+
+    def _permission_to_users_q(self, perm, objects_qs, action, single_object):
+        if isinstance(perm, Condition):
+            if perm.reduce_op not in (operator.or_, operator.and_):
+                log.error('Subconditions are not implemented in .get_users_q(), expect narrower results')
+                return no_rows_q()
+            if perm.negated and perm.perms_or_conds:
+                if not single_object:
+                    # "not on some object" is not "not on any object", evaluate object by object
+                    conditions = [
+                        self._permission_to_users_q(perm, objects_qs.model._default_manager.filter(pk=pk), action,
+                                                    True)
+                        for pk in objects_qs.values_list('pk', flat=True)
+                    ]
+                    return functools.reduce(operator.or_, conditions) if conditions else no_rows_q()
+                return negate_q(self._permission_to_users_q(self._non_negated(perm), objects_qs, action, True))
+            if perm.reduce_op == operator.and_ and not single_object:
+                # "a user has permission A on some object and B on some object" is not the same as
+                # "A and B on the same object", so evaluate the condition object by object
+                reduce_op = operator.or_
+                conditions = [
+                    self._permission_to_users_q(perm, objects_qs.model._default_manager.filter(pk=pk), action, True)
+                    for pk in objects_qs.values_list('pk', flat=True)
+                ]
+            else:
+                reduce_op = perm.reduce_op
+                conditions = [
+                    self._permission_to_users_q(subperm, objects_qs, action, single_object)
+                    for subperm in perm.perms_or_conds
+                ]
+            if not conditions:
+                return no_rows_q()
+            return functools.reduce(reduce_op, conditions)
+        if getattr(type(perm), 'get_users_q', BasePermission.get_users_q) is BasePermission.get_users_q:
+            raise NotImplementedError('%s does not support reverse (user) lookups' % type(perm).__name__)
+        return perm.get_users_q(self, objects_qs, action, single_object=single_object)
+
     def permissions_for_model(self, model_class_or_model):
         if inspect.isclass(model_class_or_model):
             model_class = model_class_or_model
@@ -324,12 +1012,31 @@ class RestPermissions:
             model_class = type(model_class_or_model)
         return self.model_permission_map[model_class]
 
-    def apply(self, permissions=None, add_django_permissions=None):
+    def apply(self, permissions=None, add_django_permissions=None, filter_by_action=False,
+              trust_filtered_objects=False, select_related_delegations=False, filter_backend=False):
         """
         Sets premissions for a ViewSet class
         :param permissions: If the permissions are set, they are registered upon class decoration
         :param add_django_permissions: if None, use the default, otherwise overwrite the default.
                                        Makes sense only if permissions parameter is filled as well
+        :param filter_by_action: if True, ``get_queryset`` filters by the action being performed (see
+                                 ``viewset_actions``) instead of always using 'view'. Note that objects the user
+                                 can see but not modify then give 404 instead of 403 on update/destroy.
+        :param trust_filtered_objects: if True (requires ``filter_by_action``), objects loaded by ``get_object``
+                                       through the permission-filtered queryset of a standard action are not checked
+                                       again by ``has_object_permission`` - the filter has already decided.
+        :param select_related_delegations: if True, the queryset of detail requests is loaded with
+                                           ``select_related`` of the foreign keys the object permissions delegate
+                                           through (see ``get_delegated_select_related``), so the object checks
+                                           do not fetch the parents one by one. Paths through fields deferred by
+                                           ``only()``/``defer()`` are skipped
+        :param filter_backend: if True, ``get_queryset`` of the viewset is kept and the permissions are applied
+                               by a filter backend appended to its ``filter_backends`` (see ``filter_backend()``),
+                               after search, ordering and other filters, as a single WHERE clause.
+                               Warning: ``get_queryset()`` then returns rows the user is not allowed to see - only
+                               querysets passed through ``filter_queryset()`` (list and ``get_object``) are
+                               restricted. Custom ``@action`` methods and other code calling ``get_queryset()``
+                               directly must call ``self.filter_queryset(self.get_queryset())`` instead.
         """
 
         def decorate(viewset_class):
@@ -344,20 +1051,71 @@ class RestPermissions:
             model_queryset_factory = self.create_queryset_factory(model_class,
                                                                   getattr(viewset_class, 'get_queryset', None))
 
-            return type('%s_perms' % viewset_class.__name__, (viewset_class,), {
+            def get_queryset(view_set):
+                action = self.get_viewset_action(view_set.action) if filter_by_action else 'view'
+                qs = model_queryset_factory(view_set.request.user, action, view_set=view_set)
+                if select_related_delegations and self.is_detail_request(view_set):
+                    qs = self.select_delegated_related(qs)
+                return qs
+
+            def get_object(view_set):
+                if view_set.action not in self.viewset_actions:
+                    return super(decorated_class, view_set).get_object()
+                view_set.object_filtered_by_permissions = True
+                try:
+                    return super(decorated_class, view_set).get_object()
+                finally:
+                    view_set.object_filtered_by_permissions = False
+
+            attrs = {
                 'permission_classes': (self.get_model_permissions(model_class),),
-                'get_queryset': lambda view_set: model_queryset_factory(
-                    view_set.request.user, 'view', view_set=view_set)
-            })
+            }
+            if filter_backend:
+                attrs['filter_backends'] = tuple(getattr(viewset_class, 'filter_backends', ())) + (
+                    self.filter_backend(filter_by_action=filter_by_action,
+                                        select_related_delegations=select_related_delegations),)
+            else:
+                attrs['get_queryset'] = get_queryset
+            if filter_by_action and trust_filtered_objects:
+                attrs['get_object'] = get_object
+
+            decorated_class = type('%s_perms' % viewset_class.__name__, (viewset_class,), attrs)
+            return decorated_class
 
         return decorate
 
+    def filter_backend(self, filter_by_action=False, select_related_delegations=False):
+        """
+        returns a django rest framework filter backend class applying these permissions, to be listed last
+        in ``filter_backends``, see ``rest_delegated_permissions.filters``
+        """
+        return type('DelegatedPermissionFilterBackend', (DelegatedPermissionFilterBackend,), {
+            'rest_permissions': self,
+            'filter_by_action': filter_by_action,
+            'select_related_delegations': select_related_delegations,
+        })
+
+    @staticmethod
+    def is_detail_request(view_set):
+        """
+        returns True if the viewset processes a request on a single object (the lookup is in the url)
+        """
+        lookup_url_kwarg = getattr(view_set, 'lookup_url_kwarg', None) or getattr(view_set, 'lookup_field', None)
+        return lookup_url_kwarg in (getattr(view_set, 'kwargs', None) or {})
+
+    def get_viewset_action(self, viewset_action):
+        return self.viewset_actions.get(viewset_action, 'view')
+
     def get_model_permissions(self, model_class):
         condition = self.model_permission_map[model_class]
 
         class _Permission(permissions.BasePermission):
             def has_object_permission(self, request, view, obj):
-                return condition.has_object_permission(request, view, obj)
+                if getattr(view, 'object_filtered_by_permissions', False) is True:
+                    # loaded through the queryset filtered for this action, see apply(trust_filtered_objects=True)
+                    return True
+                return cached_object_decision(request, condition, obj, getattr(view, 'action', None),
+                                              lambda: condition.has_object_permission(request, view, obj))
 
             def has_permission(self, request, view):
                 return condition.has_permission(request, view)
@@ -370,24 +1128,112 @@ class RestPermissions:
         """
 
         def model_filter(user, action, view_set=None):
-            querysets = []
-
             if base_queryset_getter is not None and view_set is not None:
                 qs = base_queryset_getter(view_set)
             else:
                 qs = self.get_base_queryset(model_class)
 
-            for partial_qs in self.filtered_model_queryset(model_class, qs, user, action):
-                querysets.append(partial_qs)
-            querysets = [
-                x for x in querysets if not isinstance(x, EmptyQuerySet)
-            ]
-            if querysets:
-                return functools.reduce(operator.or_, querysets).distinct()
-            return model_class.objects.none()
+            if self.pk_set_cache is not None:
+                q = self.pk_set_cache.get_filter_q(self, model_class, user, action)
+                if q is not None and not is_all_rows(q):
+                    return qs.none() if is_no_rows(q) else qs.filter(q)
+
+            return self.filter_queryset(model_class, qs, user, action)
 
         return model_filter
 
+    def filter_queryset(self, model_class, qs, user, action):
+        """
+        filters the queryset by the permissions registered for the model, see ``create_queryset_factory``
+        """
+        if self.compile_filters:
+            q = self.get_filter_q(model_class, user, action, qs)
+            if is_no_rows(q):
+                return qs.none()
+            if is_all_rows(q):
+                return qs
+            return distinct_if_needed(qs.filter(q))
+
+        querysets = [
+            x for x in self.filtered_model_queryset(model_class, qs, user, action) if not isinstance(x, EmptyQuerySet)
+        ]
+        if querysets:
+            return distinct_if_needed(functools.reduce(operator.or_, querysets))
+        return model_class.objects.none()
+
+    def annotate_permissions(self, queryset, user, actions=('change', 'delete'), prefix='can_'):
+        """
+        Annotates the queryset with a boolean column for each of the actions, telling whether the user is allowed
+        to perform the action on the row (for example ``can_change``, ``can_delete``). The columns are computed
+        in the same query from the compiled permissions (see ``get_filter_q``), so a page of objects can be
+        returned together with the capability flags.
+
+        :param queryset:    queryset to annotate, usually already filtered by ``create_queryset_factory``
+        :param user:        user for which the flags are computed
+        :param actions:     actions (such as change, delete) to annotate
+        :param prefix:      prefix of the annotation names
+        :return:            annotated queryset
+        """
+        annotations = {}
+        for action in actions:
+            q = self.get_filter_q(queryset.model, user, action)
+            if is_all_rows(q) or is_no_rows(q):
+                annotations[prefix + action] = ExpressionWrapper(Value(is_all_rows(q)), output_field=BooleanField())
+            else:
+                annotations[prefix + action] = Case(When(q, then=Value(True)), default=Value(False),
+                                                    output_field=BooleanField())
+        return queryset.annotate(**annotations)
+
+    def get_prefetches(self, model_class, lookup, user, action='view', to_attr=None):
+        """
+        Returns ``Prefetch`` objects loading the related objects along ``lookup`` (for example ``itemb_set`` or
+        ``itemb_set__parents``) filtered by the permissions registered for the related models, so that nested
+        serializers get only the children the user has access to - with a single query per relation for a whole
+        page of parents. Every model along the path must be registered.
+
+        :param model_class: model of the objects the lookup starts on
+        :param lookup:      prefetch lookup (relation accessor names separated by ``__``)
+        :param user:        user for which the related objects are filtered
+        :param action:      action checked on the related objects
+        :param to_attr:     ``to_attr`` of the last relation of the lookup
+        :return:            list of ``Prefetch``, one for each relation of the lookup
+        """
+        prefetches = []
+        parts = lookup.split(LOOKUP_SEP)
+        for idx, part in enumerate(parts):
+            model_class = self._get_relation(model_class, part).related_model
+            last = idx == len(parts) - 1
+            prefetches.append(Prefetch(LOOKUP_SEP.join(parts[:idx + 1]),
+                                       queryset=self.create_queryset_factory(model_class)(user, action),
+                                       to_attr=to_attr if last else None))
+        return prefetches
+
+    def prefetch_permitted(self, queryset, user, *lookups, action='view'):
+        """
+        returns the queryset with the related objects along ``lookups`` prefetched and filtered by permissions,
+        see ``get_prefetches``
+        """
+        prefetches = []
+        for lookup in lookups:
+            for prefetch in self.get_prefetches(queryset.model, lookup, user, action):
+                # lookups sharing a prefix would prefetch the shared relation twice
+                if prefetch.prefetch_to not in {x.prefetch_to for x in prefetches}:
+                    prefetches.append(prefetch)
+        return queryset.prefetch_related(*prefetches)
+
+    @staticmethod
+    def _get_relation(model_class, accessor_name):
+        """
+        returns the relation field of the model accessed on its instances as ``accessor_name``
+        """
+        for fld in model_class._meta.get_fields():
+            if not fld.is_relation:
+                continue
+            name = fld.name if fld.concrete or not fld.auto_created else fld.get_accessor_name()
+            if name == accessor_name:
+                return fld
+        raise AttributeError('%s has no relation %s' % (model_class.__name__, accessor_name))
+
     def get_base_queryset(self, model_class):
         return self.default_queryset_factory(model_class)
 
@@ -0,0 +1,246 @@
+"""
+Cache of accessible primary keys. For a (user, model, action) the primary keys of the filtered queryset are
+materialized once and stored compactly - as a sorted ``array('q')`` or, if the keys form long runs, as run-length
+encoded ranges - so that later requests filter by the cached ids or answer membership checks in memory.
+
+The cache is keyed by ``RestPermissions.get_permission_version``, so entries of outdated permissions are never used
+and just fall out of the LRU. Enable it by ``RestPermissions(pk_set_cache=PkSetCache())``.
+
+The versions are bumped by signals when the transaction commits (the cache is not used inside a transaction with
+such a change), so changes made without them (``queryset.update()``, bulk operations, raw SQL) are picked up only
+after the ``timeout`` of the entries. The default versions are process local - they are not
+bumped by changes made in other processes, so the in-process cache is consistent only within a single process
+(up to the ``timeout``). A cache shared by several processes requires ``PermissionVersions`` stored in a shared
+cache as well.
+
+Only sets that can be used are materialized - if the permissions of the user fold to all rows (a global permission)
+or no rows, nothing is queried, and the primary keys are fetched only up to ``max_params``.
+"""
+import bisect
+import functools
+import operator
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db.models import Q
+
+from .expressions import all_rows_q, no_rows_q, is_all_rows, is_no_rows, distinct_if_needed
+from .signals import has_pending_changes
+
+# cache entries of users with access to all rows and of sets with more than max_params keys
+ALL_ROWS = 'all'
+TOO_LARGE = 'too_large'
+
+INTEGER_FIELD_TYPES = ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField',
+                       'PositiveIntegerField', 'SmallIntegerField', 'PositiveSmallIntegerField')
+
+
+def has_integer_pk(model_class):
+    """
+    returns True if the primary key of the model is an integer that fits into ``array('q')``
+    """
+    return model_class._meta.pk.get_internal_type() in INTEGER_FIELD_TYPES
+
+
+class PkSet:
+    """
+    Immutable set of integer primary keys. Stored either as a sorted array of the keys or as two arrays holding
+    starts and ends (inclusive) of runs of consecutive keys, whichever is smaller.
+    """
+
+    def __init__(self, pks):
+        """
+        :param pks: iterable of integer primary keys (unsorted, may contain duplicates)
+        """
+        values = array('q', sorted(set(pks)))
+        starts = array('q')
+        ends = array('q')
+        for pk in values:
+            if ends and ends[-1] == pk - 1:
+                ends[-1] = pk
+            else:
+                starts.append(pk)
+                ends.append(pk)
+        self.count = len(values)
+        if 2 * len(starts) < len(values):
+            self.values = None
+            self.starts, self.ends = starts, ends
+        else:
+            self.values = values
+            self.starts = self.ends = None
+
+    @property
+    def run_length_encoded(self):
+        return self.values is None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, pk):
+        if self.values is not None:
+            idx = bisect.bisect_left(self.values, pk)
+            return idx < len(self.values) and self.values[idx] == pk
+        idx = bisect.bisect_right(self.starts, pk) - 1
+        return idx >= 0 and pk <= self.ends[idx]
+
+    def __iter__(self):
+        if self.values is not None:
+            yield from self.values
+        else:
+            for start, end in zip(self.starts, self.ends):
+                yield from range(start, end + 1)
+
+    @property
+    def nbytes(self):
+        """
+        size of the stored arrays in bytes
+        """
+        if self.values is not None:
+            return self.values.itemsize * len(self.values)
+        return self.starts.itemsize * (len(self.starts) + len(self.ends))
+
+    def to_q(self, max_params):
+        """
+        returns ``Q`` matching the primary keys in the set (ranges for runs, ``pk__in`` for single keys)
+        or None if the condition would need more than ``max_params`` query parameters
+        """
+        if not self.count:
+            return no_rows_q()
+        if self.values is not None:
+            if len(self.values) > max_params:
+                return None
+            return Q(pk__in=list(self.values))
+        single = [start for start, end in zip(self.starts, self.ends) if start == end]
+        ranges = [(start, end) for start, end in zip(self.starts, self.ends) if start != end]
+        if len(single) + 2 * len(ranges) > max_params:
+            return None
+        conditions = [Q(pk__range=x) for x in ranges]
+        if single:
+            conditions.append(Q(pk__in=single))
+        return functools.reduce(operator.or_, conditions)
+
+
+class LRUCache:
+    """
+    Minimal thread safe in-process LRU cache with the subset of django's cache API used by ``PkSetCache``
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        # key => (expiration time or None, value)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                return default
+            expires, value = self.entries[key]
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return default
+            return value
+
+    def set(self, key, value, timeout=None):
+        """
+        :param timeout: number of seconds the entry is valid, None for no expiration
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout if timeout is not None else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class PkSetCache:
+    """
+    Cache of ``PkSet`` of accessible primary keys per (user, model, action, permission version)
+    """
+
+    def __init__(self, max_entries=1000, cache_alias=None, max_params=500, timeout=300):
+        """
+        :param max_entries: size of the in-process LRU cache, not used if ``cache_alias`` is given
+        :param cache_alias: alias of a django cache (in ``settings.CACHES``) to store the sets in instead of
+                            the in-process LRU cache. The eviction is then up to the cache backend. RestPermissions
+                            must use ``PermissionVersions`` stored in a shared cache then.
+        :param max_params:  querysets are filtered by the cached keys only if the set has at most this number
+                            of keys, bigger sets are filtered by the permissions as usual
+        :param timeout:     number of seconds a set is cached, bounds the staleness after changes made without
+                            signals. None to cache the sets until the permission version changes.
+        """
+        self.cache = caches[cache_alias] if cache_alias is not None else LRUCache(max_entries)
+        # True if the sets are visible to other processes
+        self.shared = cache_alias is not None
+        self.max_params = max_params
+        self.timeout = timeout
+
+    def get_key(self, rest_permissions, model_class, user, action):
+        return 'rest_delegated_permissions.pksets:%s:%s:%s:%s' % (
+            model_class._meta.label_lower, action, user.pk,
+            rest_permissions.get_permission_version(model_class, user))
+
+    def _get_entry(self, rest_permissions, model_class, user, action):
+        """
+        returns ``PkSet``, ``ALL_ROWS``, ``TOO_LARGE`` or None if the cache can not be used (anonymous users, models
+        without integer keys, transactions with changes not reflected in the versions yet)
+        """
+        if user.pk is None or has_pending_changes() or not has_integer_pk(model_class):
+            return None
+        key = self.get_key(rest_permissions, model_class, user, action)
+        entry = self.cache.get(key)
+        if entry is None:
+            base_queryset = rest_permissions.get_base_queryset(model_class)
+            q = rest_permissions.get_filter_q(model_class, user, action, base_queryset)
+            if is_all_rows(q):
+                entry = ALL_ROWS
+            elif is_no_rows(q):
+                entry = PkSet([])
+            else:
+                # one more key than usable is enough to tell that the set is too large
+                qs = distinct_if_needed(base_queryset.filter(q))
+                pks = list(qs.values_list('pk', flat=True)[:self.max_params + 1])
+                entry = TOO_LARGE if len(pks) > self.max_params else PkSet(pks)
+            self.cache.set(key, entry, timeout=self.timeout)
+        return entry
+
+    def get_pk_set(self, rest_permissions, model_class, user, action):
+        """
+        returns ``PkSet`` of the primary keys of ``model_class`` the user may perform the action on, materializing
+        it by a single query if not cached. Returns None for anonymous users, models without integer keys, users
+        with access to all rows and sets with more than ``max_params`` keys.
+        """
+        entry = self._get_entry(rest_permissions, model_class, user, action)
+        return entry if isinstance(entry, PkSet) else None
+
+    def has_access(self, rest_permissions, obj, user, action):
+        """
+        returns True if the object is accessible to the user (is in the cached set), None if it can not be decided
+        by the cache
+        """
+        entry = self._get_entry(rest_permissions, type(obj), user, action)
+        if entry == ALL_ROWS:
+            return True
+        if not isinstance(entry, PkSet):
+            return None
+        return obj.pk in entry
+
+    def get_filter_q(self, rest_permissions, model_class, user, action):
+        """
+        returns ``Q`` filtering the model by the cached primary keys (``all_rows_q`` if the user has access to all
+        rows), None if the cache can not be used
+        """
+        entry = self._get_entry(rest_permissions, model_class, user, action)
+        if entry == ALL_ROWS:
+            return all_rows_q()
+        if not isinstance(entry, PkSet):
+            return None
+        return entry.to_q(self.max_params)
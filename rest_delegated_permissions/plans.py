@@ -0,0 +1,154 @@
+"""
+Precompiled permission plans. A plan is built once for a (model, action) pair - it resolves the Condition tree,
+the delegated fields, related models and action mappings. Binding a plan to a user then only creates the
+``Q`` object, see ``RestPermissions.get_filter_plan``.
+
+Results matching all rows (``all_rows_q``) or no rows (``no_rows_q``) are folded while binding - through
+``Condition.Or``/``Condition.And``/``Condition.Not`` and across delegation - so that for example a user with a global
+model permission gets an unfiltered queryset instead of always true subqueries.
+
+Chains of foreign keys are compiled to joins - the condition of the related model is moved to the filtered model
+with its lookups prefixed by the foreign key (``parent__project__owner=user``), subqueries are kept only for
+to-many relations and for conditions that can not be moved, see ``prefix_q``.
+"""
+import functools
+import operator
+from abc import ABC, abstractmethod
+
+from django.db.models import Q
+
+from .expressions import all_rows_q, no_rows_q, is_all_rows, is_no_rows, exists_q, negate_q, prefix_q, \
+    querysets_to_q
+
+
+class FilterPlan(ABC):
+    """
+    A node of the compiled permission tree
+    """
+
+    @abstractmethod
+    def bind(self, rest_permissions, root_queryset, user):
+        """
+        creates a ``Q`` object selecting rows of ``root_queryset`` the user has access to
+
+        :param rest_permissions:    the RestPermissions instance the plan was built by
+        :param root_queryset:       queryset that is being filtered
+        :param user:                user for which the check is made
+        :return:                    ``Q`` object
+        """
+        return no_rows_q()
+
+
+class EmptyPlan(FilterPlan):
+    """
+    Plan of a permission that never grants access
+    """
+
+    def bind(self, rest_permissions, root_queryset, user):
+        return no_rows_q()
+
+
+class ConditionPlan(FilterPlan):
+    """
+    Combines subplans by the reduce operation (``operator.or_`` or ``operator.and_``) of the ``Condition``
+    """
+
+    def __init__(self, reduce_op, subplans):
+        self.reduce_op = reduce_op
+        self.subplans = tuple(subplans)
+
+    def bind(self, rest_permissions, root_queryset, user):
+        if not self.subplans:
+            return no_rows_q()
+        if self.reduce_op is operator.or_:
+            absorbing, neutral, absorbing_q = is_all_rows, is_no_rows, all_rows_q
+        else:
+            absorbing, neutral, absorbing_q = is_no_rows, is_all_rows, no_rows_q
+
+        conditions = []
+        for subplan in self.subplans:
+            q = subplan.bind(rest_permissions, root_queryset, user)
+            if absorbing(q):
+                # the remaining subplans are not bound at all
+                return absorbing_q()
+            if not neutral(q):
+                conditions.append(q)
+        if not conditions:
+            # all the subplans were neutral - no rows for Or, all rows for And
+            return no_rows_q() if self.reduce_op is operator.or_ else all_rows_q()
+        return functools.reduce(self.reduce_op, conditions)
+
+
+class NotPlan(FilterPlan):
+    """
+    Negation of a subplan (``Condition.Not`` or any negated ``Condition``), compiled to ``NOT (...)`` -
+    ``NOT EXISTS`` for delegated permissions
+    """
+
+    def __init__(self, subplan):
+        self.subplan = subplan
+
+    def bind(self, rest_permissions, root_queryset, user):
+        return negate_q(self.subplan.bind(rest_permissions, root_queryset, user))
+
+
+class PermissionPlan(FilterPlan):
+    """
+    Leaf of the plan - calls ``get_filter_q`` of the permission or wraps the querysets returned by its
+    ``get_queryset_filters``
+    """
+
+    def __init__(self, permission, action):
+        self.permission = permission
+        self.action = action
+        self.get_filter_q = getattr(permission, 'get_filter_q', None)
+
+    def bind(self, rest_permissions, root_queryset, user):
+        if self.get_filter_q is not None:
+            return self.get_filter_q(rest_permissions, root_queryset, user, self.action)
+        return querysets_to_q(self.permission.get_queryset_filters(rest_permissions, root_queryset, user, self.action))
+
+
+class DelegatedPlan(FilterPlan):
+    """
+    Plan for a single delegated field. The plan of the related model is looked up when binding (that is just
+    a dictionary lookup) so that models can be registered in any order and delegation cycles do not recurse
+    while building.
+    """
+
+    def __init__(self, related_model, delegated_action, outer_field, inner_field, forward_key=False, null=True):
+        """
+        :param related_model:       model the permission is delegated to
+        :param delegated_action:    action checked on the related model
+        :param outer_field:         field of the filtered model, see ``DelegatedPermission.get_relation_fields``
+        :param inner_field:         field of the related model
+        :param forward_key:         True if ``outer_field`` is a foreign key (or one to one) to the related model
+        :param null:                True if the foreign key is nullable
+        """
+        self.related_model = related_model
+        self.delegated_action = delegated_action
+        self.outer_field = outer_field
+        self.inner_field = inner_field
+        self.forward_key = forward_key
+        self.null = null
+
+    def bind(self, rest_permissions, root_queryset, user):
+        related_model_qs = rest_permissions.get_base_queryset(self.related_model)
+        related_q = rest_permissions.get_filter_plan(self.related_model, self.delegated_action) \
+            .bind(rest_permissions, related_model_qs, user)
+        if is_no_rows(related_q):
+            return no_rows_q()
+        if is_all_rows(related_q) and not related_model_qs.query.where:
+            # every related row is allowed
+            if self.forward_key:
+                # the database guarantees that the referenced row exists
+                return Q(**{'%s__isnull' % self.outer_field: False}) if self.null else all_rows_q()
+            return exists_q(related_model_qs, self.inner_field, self.outer_field)
+        if self.forward_key and not related_model_qs.query.where:
+            joined_q = prefix_q(related_q, self.related_model, self.outer_field)
+            if joined_q is not None:
+                if self.null:
+                    # negated parts of the condition would match rows without the related object on the outer join
+                    joined_q = Q(**{'%s__isnull' % self.outer_field: False}) & joined_q
+                return joined_q
+        return exists_q(related_model_qs.filter(related_q), self.inner_field, self.outer_field)
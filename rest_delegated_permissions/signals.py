@@ -0,0 +1,85 @@
+"""
+Helpers of the signal receivers keeping ``versions`` and ``index`` in sync with the permission tables.
+
+The receivers are connected lazily (see ``LazyReceivers``) and act only after the transaction of the change commits
+(see ``on_commit``) - changes that are rolled back never reach the caches, and results computed by other threads
+or processes before the commit are stored under the old versions. A transaction with a pending change sees data the
+caches do not know about yet, so the caches must not be read or filled while ``has_pending_changes()`` is True.
+"""
+import threading
+
+from django.apps import apps
+from django.db import connections, transaction
+from guardian.models import UserObjectPermissionBase, GroupObjectPermissionBase
+
+
+def object_permission_models():
+    """
+    yields (model, 'user' or 'group', object pk field) of all guardian object permission models. Both generic and
+    direct foreign key models are recognized by their base classes
+    """
+    for model_class in apps.get_models():
+        if issubclass(model_class, UserObjectPermissionBase):
+            kind = 'user'
+        elif issubclass(model_class, GroupObjectPermissionBase):
+            kind = 'group'
+        else:
+            continue
+        yield model_class, kind, 'object_pk' if model_class.objects.is_generic() else 'content_object_id'
+
+
+class LazyReceivers:
+    """
+    Connects signal receivers once per process, on the first ``connect()`` after the app registry is ready - the
+    guardian object permission models of all the apps must be known. Receivers are connected to concrete senders
+    only, receivers without a sender would disable fast deletes of all models.
+    """
+
+    def __init__(self, connect):
+        """
+        :param connect: function connecting the receivers
+        """
+        self._connect = connect
+        self.connected = False
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connected or not apps.ready:
+            return
+        with self.lock:
+            if self.connected:
+                return
+            self._connect()
+            self.connected = True
+
+
+class _Deferred:
+    """
+    Callback registered by ``on_commit``, recognized by ``has_pending_changes``
+    """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        self.func(*self.args)
+
+
+def on_commit(using, func, *args):
+    """
+    calls ``func(*args)`` after the transaction of the database connection ``using`` commits, immediately if there
+    is no transaction. The call is dropped if the transaction (or the savepoint it was made in) is rolled back.
+    """
+    transaction.on_commit(_Deferred(func, args), using=using)
+
+
+def has_pending_changes():
+    """
+    returns True if a transaction open in this thread made changes whose receivers wait for the commit
+    """
+    for connection in connections.all():
+        if connection.in_atomic_block and any(
+                isinstance(hook[1], _Deferred) for hook in connection.run_on_commit):
+            return True
+    return False
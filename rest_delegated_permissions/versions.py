@@ -0,0 +1,241 @@
+"""
+Permission version counters. A counter is bumped whenever something the permissions depend on might have changed,
+so that results computed from permissions (list responses, sets of accessible ids, ...) can be cached under a key
+containing the version (see ``RestPermissions.get_permission_version``) and are never served stale.
+
+There are three kinds of counters:
+
+  * global - bumped when group permissions, group memberships of many users or the permissions themselves change
+  * per user - bumped when the user's permissions, groups or guardian object permissions change
+  * per model - bumped when an instance of a model registered in RestPermissions (or a model it delegates to)
+    is saved or deleted, when a many to many delegated field changes and when guardian group object
+    permissions on the model change
+
+The counters are bumped when the transaction making the change commits, rolled back changes bump nothing. Until
+then the transaction sees data the counters do not reflect - do not cache results computed while
+``signals.has_pending_changes()`` is True, they would be stored under the current versions.
+
+The signal receivers are connected when the first ``PermissionVersions`` is created (or, if that happens before
+the app registry is ready, for example in a ``models.py``, when its counters are first read), so that projects not
+using the versions do not pay for the receivers. Models are tracked only by ``RestPermissions`` created with
+``permission_versions`` or ``pk_set_cache`` (or when ``get_permission_version`` is called).
+"""
+import threading
+import time
+import weakref
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from .signals import LazyReceivers, object_permission_models, on_commit
+
+
+class PermissionVersions:
+    """
+    Version counters stored in django's cache framework. Use a shared cache (``cache_alias``) if the versions
+    must be consistent across processes, the default process local locmem cache is enough for a single process.
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, cache_alias=None, key_prefix='rest_delegated_permissions.versions'):
+        """
+        :param cache_alias: alias of the cache in ``settings.CACHES``, if None a process local locmem cache is used
+        :param key_prefix:  prefix of the cache keys
+        """
+        if cache_alias is None:
+            self.cache = LocMemCache(key_prefix, {'TIMEOUT': None})
+        else:
+            self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+        # True if the counters are visible to other processes
+        self.shared = cache_alias is not None
+        PermissionVersions.instances.add(self)
+        connect_signals()
+
+    def _key(self, *parts):
+        return ':'.join((self.key_prefix,) + tuple(str(x) for x in parts))
+
+    def _get(self, key):
+        connect_signals()
+        version = self.cache.get(key)
+        if version is None:
+            # the counter might have been evicted - start from a value not used before so that results cached
+            # with the old counter are not served again
+            self.cache.add(key, int(time.time() * 1000), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def _bump(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # missing counter, the next read starts a new one
+            pass
+
+    def get_global_version(self):
+        return self._get(self._key('global'))
+
+    def get_user_version(self, user_id):
+        return self._get(self._key('user', user_id))
+
+    def get_model_version(self, model_class):
+        return self._get(self._key('model', model_class._meta.label_lower))
+
+    def bump_global(self):
+        self._bump(self._key('global'))
+
+    def bump_user(self, user_id):
+        self._bump(self._key('user', user_id))
+
+    def bump_model(self, model_class):
+        self._bump(self._key('model', model_class._meta.label_lower))
+
+
+_default_lock = threading.Lock()
+_default_permission_versions = None
+
+
+def default_permission_versions():
+    """
+    returns the process local ``PermissionVersions`` used when RestPermissions is created without
+    ``permission_versions``, created on the first call
+    """
+    global _default_permission_versions
+    if _default_permission_versions is None:
+        with _default_lock:
+            if _default_permission_versions is None:
+                _default_permission_versions = PermissionVersions()
+    return _default_permission_versions
+
+
+def bump_global(*args, **kwargs):
+    for versions in list(PermissionVersions.instances):
+        versions.bump_global()
+
+
+def bump_users(user_ids):
+    for versions in list(PermissionVersions.instances):
+        for user_id in user_ids:
+            versions.bump_user(user_id)
+
+
+def bump_model(model_class):
+    for versions in list(PermissionVersions.instances):
+        versions.bump_model(model_class)
+
+
+# The receivers bump the counters after the transaction commits (see ``signals.on_commit``), so that results
+# computed before the commit are cached under the old versions and rolled back changes bump nothing
+
+def _bump_global_on_change(sender, using, **kwargs):
+    on_commit(using, bump_global)
+
+
+def _bump_model_on_change(sender, using, **kwargs):
+    on_commit(using, bump_model, sender)
+
+
+def _bump_models_on_m2m_change(sender, instance, action, model, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        on_commit(using, bump_model, type(instance))
+        on_commit(using, bump_model, model)
+
+
+# models and m2m through models already connected by track_model and track_m2m - connecting a receiver clears
+# the receiver caches of the signal, so it is not repeated
+_tracked_senders = set()
+
+
+def track_model(model_class):
+    """
+    bumps the version of the model whenever its instance is saved or deleted
+    """
+    if model_class in _tracked_senders:
+        return
+    _tracked_senders.add(model_class)
+    post_save.connect(_bump_model_on_change, sender=model_class,
+                      dispatch_uid='rest_delegated_permissions.versions.model.%s' % model_class._meta.label_lower)
+    post_delete.connect(_bump_model_on_change, sender=model_class,
+                        dispatch_uid='rest_delegated_permissions.versions.model.%s' % model_class._meta.label_lower)
+
+
+def track_m2m(through_model):
+    """
+    bumps the versions of both sides of a many to many relation whenever the relation changes
+    """
+    if through_model in _tracked_senders:
+        return
+    _tracked_senders.add(through_model)
+    m2m_changed.connect(_bump_models_on_m2m_change, sender=through_model,
+                        dispatch_uid='rest_delegated_permissions.versions.m2m.%s' % through_model._meta.label_lower)
+
+
+def _user_object_permission_changed(sender, instance, using, **kwargs):
+    on_commit(using, bump_users, [instance.user_id])
+
+
+def _group_object_permission_changed(sender, instance, using, **kwargs):
+    # all members of the group are affected, bump the model the permission is about
+    if sender.objects.is_generic():
+        model_class = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    else:
+        model_class = sender._meta.get_field('content_object').related_model
+    if model_class is not None:
+        on_commit(using, bump_model, model_class)
+
+
+def _user_m2m_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        on_commit(using, bump_users, [instance.pk])
+    elif pk_set:
+        # group.user_set.add(...) or permission.user_set.add(...)
+        on_commit(using, bump_users, list(pk_set))
+    else:
+        # reverse clear, affected users are not known
+        on_commit(using, bump_global)
+
+
+def _group_permissions_changed(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        on_commit(using, bump_global)
+
+
+def _user_changed(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        # login does not change permissions
+        return
+    # is_active, is_superuser, ... and deleted users whose id might be reused
+    on_commit(using, bump_users, [instance.pk])
+
+
+def _connect_receivers():
+    # bump the global and user counters
+    for model_class, kind, object_field in object_permission_models():
+        receiver = _user_object_permission_changed if kind == 'user' else _group_object_permission_changed
+        dispatch_uid = 'rest_delegated_permissions.versions.object_permissions.%s' % model_class._meta.label_lower
+        post_save.connect(receiver, sender=model_class, dispatch_uid=dispatch_uid)
+        post_delete.connect(receiver, sender=model_class, dispatch_uid=dispatch_uid)
+    user_model = get_user_model()
+    m2m_changed.connect(_user_m2m_changed, sender=user_model.user_permissions.through,
+                        dispatch_uid='rest_delegated_permissions.versions.user_permissions')
+    m2m_changed.connect(_user_m2m_changed, sender=user_model.groups.through,
+                        dispatch_uid='rest_delegated_permissions.versions.groups')
+    m2m_changed.connect(_group_permissions_changed, sender=Group.permissions.through,
+                        dispatch_uid='rest_delegated_permissions.versions.group_permissions')
+    post_save.connect(_user_changed, sender=user_model, dispatch_uid='rest_delegated_permissions.versions.user')
+    post_delete.connect(_user_changed, sender=user_model, dispatch_uid='rest_delegated_permissions.versions.user')
+    # deletes cascade to the m2m tables without m2m_changed
+    post_delete.connect(_bump_global_on_change, sender=Group, dispatch_uid='rest_delegated_permissions.versions.group')
+    post_delete.connect(_bump_global_on_change, sender=Permission,
+                        dispatch_uid='rest_delegated_permissions.versions.permission')
+
+
+receivers = LazyReceivers(_connect_receivers)
+connect_signals = receivers.connect
@@ -0,0 +1,60 @@
+# Generated by Django 2.0.13 on 2026-10-18 15:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0009_alter_user_last_name_max_length'),
+        ('app', '0005_container_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemF',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=10)),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.Container')),
+            ],
+            options={
+                'permissions': (('view_itemf', 'View Item F'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemFGroupObjectPermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.ItemF')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Group')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Permission')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemFUserObjectPermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.ItemF')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Permission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemfuserobjectpermission',
+            unique_together={('user', 'permission', 'content_object')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemfgroupobjectpermission',
+            unique_together={('group', 'permission', 'content_object')},
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 2.0.13 on 2026-10-18 19:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0009_alter_user_last_name_max_length'),
+        ('app', '0007_folder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemG',
+            fields=[
+                ('code', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=10)),
+            ],
+            options={
+                'permissions': (('view_itemg', 'View Item G'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemH',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=10)),
+            ],
+            options={
+                'permissions': (('view_itemh', 'View Item H'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemHGroupObjectPermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.ItemH')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Group')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Permission')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemHUserObjectPermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.ItemH')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.Permission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemhuserobjectpermission',
+            unique_together={('user', 'permission', 'content_object')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemhgroupobjectpermission',
+            unique_together={('group', 'permission', 'content_object')},
+        ),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.db import models
+from guardian.models import UserObjectPermissionBase, GroupObjectPermissionBase
 
 
 #
@@ -67,3 +70,63 @@ class ItemE(models.Model):
         permissions = (
             ('view_iteme', 'View Item E'),
         )
+
+
+class ItemF(models.Model):
+    name   = models.CharField(max_length=10)
+    parent = models.ForeignKey(Container, on_delete=models.CASCADE)
+
+    class Meta:
+        permissions = (
+            ('view_itemf', 'View Item F'),
+        )
+
+
+# guardian object permissions of ItemF stored in tables with a direct foreign key instead of generic object_pk
+
+
+class ItemFUserObjectPermission(UserObjectPermissionBase):
+    content_object = models.ForeignKey(ItemF, on_delete=models.CASCADE)
+
+
+class ItemFGroupObjectPermission(GroupObjectPermissionBase):
+    content_object = models.ForeignKey(ItemF, on_delete=models.CASCADE)
+
+
+class Folder(models.Model):
+    name   = models.CharField(max_length=10)
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.CASCADE)
+    owner  = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        permissions = (
+            ('view_folder', 'View Folder'),
+        )
+
+
+class ItemG(models.Model):
+    code   = models.CharField(max_length=10, primary_key=True)
+    name   = models.CharField(max_length=10)
+
+    class Meta:
+        permissions = (
+            ('view_itemg', 'View Item G'),
+        )
+
+
+class ItemH(models.Model):
+    id     = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name   = models.CharField(max_length=10)
+
+    class Meta:
+        permissions = (
+            ('view_itemh', 'View Item H'),
+        )
+
+
+class ItemHUserObjectPermission(UserObjectPermissionBase):
+    content_object = models.ForeignKey(ItemH, on_delete=models.CASCADE)
+
+
+class ItemHGroupObjectPermission(GroupObjectPermissionBase):
+    content_object = models.ForeignKey(ItemH, on_delete=models.CASCADE)
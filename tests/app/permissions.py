@@ -1,3 +1,5 @@
+from django.db.models import Q
+
 from rest_delegated_permissions.permissions import BasePermission
 
 
@@ -18,6 +20,12 @@ class OwnerPermission(BasePermission):
         """
         yield filtered_queryset.filter(owner=user)
 
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        return Q(owner=user)
+
+    def get_users_q(self, rest_permissions, objects_qs, action, single_object=False):
+        return Q(pk__in=objects_qs.values('owner'))
+
     def has_permission(self, request, view):
         # filter will limit it
         return True
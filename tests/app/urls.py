@@ -4,11 +4,12 @@ from rest_framework.routers import DefaultRouter
 
 from tests.app.viewsets import DelegatedOwnerViewSet
 from .viewsets import ContainerViewSet, ItemAViewSet, ItemBViewSet, ItemCViewSet, ItemDViewSet, DenyAllViewSet, \
-    AllowOnlyOwnerViewSet
+    AllowOnlyOwnerViewSet, ItemAByActionViewSet
 
 router = DefaultRouter()
 router.register(r'container', ContainerViewSet)
 router.register(r'item/A', ItemAViewSet)
+router.register(r'item/AByAction', ItemAByActionViewSet)
 router.register(r'item/B', ItemBViewSet)
 router.register(r'item/C', ItemCViewSet)
 router.register(r'item/D', ItemDViewSet)
@@ -55,6 +55,17 @@ class ItemAViewSet(viewsets.ModelViewSet):
     serializer_class = ItemASerializer
 
 
+# the same permissions as ItemAViewSet, but the queryset is filtered by the performed action and the objects
+# loaded through it are not checked again by has_object_permission
+@perms.apply(filter_by_action=True, trust_filtered_objects=True)
+class ItemAByActionViewSet(viewsets.ModelViewSet):
+    """
+    This view set automatically provides `list` and `detail` actions.
+    """
+    queryset = ItemA.objects.all()
+    serializer_class = ItemASerializer
+
+
 class ItemBSerializer(ModelSerializer):
     class Meta:
         model = ItemB
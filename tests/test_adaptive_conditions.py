@@ -0,0 +1,96 @@
+# noinspection PyPackageRequirements
+import itertools
+import time
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User
+from rest_condition import Condition
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.conditions import AdaptiveCondition
+from .app.models import Container, ItemA
+
+
+class Branch:
+
+    def __init__(self, decisions, delay=0.0):
+        self.decisions = decisions
+        self.delay = delay
+        self.calls = 0
+
+    def has_object_permission(self, request, view, obj):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.decisions(obj)
+
+    def has_permission(self, request, view):
+        return True
+
+
+class DummyViewSet:
+    pass
+
+
+class TestAdaptiveCondition:
+
+    def test_cheap_likely_branch_moves_first(self):
+        expensive = Branch(lambda obj: obj % 10 == 0, delay=0.001)
+        cheap = Branch(lambda obj: obj % 10 != 0)
+        condition = AdaptiveCondition.Or(expensive, cheap)
+        condition.min_samples = 5
+        condition.reorder_every = 10
+        for obj in range(50):
+            assert condition.has_object_permission(None, None, obj)
+
+        stats = condition.branch_stats()['has_object_permission']
+        assert [x['branch'] for x in stats] == [cheap, expensive]
+        assert stats[0]['hit_rate'] > 0.8
+
+        expensive.calls = 0
+        for obj in range(1, 10):
+            assert condition.has_object_permission(None, None, obj)
+        assert expensive.calls == 0
+
+    def test_same_decisions(self):
+        for decisions in itertools.product((True, False), repeat=3):
+            branches = [Branch(lambda obj, d=d: d) for d in decisions]
+            for factory in ('Or', 'And'):
+                expected = getattr(Condition, factory)(*branches).has_object_permission(None, None, 1)
+                adaptive = getattr(AdaptiveCondition, factory)(*branches)
+                adaptive.min_samples = adaptive.reorder_every = 1
+                for _ in range(3):
+                    assert adaptive.has_object_permission(None, None, 1) == expected
+
+    def test_not_reordered(self):
+        first = Branch(lambda obj: False)
+        condition = AdaptiveCondition.Not(first, Branch(lambda obj: False))
+        assert not condition.adaptive
+        assert condition.has_object_permission(None, None, 1)
+        assert condition.branch_stats() == {}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rest_permissions():
+    rest_permissions = RestPermissions(add_django_permissions=True, adaptive_ordering=True)
+    rest_permissions.update_permissions({
+        Container: [],
+        ItemA: DelegatedPermission(rest_permissions, 'parent'),
+    })
+    assert isinstance(rest_permissions.model_permission_map[ItemA], AdaptiveCondition)
+    user = User.objects.create(username='user')
+    container = Container.objects.create(name='c')
+    item = ItemA.objects.create(name='a', parent=container)
+
+    req = Mock()
+    req.user = user
+    req.method = 'GET'
+    view = DummyViewSet()
+    view.action = 'retrieve'
+    view.queryset = ItemA.objects.all()
+    permission = rest_permissions.get_model_permissions(ItemA)()
+    assert not permission.has_object_permission(req, view, item)
+    user.is_superuser = True
+    assert permission.has_object_permission(req, view, item)
+    assert list(rest_permissions.create_queryset_factory(ItemA)(user, 'view')) == [item]
@@ -0,0 +1,18 @@
+# noinspection PyPackageRequirements
+import pytest
+
+from benchmarks.run import get_configurations, parse_args, run
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBenchmarks:
+
+    def test_smoke(self):
+        # more rows than sqlite accepts in a single insert, so that the batching is exercised
+        results = run(parse_args(['--rows', '600', '--repeat', '1', '--object-checks', '2',
+                                  '--profile', 'guardian', '--profile', 'nobody', '--action', 'change']))
+        assert results['meta']['rows'] == 600
+        assert len(results['results']) == len(get_configurations()) * 2 * 2
+        for result in results['results']:
+            assert result['queryset']['rows'] >= 0
+            assert result['object_permission']['objects'] == 2
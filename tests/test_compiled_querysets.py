@@ -0,0 +1,85 @@
+# noinspection PyPackageRequirements
+
+import pytest
+from django.contrib.auth.models import Permission
+
+from tests import test_allow_only_owner_querysets, test_delegated_owner_querysets, \
+    test_delegated_owner_with_and_querysets, test_deny_querysets
+from tests.app.models import ItemA, ItemB, ItemC, ItemD
+from tests.app.viewsets import perms
+from tests.test_item_base import BaseTestItemA, BaseTestItemB, BaseTestItemC, BaseTestItemD
+from tests.test_users_base import BaseUsers
+from .test_item_querysets_base import SelectiveBaseTestItemQuerySets
+
+
+class CompiledFilters:
+
+    @pytest.fixture(autouse=True)
+    def compiled_filters(self):
+        rest_permissions = self.get_perms()
+        rest_permissions.compile_filters = True
+        yield
+        rest_permissions.compile_filters = False
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemACompiledQuerySets(CompiledFilters, BaseTestItemA, SelectiveBaseTestItemQuerySets, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemBCompiledQuerySets(CompiledFilters, BaseTestItemB, SelectiveBaseTestItemQuerySets, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemCCompiledQuerySets(CompiledFilters, BaseTestItemC, SelectiveBaseTestItemQuerySets, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemDCompiledQuerySets(CompiledFilters, BaseTestItemD, SelectiveBaseTestItemQuerySets, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDenyCompiledQuerySets(CompiledFilters, test_deny_querysets.TestDenyQuerySets,
+                                SelectiveBaseTestItemQuerySets):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAllowOnlyOwnerCompiledQuerySets(CompiledFilters, test_allow_only_owner_querysets.TestDenyQuerySets,
+                                          SelectiveBaseTestItemQuerySets):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDelegatedOwnerCompiledQuerySets(CompiledFilters, test_delegated_owner_querysets.TestDelegatedOwnerQuerySets,
+                                          SelectiveBaseTestItemQuerySets):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDelegatedOwnerWithAndCompiledQuerySets(
+        CompiledFilters, test_delegated_owner_with_and_querysets.TestDelegatedOwnerWithAndQuerySets,
+        SelectiveBaseTestItemQuerySets):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCompiledQueryShape:
+
+    @pytest.mark.parametrize('model_class', [ItemA, ItemB, ItemC, ItemD])
+    def test_no_distinct_and_annotation(self, model_class, django_user_model):
+        user = django_user_model.objects.create(username='compiled')
+        # a permission on container so that the whole WHERE clause is not reduced to an empty result
+        user.user_permissions.add(Permission.objects.get(codename='view_container'))
+        perms.compile_filters = True
+        try:
+            qs = perms.create_queryset_factory(model_class)(user, 'view')
+        finally:
+            perms.compile_filters = False
+        sql = str(qs.query)
+        assert 'DISTINCT' not in sql
+        assert '__extra_condition' not in sql
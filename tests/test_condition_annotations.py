@@ -0,0 +1,68 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from .app.models import Container, ItemA, ItemB
+from .app.permissions import OwnerPermission
+
+
+class AnnotatedOwnerPermission(OwnerPermission):
+    returns__extra_condition = True
+
+    def filter(self, rest_permissions, filtered_queryset, user, action):
+        yield filtered_queryset.filter(owner=user).extra(select={'__extra_condition': '1'})
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConditionAnnotations:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.user = User.objects.create(username='user')
+        self.containers = [Container.objects.create(name='c%s' % i) for i in range(4)]
+        self.containers[0].owner = self.user
+        self.containers[0].save()
+        assign_perm(Permission.objects.get(codename='view_container'), self.user, self.containers[1])
+        self.item_as = [ItemA.objects.create(name='a%s' % i, parent=x) for i, x in enumerate(self.containers)]
+        self.item_b = ItemB.objects.create(name='b')
+        self.item_b.parents.set(self.containers[:2])
+        ItemB.objects.create(name='b2').parents.set(self.containers[2:])
+
+    def rest_permissions(self, annotate_conditions, container_permission=None):
+        rest_permissions = RestPermissions(add_django_permissions=True, annotate_conditions=annotate_conditions)
+        rest_permissions.update_permissions({
+            Container: container_permission or OwnerPermission(),
+            ItemA: DelegatedPermission(rest_permissions, 'parent'),
+            ItemB: DelegatedPermission(rest_permissions, 'parents'),
+        })
+        return rest_permissions
+
+    def fetch(self, rest_permissions, model_class):
+        with CaptureQueriesContext(connection) as ctx:
+            rows = set(rest_permissions.create_queryset_factory(model_class)(self.user, 'view'))
+        sql = ctx.captured_queries[-1]['sql']
+        return rows, sql
+
+    @pytest.mark.parametrize('model_class', [Container, ItemA, ItemB])
+    def test_same_results(self, model_class):
+        annotated_rows, annotated_sql = self.fetch(self.rest_permissions(True), model_class)
+        rows, sql = self.fetch(self.rest_permissions(False), model_class)
+        assert rows == annotated_rows
+        assert '__extra_condition' in annotated_sql
+        assert '__extra_condition' not in sql
+
+    def test_predicates_only_in_where(self):
+        rows, sql = self.fetch(self.rest_permissions(False), ItemA)
+        assert rows == set(self.item_as[:2])
+        select_clause = sql.split(' FROM ', 1)[0]
+        assert 'SELECT' not in select_clause[len('SELECT'):]
+
+    def test_annotating_permission(self):
+        rows, sql = self.fetch(self.rest_permissions(False, AnnotatedOwnerPermission()), Container)
+        assert rows == set(self.containers[:2])
+        assert '__extra_condition' not in sql.split(' FROM ', 1)[0]
@@ -0,0 +1,87 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions.decisions import enable_decision_cache, get_decision_cache, \
+    DecisionCacheMiddleware
+from .app.models import Container, ItemA
+from .app.viewsets import perms
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDecisionCache:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.user = User.objects.create(username='a')
+        self.container = Container.objects.create(name='c')
+        assign_perm(Permission.objects.get(codename='view_container'), self.user, self.container)
+        self.item_a1 = ItemA.objects.create(name='a1', parent=self.container)
+        self.item_a2 = ItemA.objects.create(name='a2', parent=self.container)
+
+    def check(self, request, obj):
+        view = DummyViewSet()
+        view.action = 'view'
+        view.queryset = type(obj).objects.all()
+        return perms.get_model_permissions(type(obj))().has_object_permission(request, view, obj)
+
+    def make_request(self):
+        req = Mock()
+        req.user = self.user
+        req.method = 'GET'
+        return req
+
+    def test_repeated_decision(self):
+        req = self.make_request()
+        enable_decision_cache(req)
+
+        assert self.check(req, self.item_a1)
+        with CaptureQueriesContext(connection) as queries:
+            assert self.check(req, self.item_a1)
+        assert len(queries) == 0
+
+    def test_shared_delegated_parent(self):
+        uncached = self.make_request()
+        with CaptureQueriesContext(connection) as uncached_queries:
+            assert self.check(uncached, self.item_a1)
+            assert self.check(uncached, self.item_a2)
+
+        cached = self.make_request()
+        enable_decision_cache(cached)
+        with CaptureQueriesContext(connection) as cached_queries:
+            assert self.check(cached, self.item_a1)
+            assert self.check(cached, self.item_a2)
+
+        # the container decision is made only once
+        assert len(cached_queries) < len(uncached_queries)
+
+    def test_decisions_differ_by_method(self):
+        req = self.make_request()
+        enable_decision_cache(req)
+        assert self.check(req, self.item_a1)
+        req.method = 'PATCH'
+        view = DummyViewSet()
+        view.action = 'change'
+        view.queryset = ItemA.objects.all()
+        assert not perms.get_model_permissions(ItemA)().has_object_permission(req, view, self.item_a1)
+
+    def test_not_enabled(self):
+        req = self.make_request()
+        assert get_decision_cache(req) is None
+        assert self.check(req, self.item_a1)
+
+    def test_middleware(self):
+        request = RequestFactory().get('/')
+        middleware = DecisionCacheMiddleware(lambda r: get_decision_cache(r))
+        assert middleware(request) is not None
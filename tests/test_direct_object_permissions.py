@@ -0,0 +1,120 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Group, AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from guardian.conf import settings as guardian_settings
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.expressions import is_no_rows
+from rest_delegated_permissions.object_permissions import GuardianExistsBackend, has_direct_object_permissions, \
+    objects_with_object_permission_q
+from .app.models import Container, ItemA, ItemF, ItemFUserObjectPermission
+
+direct_perms = RestPermissions(add_django_permissions=True)
+direct_perms.update_permissions({
+    Container: [],
+    ItemF: DelegatedPermission(direct_perms, 'parent'),
+})
+
+exists_perms = RestPermissions(add_django_permissions=True, object_permission_backend=GuardianExistsBackend())
+exists_perms.update_permissions({
+    Container: [],
+    ItemF: DelegatedPermission(exists_perms, 'parent'),
+})
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDirectObjectPermissions:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.users = {}
+        for name in ('direct', 'group', 'container', 'inactive', 'superuser', 'nobody'):
+            self.users[name] = User.objects.create(username=name, is_superuser=(name == 'superuser'))
+
+        self.container1 = Container.objects.create(name='c1')
+        self.container2 = Container.objects.create(name='c2')
+        self.item1 = ItemF.objects.create(name='f1', parent=self.container1)
+        self.item2 = ItemF.objects.create(name='f2', parent=self.container2)
+        self.item3 = ItemF.objects.create(name='f3', parent=self.container2)
+
+        assign_perm('view_itemf', self.users['direct'], self.item1)
+        assign_perm('change_itemf', self.users['direct'], self.item2)
+        group = Group.objects.create(name='direct')
+        assign_perm('view_itemf', group, self.item2)
+        self.users['group'].groups.add(group)
+        assign_perm('view_container', self.users['container'], self.container2)
+
+        assign_perm('view_itemf', self.users['inactive'], self.item1)
+        self.users['inactive'].is_active = False
+        self.users['inactive'].save()
+
+    def test_detection(self):
+        assert has_direct_object_permissions(ItemF)
+        assert not has_direct_object_permissions(ItemA)
+        assert ItemFUserObjectPermission.objects.filter(content_object=self.item1).count() == 2
+
+    @pytest.mark.parametrize('compile_filters', [False, True])
+    @pytest.mark.parametrize('rest_permissions', [direct_perms, exists_perms])
+    def test_filter(self, rest_permissions, compile_filters):
+        expected = {
+            'direct': {self.item1.pk},
+            'group': {self.item2.pk},
+            'container': {self.item2.pk, self.item3.pk},
+            'inactive': {self.item1.pk},     # querysets do not check is_active, the same as guardian
+            'superuser': {self.item1.pk, self.item2.pk, self.item3.pk},
+            'nobody': set(),
+        }
+        rest_permissions.compile_filters = compile_filters
+        try:
+            for name, user in self.users.items():
+                qs = rest_permissions.create_queryset_factory(ItemF)(user, 'view')
+                assert set(qs.values_list('pk', flat=True)) == expected[name], name
+            qs = rest_permissions.create_queryset_factory(ItemF)(self.users['direct'], 'change')
+            assert set(qs.values_list('pk', flat=True)) == {self.item2.pk}
+        finally:
+            rest_permissions.compile_filters = False
+
+    def has_object_permission(self, user, obj, method):
+        req = Mock()
+        req.user = user
+        req.method = method
+        view = DummyViewSet()
+        view.action = 'retrieve' if method == 'GET' else 'partial_update'
+        view.queryset = ItemF.objects.all()
+        return direct_perms.get_model_permissions(ItemF)().has_object_permission(req, view, obj)
+
+    @pytest.mark.parametrize('method', ['GET', 'PATCH'])
+    def test_object_permission_same_as_guardian(self, method):
+        codename = 'view_itemf' if method == 'GET' else 'change_itemf'
+        for name, user in self.users.items():
+            for obj in (self.item1, self.item2, self.item3):
+                expected = User.objects.get(pk=user.pk).has_perm('app.%s' % codename, obj) or \
+                    (name == 'container' and obj.parent == self.container2 and method == 'GET')
+                assert self.has_object_permission(user, obj, method) == expected, (name, obj.name)
+        assert not self.has_object_permission(AnonymousUser(), self.item1, 'GET')
+
+    def test_object_permission_single_query(self, django_assert_num_queries):
+        user = self.users['group']
+        user.has_perm('app.view_itemf')     # fills django's permission cache of the user
+        with django_assert_num_queries(1):
+            assert self.has_object_permission(user, self.item2, 'GET')
+
+    def test_users_with_permission(self):
+        users = direct_perms.get_users_with_permission(self.item2, 'view')
+        assert set(users.values_list('username', flat=True)) == {'group', 'container', 'superuser'}
+
+    def test_anonymous_user_disabled(self, monkeypatch):
+        monkeypatch.setattr(guardian_settings, 'ANONYMOUS_USER_NAME', None)
+        ct = ContentType.objects.get_for_model(ItemF)
+        assert is_no_rows(objects_with_object_permission_q(ItemF, ct, 'view_itemf', AnonymousUser()))
+        qs = exists_perms.create_queryset_factory(ItemF)(AnonymousUser(), 'view')
+        assert list(qs) == []
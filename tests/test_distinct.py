@@ -0,0 +1,78 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.expressions import needs_distinct
+from .app.models import Container, ItemA, ItemB
+from .app.permissions import OwnerPermission
+
+
+class ItemOwnerPermission(OwnerPermission):
+    """
+    container is accessible if the user owns it or it contains an item named as the user - a filter
+    on a reverse foreign key joining the items
+    """
+
+    def filter(self, rest_permissions, filtered_queryset, user, action):
+        yield filtered_queryset.filter(Q(owner=user) | Q(itema__name=user.username))
+
+    def get_filter_q(self, rest_permissions, qs, user, action):
+        return Q(owner=user) | Q(itema__name=user.username)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestDistinct:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True, params=[False, True], ids=['querysets', 'compiled'])
+    def environ(self, request):
+        self.compiled = request.param
+        self.rest_permissions = RestPermissions(compile_filters=request.param)
+        self.rest_permissions.update_permissions({
+            Container: OwnerPermission(),
+            ItemA: DelegatedPermission(self.rest_permissions, 'parent'),
+            ItemB: DelegatedPermission(self.rest_permissions, 'parents'),
+        })
+        self.user = User.objects.create(username='user')
+        self.containers = [Container.objects.create(name='c%s' % i, owner=self.user) for i in range(2)]
+        self.other = Container.objects.create(name='other')
+        self.item_a = ItemA.objects.create(name='user', parent=self.containers[0])
+        ItemA.objects.create(name='user', parent=self.containers[0])
+        ItemA.objects.create(name='user', parent=self.other)
+        self.item_b = ItemB.objects.create(name='b')
+        self.item_b.parents.set(self.containers + [self.other])
+
+    def accessible(self, model_class):
+        return self.rest_permissions.create_queryset_factory(model_class)(self.user, 'view')
+
+    def test_plain_predicates(self):
+        qs = self.accessible(Container)
+        assert not qs.query.distinct
+        assert sorted(qs, key=lambda x: x.pk) == self.containers
+
+    def test_foreign_key_delegation(self):
+        qs = self.accessible(ItemA)
+        assert not qs.query.distinct
+        assert sorted(x.pk for x in qs) == sorted(ItemA.objects.filter(parent__owner=self.user).values_list('pk', flat=True))
+
+    def test_many_to_many_delegation(self):
+        qs = self.accessible(ItemB)
+        # the delegated subquery is correlated over the m2m join in querysets mode
+        assert qs.query.distinct == (not self.compiled)
+        assert list(qs) == [self.item_b]
+
+    def test_to_many_filter(self):
+        self.rest_permissions.set_model_permissions(Container, ItemOwnerPermission(), overwrite=True)
+        qs = self.accessible(Container)
+        assert qs.query.distinct
+        assert sorted(qs, key=lambda x: x.pk) == self.containers + [self.other]
+
+
+def test_needs_distinct():
+    assert not needs_distinct(ItemA.objects.all())
+    assert not needs_distinct(ItemA.objects.filter(parent__owner__username='x'))
+    assert not needs_distinct(ItemA.objects.filter(parent__in=Container.objects.filter(itema__name='x')))
+    assert needs_distinct(Container.objects.filter(itema__name='x'))
+    assert needs_distinct(ItemB.objects.filter(parents__name='x'))
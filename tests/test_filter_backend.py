@@ -0,0 +1,77 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import viewsets
+from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.filters import DelegatedPermissionFilterBackend
+from .app.models import Container, ItemA
+from .app.permissions import OwnerPermission
+from .app.viewsets import ItemASerializer
+
+
+@pytest.mark.django_db(transaction=True)
+class TestFilterBackend:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.rest_permissions = RestPermissions(add_django_permissions=True)
+        self.rest_permissions.update_permissions({
+            Container: OwnerPermission(),
+            ItemA: DelegatedPermission(self.rest_permissions, 'parent'),
+        })
+        self.user = User.objects.create(username='user')
+        mine = Container.objects.create(name='mine', owner=self.user)
+        theirs = Container.objects.create(name='theirs')
+        self.items = [ItemA.objects.create(name=name, parent=mine) for name in ('b1', 'a1', 'x1')]
+        self.hidden = ItemA.objects.create(name='a2', parent=theirs)
+
+        @self.rest_permissions.apply(filter_backend=True)
+        class ItemAViewSet(viewsets.ModelViewSet):
+            queryset = ItemA.objects.all()
+            serializer_class = ItemASerializer
+            filter_backends = (SearchFilter, OrderingFilter)
+            search_fields = ('name',)
+            ordering_fields = ('name',)
+
+        self.viewset = ItemAViewSet
+
+    def get(self, actions, url, **kwargs):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        return self.viewset.as_view(actions)(request, **kwargs)
+
+    def test_backend_is_last(self):
+        assert self.viewset.filter_backends[:2] == (SearchFilter, OrderingFilter)
+        assert issubclass(self.viewset.filter_backends[2], DelegatedPermissionFilterBackend)
+        assert self.viewset.filter_backends[2].rest_permissions is self.rest_permissions
+
+    def test_single_where_clause(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.get({'get': 'list'}, '/item/?search=1&ordering=-name')
+        assert response.status_code == 200
+        assert [x['name'] for x in response.data] == ['x1', 'b1', 'a1']
+        sql = [x['sql'] for x in context.captured_queries if 'FROM "app_itema"' in x['sql']]
+        assert len(sql) == 1
+        assert 'DISTINCT' not in sql[0] and '__extra_condition' not in sql[0]
+        assert 'LIKE' in sql[0] and '"app_container"."owner_id"' in sql[0]
+
+    def test_detail(self):
+        assert self.get({'get': 'retrieve'}, '/item/', pk=self.items[0].pk).status_code == 200
+        assert self.get({'get': 'retrieve'}, '/item/', pk=self.hidden.pk).status_code == 404
+
+    def test_rest_permissions_on_view(self):
+        class ItemAViewSet(viewsets.ReadOnlyModelViewSet):
+            queryset = ItemA.objects.all()
+            serializer_class = ItemASerializer
+            filter_backends = (DelegatedPermissionFilterBackend,)
+            permission_classes = ()
+            rest_permissions = self.rest_permissions
+
+        self.viewset = ItemAViewSet
+        assert {x['id'] for x in self.get({'get': 'list'}, '/item/').data} == {x.pk for x in self.items}
@@ -0,0 +1,98 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User, Permission, Group, AnonymousUser
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.cache import permission_existence_cache
+from rest_delegated_permissions.object_permissions import GuardianExistsBackend
+from .app.models import Container, ItemA, ItemB, ItemC, ItemD
+
+exists_perms = RestPermissions(add_django_permissions=True, object_permission_backend=GuardianExistsBackend())
+exists_perms.update_permissions({
+    Container: [],
+    ItemA: DelegatedPermission(exists_perms, 'parent'),
+    ItemB: DelegatedPermission(exists_perms, 'parents'),
+    ItemC: DelegatedPermission(exists_perms, 'container'),
+    ItemD: DelegatedPermission(exists_perms, 'containers'),
+})
+
+shortcuts_perms = RestPermissions(add_django_permissions=True)
+shortcuts_perms.update_permissions({
+    Container: [],
+    ItemA: DelegatedPermission(shortcuts_perms, 'parent'),
+    ItemB: DelegatedPermission(shortcuts_perms, 'parents'),
+    ItemC: DelegatedPermission(shortcuts_perms, 'container'),
+    ItemD: DelegatedPermission(shortcuts_perms, 'containers'),
+})
+
+
+@pytest.mark.django_db(transaction=True)
+class TestGuardianExistsBackend:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.users = {}
+        for name in ('global', 'guardian', 'group_guardian', 'item', 'superuser', 'nobody'):
+            self.users[name] = User.objects.create(username=name, is_superuser=(name == 'superuser'))
+
+        self.item_c = ItemC.objects.create(name='c')
+        self.container1 = Container.objects.create(name='c1', item_c=self.item_c)
+        self.container2 = Container.objects.create(name='c2')
+        self.item_a1 = ItemA.objects.create(name='a1', parent=self.container1)
+        self.item_a2 = ItemA.objects.create(name='a2', parent=self.container2)
+        self.item_b = ItemB.objects.create(name='b')
+        self.item_b.parents.add(self.container1, self.container2)
+        self.item_d = ItemD.objects.create(name='d')
+        self.container2.items_d.add(self.item_d)
+
+        self.users['global'].user_permissions.add(Permission.objects.get(codename='view_container'))
+        assign_perm('view_container', self.users['guardian'], self.container1)
+        assign_perm('change_container', self.users['guardian'], self.container2)
+
+        group = Group.objects.create(name='guardian')
+        assign_perm('view_container', group, self.container2)
+        self.users['group_guardian'].groups.add(group)
+
+        assign_perm('view_itema', self.users['item'], self.item_a2)
+
+    def filtered_pks(self, rest_permissions, model_class, user, action):
+        return set(rest_permissions.create_queryset_factory(model_class)(user, action).values_list('pk', flat=True))
+
+    @pytest.mark.parametrize('compile_filters', [False, True])
+    @pytest.mark.parametrize('action', ['view', 'change'])
+    @pytest.mark.parametrize('model_class', [Container, ItemA, ItemB, ItemC, ItemD])
+    def test_same_as_shortcuts(self, model_class, action, compile_filters):
+        exists_perms.compile_filters = compile_filters
+        shortcuts_perms.compile_filters = compile_filters
+        try:
+            for name, user in self.users.items():
+                assert self.filtered_pks(exists_perms, model_class, user, action) == \
+                    self.filtered_pks(shortcuts_perms, model_class, user, action), name
+        finally:
+            exists_perms.compile_filters = False
+            shortcuts_perms.compile_filters = False
+
+    def test_guardian_permissions(self):
+        assert self.filtered_pks(exists_perms, Container, self.users['guardian'], 'view') == {self.container1.pk}
+        assert self.filtered_pks(exists_perms, Container, self.users['group_guardian'], 'view') == \
+            {self.container2.pk}
+        assert self.filtered_pks(exists_perms, ItemA, self.users['item'], 'view') == {self.item_a2.pk}
+        assert self.filtered_pks(exists_perms, ItemA, AnonymousUser(), 'view') == set()
+
+    def test_lazy(self):
+        exists_perms.compile_filters = True
+        try:
+            user = self.users['guardian']
+            # fill django's permission cache of the user and the permission existence cache
+            user.has_perm('app.view_container')
+            permission_existence_cache.warm()
+            with CaptureQueriesContext(connection) as queries:
+                qs = exists_perms.create_queryset_factory(ItemA)(user, 'view')
+            assert len(queries) == 0
+            assert set(qs.values_list('pk', flat=True)) == {self.item_a1.pk}
+        finally:
+            exists_perms.compile_filters = False
@@ -0,0 +1,126 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, HierarchicalDelegatedPermission
+from rest_delegated_permissions.cache import permission_existence_cache
+from .app.models import Folder
+from .app.permissions import OwnerPermission
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestHierarchicalPermission:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True, params=[False, True], ids=['querysets', 'compiled'])
+    def environ(self, request):
+        self.compile_filters = request.param
+        self.user = User.objects.create(username='user')
+        self.rest_permissions = self.create_permissions()
+        # root - a - b - c, root - d, other - e
+        self.root = Folder.objects.create(name='root')
+        self.a = Folder.objects.create(name='a', parent=self.root)
+        self.b = Folder.objects.create(name='b', parent=self.a, owner=self.user)
+        self.c = Folder.objects.create(name='c', parent=self.b)
+        self.d = Folder.objects.create(name='d', parent=self.root)
+        self.other = Folder.objects.create(name='other')
+        self.e = Folder.objects.create(name='e', parent=self.other)
+        assign_perm(Permission.objects.get(codename='view_folder'), self.user, self.other)
+        permission_existence_cache.warm()
+
+    def create_permissions(self, **kwargs):
+        rest_permissions = RestPermissions(add_django_permissions=True, compile_filters=self.compile_filters)
+        rest_permissions.update_permissions({
+            Folder: [OwnerPermission(), HierarchicalDelegatedPermission(rest_permissions, 'parent', **kwargs)],
+        })
+        return rest_permissions
+
+    def accessible(self, action='view'):
+        return set(self.rest_permissions.create_queryset_factory(Folder)(self.user, action))
+
+    def allowed(self, obj, action='retrieve'):
+        req = Mock()
+        req.user = self.user
+        req.method = 'GET'
+        view = DummyViewSet()
+        view.action = action
+        view.queryset = Folder.objects.all()
+        return self.rest_permissions.get_model_permissions(Folder)().has_object_permission(req, view, obj)
+
+    def test_filter(self):
+        assert self.accessible() == {self.b, self.c, self.other, self.e}
+        # only the owner permission does not depend on the action
+        assert self.accessible('change') == {self.b, self.c}
+
+    def test_object_checks(self):
+        assert self.allowed(self.b)
+        assert self.allowed(self.e)
+        assert not self.allowed(self.a)
+        assert not self.allowed(self.d)
+        # the ancestors are walked in a single query, the other queries are guardian's
+        with CaptureQueriesContext(connection) as context:
+            assert self.allowed(self.c)
+        assert len([x for x in context.captured_queries if 'FROM "app_folder"' in x['sql']]) == 1
+
+    def test_max_depth(self):
+        self.rest_permissions = self.create_permissions(max_depth=1)
+        grandchild = Folder.objects.create(name='gc', parent=self.c)
+        assert self.accessible() == {self.b, self.c, self.other, self.e}
+        assert self.allowed(self.c)
+        assert not self.allowed(grandchild)
+
+    def test_default_max_depth(self):
+        # a chain of folders deeper than the default limit below the owned folder b
+        chain = []
+        parent = self.c
+        for i in range(40):
+            parent = Folder.objects.create(name='chain%s' % i, parent=parent)
+            chain.append(parent)
+        max_depth = HierarchicalDelegatedPermission(self.rest_permissions).max_depth
+        assert max_depth is not None and max_depth < 41
+        # c is one level below b, chain[i] is i + 2 levels below it
+        assert self.accessible() == {self.b, self.c, self.other, self.e} | set(chain[:max_depth - 1])
+        assert self.allowed(chain[max_depth - 2])
+        assert not self.allowed(chain[max_depth - 1])
+        with CaptureQueriesContext(connection) as context:
+            self.accessible()
+        assert any('WITH RECURSIVE' in x['sql'] and 'depth' in x['sql'] for x in context.captured_queries)
+
+    def users(self, obj, action='view'):
+        return set(self.rest_permissions.get_users_with_permission(obj, action).values_list('username', flat=True))
+
+    def test_users_with_permission(self):
+        root_owner = User.objects.create(username='root_owner')
+        self.root.owner = root_owner
+        self.root.save()
+        assert self.users(self.root) == {'root_owner'}
+        assert self.users(self.a) == {'root_owner'}
+        assert self.users(self.c) == {'user', 'root_owner'}
+        assert self.users(self.e) == {'user'}
+        assert self.users(self.e, 'change') == set()
+        # model and object permissions, the owners and the ancestors are resolved in a single query
+        users = self.rest_permissions.get_users_with_permission(self.c, 'view')
+        with CaptureQueriesContext(connection) as context:
+            list(users)
+        assert len(context.captured_queries) == 1
+
+    def test_users_with_permission_max_depth(self):
+        self.rest_permissions = self.create_permissions(max_depth=1)
+        grandchild = Folder.objects.create(name='gc', parent=self.c)
+        assert self.users(self.c) == {'user'}
+        assert self.users(grandchild) == set()
+
+    def test_cycle(self):
+        self.root.parent = self.d
+        self.root.save()
+        assert self.accessible() == {self.b, self.c, self.other, self.e}
+        assert not self.allowed(self.root)
@@ -0,0 +1,125 @@
+# noinspection PyPackageRequirements
+import json
+
+import pytest
+from django.contrib.auth.models import User, Permission
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+from rest_framework import viewsets
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from tests.app.models import Container, ItemA
+from tests.app.viewsets import ItemASerializer
+from tests.test_item_base import BaseTestItemA
+from tests.test_item_rest_base import BaseTestItemRest
+from tests.test_users_base import BaseUsers
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemAByActionRest(BaseTestItemA, BaseTestItemRest, BaseUsers):
+
+    def item_url(self, item):
+        return '/item/AByAction/%s/' % item.id
+
+    def transform_expected_result_code(self, expected_result_code, request, item):
+        if request.getfixturevalue('action') != 'change':
+            return expected_result_code
+        # the object is looked up in the 'change' queryset, read permission does not matter
+        if request.getfixturevalue('write') or request.getfixturevalue('item_write'):
+            return 200
+        if request.getfixturevalue('guardian_write') and self.get_parents(item).intersection(
+                set(self.guardian_containers)):
+            return 200
+        if request.getfixturevalue('guardian_item_write') and item in self.guardian_directly_on_items:
+            return 200
+        return 404
+
+    def get_parents(self, item):
+        return {item.parent}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemAByActionQueries:
+
+    def test_no_object_permission_queries(self, client):
+        container = Container.objects.create(name='c')
+        item = ItemA.objects.create(name='i', parent=container)
+        user = User.objects.create(username='a')
+        assign_perm(Permission.objects.get(codename='change_container'), user, container)
+        assign_perm(Permission.objects.get(codename='view_container'), user, container)
+        client.force_login(user)
+
+        resp = client.patch('/item/AByAction/%s/' % item.id, json.dumps({}), content_type='application/json')
+        assert resp.status_code == 200
+
+        with CaptureQueriesContext(connection) as by_action_queries:
+            client.patch('/item/AByAction/%s/' % item.id, json.dumps({}), content_type='application/json')
+
+        with CaptureQueriesContext(connection) as queries:
+            client.patch('/item/A/%s/' % item.id, json.dumps({}), content_type='application/json')
+        assert len(by_action_queries) < len(queries)
+
+
+class DummyRequest:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemAByActionMapping:
+
+    def test_dict_mapping(self):
+        rest_permissions = RestPermissions(add_django_permissions=True)
+        rest_permissions.update_permissions({
+            Container: [],
+            # deleting an item needs just the change permission on its container
+            ItemA: DelegatedPermission(rest_permissions, 'parent', mapping={'destroy': 'update'}),
+        })
+
+        @rest_permissions.apply(filter_by_action=True)
+        class ItemAViewSet(viewsets.ModelViewSet):
+            queryset = ItemA.objects.all()
+            serializer_class = ItemASerializer
+
+        user = User.objects.create(username='a')
+        items = {}
+        for codename in ('view_container', 'change_container', 'delete_container'):
+            container = Container.objects.create(name=codename)
+            assign_perm(Permission.objects.get(codename=codename), user, container)
+            items[codename] = ItemA.objects.create(name=codename, parent=container)
+
+        view_set = ItemAViewSet()
+        view_set.request = DummyRequest()
+        view_set.request.user = user
+        view_set.kwargs = {}
+        for action, codename in (('list', 'view_container'), ('retrieve', 'view_container'),
+                                 ('update', 'change_container'), ('partial_update', 'change_container'),
+                                 ('destroy', 'change_container')):
+            view_set.action = action
+            assert list(view_set.get_queryset()) == [items[codename]]
+
+    @pytest.mark.parametrize('mapping, action', [
+        # update and partial_update are both filtered by 'change'
+        ({'partial_update': 'retrieve'}, 'change'),
+        ({'update': 'update', 'partial_update': 'view'}, 'change'),
+        # custom actions need an entry
+        ({'destroy': 'update'}, 'publish'),
+    ])
+    def test_dict_mapping_improperly_configured(self, mapping, action):
+        rest_permissions = RestPermissions(add_django_permissions=True)
+        permission = DelegatedPermission(rest_permissions, 'parent', mapping=mapping)
+        rest_permissions.update_permissions({
+            Container: [],
+            ItemA: permission,
+        })
+        with pytest.raises(ImproperlyConfigured):
+            permission._get_delegated_action(action)
+
+    def test_dict_mapping_explicit_entry(self):
+        rest_permissions = RestPermissions(add_django_permissions=True)
+        permission = DelegatedPermission(rest_permissions, 'parent',
+                                         mapping={'partial_update': 'retrieve', 'change': 'view'})
+        assert permission._get_delegated_action('change') == 'view'
+        assert permission._get_delegated_action('partial_update') == 'retrieve'
+        assert permission._get_delegated_action('update') == 'update'
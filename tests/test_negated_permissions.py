@@ -0,0 +1,83 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User
+from rest_condition import Condition
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.expressions import is_all_rows
+from .app.models import Container, ItemC, ItemE
+from .app.permissions import OwnerPermission
+
+
+@pytest.mark.django_db(transaction=True)
+class TestNegatedPermissions:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True, params=[False, True], ids=['querysets', 'compiled'])
+    def environ(self, request):
+        self.rest_permissions = RestPermissions(compile_filters=request.param)
+        self.rest_permissions.update_permissions({
+            Container: OwnerPermission(),
+            # visible unless a container of the user points to it
+            ItemC: Condition.Not(DelegatedPermission(self.rest_permissions, 'container')),
+            # items in containers of the user that the user does not own
+            ItemE: Condition.And(DelegatedPermission(self.rest_permissions, 'parent'), ~Condition(OwnerPermission())),
+        })
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.item_cs = [ItemC.objects.create(name='ic%s' % i) for i in range(3)]
+        self.containers = [
+            Container.objects.create(name='c1', owner=self.user1, item_c=self.item_cs[0]),
+            # NULL in the column the negated subquery selects
+            Container.objects.create(name='c2', owner=self.user2),
+            Container.objects.create(name='c3', item_c=self.item_cs[1]),
+        ]
+        self.item_es = [
+            ItemE.objects.create(name='e1', parent=self.containers[0], owner=self.user1),
+            ItemE.objects.create(name='e2', parent=self.containers[0]),
+            ItemE.objects.create(name='e3', parent=self.containers[1], owner=self.user1),
+        ]
+
+    def accessible(self, model_class, user):
+        return set(self.rest_permissions.create_queryset_factory(model_class)(user, 'view'))
+
+    def allowed(self, obj, user):
+        req = Mock()
+        req.user = user
+        req.method = 'GET'
+        return self.rest_permissions.has_object_permission(req, type(obj), 'view', obj)
+
+    def test_negated_delegation(self):
+        assert self.accessible(ItemC, self.user1) == set(self.item_cs[1:])
+        assert self.accessible(ItemC, self.user2) == set(self.item_cs)
+
+    def test_negation_inside_and(self):
+        assert self.accessible(ItemE, self.user1) == {self.item_es[1]}
+        assert self.accessible(ItemE, self.user2) == {self.item_es[2]}
+
+    def test_same_as_object_checks(self):
+        for user in (self.user1, self.user2):
+            for model_class, objects in ((ItemC, self.item_cs), (ItemE, self.item_es)):
+                assert self.accessible(model_class, user) == {x for x in objects if self.allowed(x, user)}
+
+    def users_with_permission(self, obj):
+        # guardian's anonymous user is an active user as well
+        users = self.rest_permissions.get_users_with_permission(obj, 'view')
+        return set(users.filter(pk__in=[self.user1.pk, self.user2.pk]))
+
+    def test_users_with_permission(self):
+        assert self.users_with_permission(self.item_cs[0]) == {self.user2}
+        assert self.users_with_permission(self.item_cs[2]) == {self.user1, self.user2}
+
+    def test_folding(self):
+        # nobody has access to containers => nothing is denied
+        self.rest_permissions.set_model_permissions(Container, Condition.Or(), overwrite=True)
+        assert is_all_rows(self.rest_permissions.get_filter_q(ItemC, self.user1, 'view'))
+        assert self.accessible(ItemC, self.user1) == set(self.item_cs)
+
+    def test_empty_negation_denies(self):
+        self.rest_permissions.set_model_permissions(ItemC, Condition.Not(), overwrite=True)
+        assert not self.allowed(self.item_cs[0], self.user1)
+        assert self.accessible(ItemC, self.user1) == set()
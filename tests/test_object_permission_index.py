@@ -0,0 +1,215 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission, Group
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import assign_perm, remove_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.cache import permission_existence_cache
+from rest_delegated_permissions.index import ObjectPermissionIndex, PairArray
+from rest_delegated_permissions.object_permissions import GuardianIndexBackend
+from .app.models import Container, ItemA, ItemF, ItemG, ItemH
+
+
+class DummyViewSet:
+    pass
+
+
+class TestPairArray:
+
+    def test_add_remove(self):
+        pairs = PairArray([(2, 1), (1, 5), (1, 3)])
+        assert list(pairs.get(1)) == [3, 5]
+        assert pairs.add(1, 4)
+        assert not pairs.add(1, 4)
+        assert list(pairs.get(1)) == [3, 4, 5]
+        assert (2, 1) in pairs and (2, 2) not in pairs
+        assert pairs.remove(2, 1)
+        assert not pairs.remove(2, 1)
+        assert list(pairs.get(2)) == []
+        assert pairs.nbytes == 2 * 3 * 8
+
+    def test_added_pairs_merged(self, monkeypatch):
+        monkeypatch.setattr(PairArray, 'merge_threshold', 3)
+        pairs = PairArray([(1, 1), (3, 3)])
+        assert pairs.add(2, 2) and pairs.add(1, 0)
+        assert len(pairs.first) == 2 and len(pairs) == 4
+        assert list(pairs.get(1)) == [0, 1]
+        assert pairs.remove(1, 0)
+        assert pairs.add(3, 1) and pairs.add(4, 4)
+        # merged into the arrays
+        assert not pairs.added
+        assert list(zip(pairs.first, pairs.second)) == [(1, 1), (2, 2), (3, 1), (3, 3), (4, 4)]
+        assert (3, 1) in pairs and (1, 0) not in pairs
+
+
+@pytest.mark.django_db(transaction=True)
+class TestObjectPermissionIndex:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.index = ObjectPermissionIndex()
+        self.user = User.objects.create(username='user')
+        self.group = Group.objects.create(name='group')
+        self.view_container = Permission.objects.get(codename='view_container')
+        self.containers = [Container.objects.create(name='c%s' % i) for i in range(3)]
+        self.ct = ContentType.objects.get_for_model(Container)
+        assign_perm(self.view_container, self.user, self.containers[0])
+        assign_perm(self.view_container, self.group, self.containers[1])
+        permission_existence_cache.warm()
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_checks_without_queries(self, django_assert_num_queries):
+        self.user.groups.add(self.group)
+        user = self.fresh_user()
+        self.index.load()
+        with django_assert_num_queries(0):
+            assert self.index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+            assert self.index.has_object_permission(user, self.containers[1], self.ct, ['view_container'])
+            assert not self.index.has_object_permission(user, self.containers[2], self.ct, ['view_container'])
+            assert not self.index.has_object_permission(user, self.containers[0], self.ct,
+                                                        ['view_container', 'change_container'])
+            assert self.index.get_object_pks(user, self.ct, 'view_container') == sorted(
+                x.pk for x in self.containers[:2])
+
+    def test_incremental_updates(self, django_assert_num_queries):
+        self.index.load()
+        user = self.fresh_user()
+        assert not self.index.has_object_permission(user, self.containers[1], self.ct, ['view_container'])
+        self.user.groups.add(self.group)
+        assert self.index.has_object_permission(user, self.containers[1], self.ct, ['view_container'])
+        assign_perm(self.view_container, self.user, self.containers[2])
+        remove_perm(self.view_container, self.user, self.containers[0])
+        with django_assert_num_queries(0):
+            assert self.index.get_object_pks(user, self.ct, 'view_container') == sorted(
+                x.pk for x in self.containers[1:])
+        self.group.user_set.remove(self.user)
+        assert self.index.get_object_pks(user, self.ct, 'view_container') == [self.containers[2].pk]
+        self.group.delete()
+        assert not self.index.loaded
+        assert self.index.get_object_pks(user, self.ct, 'view_container') == [self.containers[2].pk]
+
+    def test_applied_on_commit(self):
+        self.index.load()
+        user = self.fresh_user()
+        backend = GuardianIndexBackend(self.index)
+        with transaction.atomic():
+            assign_perm(self.view_container, self.user, self.containers[2])
+            remove_perm(self.view_container, self.user, self.containers[0])
+            # answered from the database inside the transaction
+            assert self.index.has_object_permission(user, self.containers[2], self.ct, ['view_container']) is None
+            qs = backend.filter(Container.objects.all(), user, self.ct, 'view_container')
+            assert list(qs) == [self.containers[2]]
+            transaction.set_rollback(True)
+        assert self.index.loaded
+        assert not self.index.has_object_permission(user, self.containers[2], self.ct, ['view_container'])
+        assert self.index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+
+        with transaction.atomic():
+            assign_perm(self.view_container, self.user, self.containers[2])
+        assert self.index.loaded
+        assert self.index.has_object_permission(user, self.containers[2], self.ct, ['view_container'])
+
+    def test_direct_foreign_key_tables(self):
+        item = ItemF.objects.create(name='f', parent=self.containers[0])
+        assign_perm('app.view_itemf', self.user, item)
+        ct = ContentType.objects.get_for_model(ItemF)
+        assert self.index.has_object_permission(self.fresh_user(), item, ct, ['view_itemf'])
+        remove_perm('app.view_itemf', self.user, item)
+        assert not self.index.has_object_permission(self.fresh_user(), item, ct, ['view_itemf'])
+
+    def test_char_primary_keys(self):
+        # '042' and '42' are different objects, they must not be mixed by converting the keys to integers
+        items = [ItemG.objects.create(code=code, name=code) for code in ('042', '42')]
+        assign_perm('app.view_itemg', self.user, items[0])
+        ct = ContentType.objects.get_for_model(ItemG)
+        self.index.load()
+        assert ct.pk in self.index.stats()['unsupported_content_types']
+        user = self.fresh_user()
+        assert self.index.has_object_permission(user, items[1], ct, ['view_itemg']) is None
+        assert self.index.get_object_pks(user, ct, 'view_itemg') is None
+        backend = GuardianIndexBackend(self.index)
+        assert list(backend.filter(ItemG.objects.all(), user, ct, 'view_itemg')) == [items[0]]
+
+    def test_uuid_primary_keys(self):
+        items = [ItemH.objects.create(name='h%s' % i) for i in range(2)]
+        assign_perm('app.view_itemh', self.user, items[0])
+        ct = ContentType.objects.get_for_model(ItemH)
+        self.index.load()
+        assert self.index.loaded and ct.pk in self.index.stats()['unsupported_content_types']
+        # added after the load
+        assign_perm('app.view_itemh', self.user, items[1])
+        user = self.fresh_user()
+        assert self.index.has_object_permission(user, items[1], ct, ['view_itemh']) is None
+        backend = GuardianIndexBackend(self.index)
+        assert set(backend.filter(ItemH.objects.all(), user, ct, 'view_itemh')) == set(items)
+        # other content types are still answered from the index
+        assert self.index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+
+    def test_undecidable(self):
+        anonymous = Mock(is_authenticated=False)
+        assert self.index.has_object_permission(anonymous, self.containers[0], self.ct, ['view_container']) is None
+        superuser = User.objects.create(username='superuser', is_superuser=True)
+        assert self.index.has_object_permission(superuser, self.containers[2], self.ct, ['view_container'])
+
+    def test_overflow(self):
+        index = ObjectPermissionIndex(max_entries=1)
+        index.load()
+        stats = index.stats()
+        assert stats['overflow'] and stats['memory_bytes'] == 0
+        assert index.get_object_pks(self.fresh_user(), self.ct, 'view_container') is None
+        assert index.has_object_permission(self.fresh_user(), self.containers[0], self.ct, ['view_container']) is None
+        # the fallback backend answers from the database
+        backend = GuardianIndexBackend(index)
+        qs = backend.filter(Container.objects.all(), self.fresh_user(), self.ct, 'view_container')
+        assert list(qs) == [self.containers[0]]
+
+    def test_reloaded_after_max_age(self):
+        index = ObjectPermissionIndex(max_age=60)
+        index.load()
+        user = self.fresh_user()
+        assert index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+        # revoked without signals (or by another process)
+        UserObjectPermission.objects.filter(user=self.user).update(object_pk=str(self.containers[2].pk))
+        assert index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+        index.loaded_at -= 61
+        assert not index.has_object_permission(user, self.containers[0], self.ct, ['view_container'])
+        assert index.has_object_permission(user, self.containers[2], self.ct, ['view_container'])
+
+    def test_stats(self):
+        self.user.groups.add(self.group)
+        self.index.load()
+        stats = self.index.stats()
+        assert stats['loaded'] and not stats['overflow']
+        assert stats['entries'] == 3
+        # two permission tables of one pair each indexed both ways and one user - group pair
+        assert stats['memory_bytes'] == (2 * 2 + 1) * 2 * 8
+
+    def test_rest_permissions(self, django_assert_num_queries):
+        rest_permissions = RestPermissions(add_django_permissions=True, object_permission_index=self.index)
+        rest_permissions.update_permissions({
+            Container: [],
+            ItemA: DelegatedPermission(rest_permissions, 'parent'),
+        })
+        items = [ItemA.objects.create(name='a%s' % i, parent=x) for i, x in enumerate(self.containers)]
+        factory = rest_permissions.create_queryset_factory(ItemA)
+        assert list(factory(self.fresh_user(), 'view')) == [items[0]]
+
+        req = Mock()
+        req.user = self.fresh_user()
+        req.user.has_perm('app.view_container')
+        req.method = 'GET'
+        view = DummyViewSet()
+        view.action = 'retrieve'
+        view.queryset = Container.objects.all()
+        permission = rest_permissions.get_model_permissions(Container)()
+        with django_assert_num_queries(0):
+            assert permission.has_object_permission(req, view, self.containers[0])
+            assert not permission.has_object_permission(req, view, self.containers[1])
@@ -0,0 +1,60 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission
+from guardian.shortcuts import assign_perm
+
+from .app.models import Container, ItemA
+from .app.viewsets import perms
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPermissionAnnotations:
+
+    @pytest.fixture()
+    def user(self):
+        user = User.objects.create(username='a')
+        user.user_permissions.add(Permission.objects.get(codename='view_container'))
+        return user
+
+    @pytest.fixture()
+    def items(self, user):
+        items = []
+        for i in range(4):
+            container = Container.objects.create(name='c%s' % i)
+            items.append(ItemA.objects.create(name='a%s' % i, parent=container))
+            if i % 2:
+                assign_perm(Permission.objects.get(codename='change_container'), user, container)
+            if i == 2:
+                assign_perm(Permission.objects.get(codename='delete_itema'), user, items[-1])
+        return items
+
+    def test_flags_match_object_permissions(self, user, items):
+        qs = perms.annotate_permissions(perms.create_queryset_factory(ItemA)(user, 'view'), user)
+        rows = list(qs.order_by('pk'))
+        assert [x.pk for x in rows] == [x.pk for x in items]
+
+        for row in rows:
+            for action, method in (('change', 'PATCH'), ('delete', 'DELETE')):
+                req = Mock()
+                req.user = user
+                req.method = method
+                view = DummyViewSet()
+                view.action = action
+                view.queryset = ItemA.objects.all()
+                expected = perms.get_model_permissions(ItemA)().has_object_permission(req, view, row)
+                assert getattr(row, 'can_%s' % action) == expected, (row.name, action)
+
+        assert [x.can_change for x in rows] == [False, True, False, True]
+        assert [x.can_delete for x in rows] == [False, False, True, False]
+
+    def test_single_query(self, user, items, django_assert_num_queries):
+        qs = perms.annotate_permissions(ItemA.objects.all(), user, actions=('view', 'change'), prefix='may_')
+        with django_assert_num_queries(1):
+            rows = list(qs)
+        assert all(x.may_view for x in rows)
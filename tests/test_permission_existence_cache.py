@@ -0,0 +1,44 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_migrate
+
+from rest_delegated_permissions.cache import permission_existence_cache
+from rest_delegated_permissions.permissions import DjangoCombinedPermission
+from .app.models import Container
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPermissionExistenceCache:
+
+    def test_no_queries_when_warm(self, django_assert_num_queries):
+        ct = ContentType.objects.get_for_model(Container)
+        permission_existence_cache.warm()
+        with django_assert_num_queries(0):
+            assert DjangoCombinedPermission.check_permission_exists(ct, 'view_container')
+            assert DjangoCombinedPermission.check_permission_exists(ct, 'change_container')
+            assert not DjangoCombinedPermission.check_permission_exists(ct, 'frobnicate_container')
+
+    def test_loaded_lazily(self, django_assert_num_queries):
+        ct = ContentType.objects.get_for_model(Container)
+        permission_existence_cache.clear()
+        with django_assert_num_queries(1):
+            assert DjangoCombinedPermission.check_permission_exists(ct, 'view_container')
+            assert DjangoCombinedPermission.check_permission_exists(ct, 'delete_container')
+
+    def test_refreshed(self):
+        ct = ContentType.objects.get_for_model(Container)
+        assert not DjangoCombinedPermission.check_permission_exists(ct, 'frobnicate_container')
+
+        permission = Permission.objects.create(content_type=ct, codename='frobnicate_container', name='Frobnicate')
+        assert DjangoCombinedPermission.check_permission_exists(ct, 'frobnicate_container')
+
+        permission.delete()
+        assert not DjangoCombinedPermission.check_permission_exists(ct, 'frobnicate_container')
+
+        permission_existence_cache.warm()
+        app_config = apps.get_app_config('app')
+        post_migrate.send(sender=app_config, app_config=app_config, verbosity=0, interactive=False, using='default')
+        assert permission_existence_cache.permissions is None
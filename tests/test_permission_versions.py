@@ -0,0 +1,165 @@
+# noinspection PyPackageRequirements
+from unittest import mock
+
+import pytest
+from django.apps import apps
+from django.contrib.auth.models import User, Permission, Group
+from django.db import transaction
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission, versions
+from rest_delegated_permissions.signals import has_pending_changes
+from rest_delegated_permissions.pksets import PkSetCache
+from .app.models import Container, ItemA, ItemB, ItemC, ItemD
+
+versioned_perms = RestPermissions(add_django_permissions=True)
+versioned_perms.update_permissions({
+    Container: [],
+    ItemA: DelegatedPermission(versioned_perms, 'parent'),
+    ItemB: DelegatedPermission(versioned_perms, 'parents'),
+    ItemD: DelegatedPermission(versioned_perms, 'containers'),
+})
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPermissionVersions:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.user = User.objects.create(username='user')
+        self.other_user = User.objects.create(username='other')
+        self.container = Container.objects.create(name='c')
+        self.item_b = ItemB.objects.create(name='b')
+        self.view_container = Permission.objects.get(codename='view_container')
+
+    def versions(self, model_class=ItemA):
+        return (versioned_perms.get_permission_version(model_class, self.user),
+                versioned_perms.get_permission_version(model_class, self.other_user))
+
+    def test_dependent_models(self):
+        assert versioned_perms.get_dependent_models(ItemA) == {ItemA, Container}
+        assert versioned_perms.get_dependent_models(ItemD) == {ItemD, Container}
+        assert versioned_perms.get_dependent_models(ItemC) == {ItemC}
+
+    def test_stable(self):
+        assert self.versions() == self.versions()
+        self.user.save(update_fields=['last_login'])
+        assert self.versions() == self.versions()
+
+    def test_user_changes(self):
+        user_version, other_version = self.versions()
+
+        assign_perm(self.view_container, self.user, self.container)
+        new_user_version, new_other_version = self.versions()
+        assert new_user_version != user_version
+        assert new_other_version == other_version
+
+        self.user.user_permissions.add(self.view_container)
+        assert self.versions()[0] != new_user_version
+
+        group = Group.objects.create(name='group')
+        user_version = self.versions()[0]
+        self.user.groups.add(group)
+        assert self.versions()[0] != user_version
+
+    def test_global_changes(self):
+        group = Group.objects.create(name='group')
+        user_version, other_version = self.versions()
+        group.permissions.add(self.view_container)
+        new_user_version, new_other_version = self.versions()
+        assert new_user_version != user_version
+        assert new_other_version != other_version
+
+    def test_model_changes(self):
+        item_a_versions = self.versions(ItemA)
+        item_c_versions = self.versions(ItemC)
+
+        group = Group.objects.create(name='group')
+        assign_perm(self.view_container, group, self.container)
+        assert self.versions(ItemA) != item_a_versions
+        assert self.versions(ItemC) == item_c_versions
+
+        item_a_versions = self.versions(ItemA)
+        self.container.name = 'renamed'
+        self.container.save()
+        assert self.versions(ItemA) != item_a_versions
+
+        item_a_versions = self.versions(ItemA)
+        ItemA.objects.create(name='a', parent=self.container)
+        assert self.versions(ItemA) != item_a_versions
+
+    def test_m2m_changes(self):
+        item_b_versions = self.versions(ItemB)
+        self.item_b.parents.add(self.container)
+        assert self.versions(ItemB) != item_b_versions
+
+        item_d = ItemD.objects.create(name='d')
+        item_d_versions = self.versions(ItemD)
+        item_d.containers.add(self.container)
+        assert self.versions(ItemD) != item_d_versions
+
+    def test_bumped_on_commit(self):
+        user_version, other_version = self.versions()
+        with transaction.atomic():
+            assign_perm(self.view_container, self.user, self.container)
+            self.user.user_permissions.add(self.view_container)
+            assert has_pending_changes()
+            assert self.versions() == (user_version, other_version)
+        assert not has_pending_changes()
+        assert self.versions()[0] != user_version
+        assert self.versions()[1] == other_version
+
+    def test_not_bumped_on_rollback(self):
+        item_a_versions = self.versions(ItemA)
+        with transaction.atomic():
+            with transaction.atomic():
+                self.user.user_permissions.add(self.view_container)
+                transaction.set_rollback(True)
+            assert not has_pending_changes()
+            group = Group.objects.create(name='group')
+            assign_perm(self.view_container, group, self.container)
+            transaction.set_rollback(True)
+        assert not has_pending_changes()
+        assert self.versions(ItemA) == item_a_versions
+
+
+class TestTracking:
+
+    def register(self, **kwargs):
+        rest_permissions = RestPermissions(**kwargs)
+        rest_permissions.update_permissions({
+            Container: [],
+            ItemB: DelegatedPermission(rest_permissions, 'parents'),
+        })
+        return rest_permissions
+
+    def test_not_tracked_by_default(self):
+        with mock.patch('rest_delegated_permissions.permissions.track_model') as track_model, \
+                mock.patch('rest_delegated_permissions.permissions.track_m2m') as track_m2m:
+            rest_permissions = self.register()
+            assert not track_model.called and not track_m2m.called
+
+            # tracked on the first use of the versions
+            rest_permissions.get_permission_version(ItemB)
+            assert {x[0][0] for x in track_model.call_args_list} == {ItemB, Container}
+            assert track_m2m.call_args_list == [mock.call(ItemB.parents.through)]
+
+    @pytest.mark.parametrize('kwargs', [
+        {'permission_versions': versions.PermissionVersions(key_prefix='tracking')},
+        {'pk_set_cache': PkSetCache()},
+    ])
+    def test_tracked_if_configured(self, kwargs):
+        with mock.patch('rest_delegated_permissions.permissions.track_model') as track_model:
+            self.register(**kwargs)
+            assert {x[0][0] for x in track_model.call_args_list} == {ItemB, Container}
+
+    def test_signals_connected_when_apps_ready(self, monkeypatch):
+        monkeypatch.setattr(versions.receivers, 'connected', False)
+        monkeypatch.setattr(apps, 'ready', False)
+        # for example created in models.py
+        permission_versions = versions.PermissionVersions(key_prefix='not-ready')
+        assert not versions.receivers.connected
+        monkeypatch.setattr(apps, 'ready', True)
+        permission_versions.get_global_version()
+        assert versions.receivers.connected
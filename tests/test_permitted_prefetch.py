@@ -0,0 +1,63 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User, Permission
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions
+from rest_delegated_permissions.cache import permission_existence_cache
+from .app.models import Container, ItemB, ItemE
+from .app.permissions import OwnerPermission
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPermittedPrefetch:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True, params=[False, True], ids=['querysets', 'compiled'])
+    def environ(self, request):
+        self.rest_permissions = RestPermissions(add_django_permissions=True, compile_filters=request.param)
+        self.rest_permissions.update_permissions({
+            Container: [],
+            ItemB: [],
+            ItemE: OwnerPermission(),
+        })
+        self.user = User.objects.create(username='user')
+        self.other = User.objects.create(username='other')
+        self.containers = [Container.objects.create(name='c%s' % i) for i in range(3)]
+        self.item_es = {}
+        self.item_bs = {}
+        for container in self.containers:
+            self.item_es[container.pk] = ItemE.objects.create(name='mine', parent=container, owner=self.user)
+            ItemE.objects.create(name='theirs', parent=container, owner=self.other)
+            self.item_bs[container.pk] = ItemB.objects.create(name='visible')
+            self.item_bs[container.pk].parents.add(container)
+            ItemB.objects.create(name='hidden').parents.add(container)
+            assign_perm(Permission.objects.get(codename='view_itemb'), self.user, self.item_bs[container.pk])
+        self.user.user_permissions.add(Permission.objects.get(codename='view_container'))
+        self.user = User.objects.get(pk=self.user.pk)
+        self.user.has_perm('app.view_container')
+        permission_existence_cache.warm()
+
+    def test_prefetch_filters_children(self, django_assert_max_num_queries):
+        qs = self.rest_permissions.prefetch_permitted(
+            self.rest_permissions.create_queryset_factory(Container)(self.user, 'view'),
+            self.user, 'iteme_set', 'itemb_set')
+        # containers, item e and item b (plus guardian's object permissions of item b)
+        with django_assert_max_num_queries(5):
+            containers = list(qs)
+            assert len(containers) == 3
+            for container in containers:
+                assert list(container.iteme_set.all()) == [self.item_es[container.pk]]
+                assert list(container.itemb_set.all()) == [self.item_bs[container.pk]]
+
+    def test_nested_lookup(self):
+        prefetches = self.rest_permissions.get_prefetches(Container, 'itemb_set__parents', self.user,
+                                                          to_attr='visible_parents')
+        assert [x.prefetch_to for x in prefetches] == ['itemb_set', 'itemb_set__visible_parents']
+        assert prefetches[1].queryset.model is Container
+        container = Container.objects.prefetch_related(*prefetches).get(pk=self.containers[0].pk)
+        assert [x.visible_parents for x in container.itemb_set.all()] == [[self.containers[0]]]
+
+    def test_unknown_relation(self):
+        with pytest.raises(AttributeError):
+            self.rest_permissions.get_prefetches(Container, 'nothing', self.user)
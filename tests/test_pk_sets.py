@@ -0,0 +1,147 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User, Permission
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.cache import permission_existence_cache
+from rest_delegated_permissions.pksets import PkSet, PkSetCache, LRUCache, TOO_LARGE
+from rest_delegated_permissions.versions import PermissionVersions
+from .app.models import Container, ItemA
+
+
+class TestPkSet:
+
+    def test_sorted_array(self):
+        pk_set = PkSet([7, 3, 3, 100, 1])
+        assert not pk_set.run_length_encoded
+        assert len(pk_set) == 4
+        assert list(pk_set) == [1, 3, 7, 100]
+        assert 3 in pk_set and 100 in pk_set
+        assert 2 not in pk_set and 0 not in pk_set and 101 not in pk_set
+        assert pk_set.nbytes == 4 * 8
+
+    def test_run_length_encoded(self):
+        pks = list(range(1, 1001)) + [2000] + list(range(3000, 3500))
+        pk_set = PkSet(reversed(pks))
+        assert pk_set.run_length_encoded
+        assert len(pk_set) == len(pks)
+        assert list(pk_set) == pks
+        assert all(pk in pk_set for pk in (1, 1000, 2000, 3000, 3499))
+        assert not any(pk in pk_set for pk in (0, 1001, 1999, 2001, 2999, 3500))
+        assert pk_set.nbytes == 6 * 8
+
+    def test_to_q(self):
+        assert PkSet([1, 3]).to_q(2).children == [('pk__in', [1, 3])]
+        assert PkSet([1, 3, 5]).to_q(2) is None
+        q = PkSet(list(range(1, 101)) + [200]).to_q(3)
+        assert q.children == [('pk__range', (1, 100)), ('pk__in', [200])]
+        assert q.connector == 'OR'
+        assert PkSet([]).to_q(10).children == [('pk__in', [])]
+
+
+class TestLRUCache:
+
+    def test_eviction(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+    def test_timeout(self):
+        cache = LRUCache()
+        cache.set('a', 1, timeout=0)
+        cache.set('b', 2, timeout=60)
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPkSetCache:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.rest_permissions = RestPermissions(add_django_permissions=True, pk_set_cache=PkSetCache())
+        self.rest_permissions.update_permissions({
+            Container: [],
+            ItemA: DelegatedPermission(self.rest_permissions, 'parent'),
+        })
+        self.user = User.objects.create(username='user')
+        self.view_container = Permission.objects.get(codename='view_container')
+        self.containers = [Container.objects.create(name='c%s' % i) for i in range(3)]
+        self.items = [ItemA.objects.create(name='a%s' % i, parent=self.containers[i % 3]) for i in range(9)]
+        assign_perm(self.view_container, self.user, self.containers[0])
+        permission_existence_cache.warm()
+
+    def accessible(self):
+        qs = self.rest_permissions.create_queryset_factory(ItemA)(self.user, 'view')
+        return set(qs.values_list('pk', flat=True))
+
+    def test_cached(self, django_assert_num_queries):
+        expected = {x.pk for x in self.items[::3]}
+        assert self.accessible() == expected
+        with django_assert_num_queries(1):
+            # just the filtered query itself
+            assert self.accessible() == expected
+        pk_cache = self.rest_permissions.pk_set_cache
+        with django_assert_num_queries(0):
+            assert pk_cache.has_access(self.rest_permissions, self.items[0], self.user, 'view')
+            assert not pk_cache.has_access(self.rest_permissions, self.items[1], self.user, 'view')
+
+    def test_invalidated(self):
+        assert self.accessible() == {x.pk for x in self.items[::3]}
+        assign_perm(self.view_container, self.user, self.containers[1])
+        assert self.accessible() == {x.pk for x in self.items if x.parent_id != self.containers[2].pk}
+        new_item = ItemA.objects.create(name='new', parent=self.containers[1])
+        assert new_item.pk in self.accessible()
+        self.items[0].parent = self.containers[2]
+        self.items[0].save()
+        assert self.items[0].pk not in self.accessible()
+
+    def test_rolled_back(self):
+        expected = {x.pk for x in self.items[::3]}
+        assert self.accessible() == expected
+        with transaction.atomic():
+            assign_perm(self.view_container, self.user, self.containers[1])
+            # the change is visible in the transaction, but the set is not cached
+            assert self.accessible() == {x.pk for x in self.items if x.parent_id != self.containers[2].pk}
+            assert self.rest_permissions.pk_set_cache.get_pk_set(
+                self.rest_permissions, ItemA, self.user, 'view') is None
+            transaction.set_rollback(True)
+        assert self.accessible() == expected
+
+    def test_too_many_keys(self, django_assert_num_queries):
+        pk_cache = self.rest_permissions.pk_set_cache
+        pk_cache.max_params = 2
+        assert self.accessible() == {x.pk for x in self.items[::3]}
+        assert pk_cache.get_pk_set(self.rest_permissions, ItemA, self.user, 'view') is None
+        key = pk_cache.get_key(self.rest_permissions, ItemA, self.user, 'view')
+        assert pk_cache.cache.get(key) == TOO_LARGE
+        with django_assert_num_queries(0):
+            assert pk_cache.has_access(self.rest_permissions, self.items[0], self.user, 'view') is None
+
+    def test_global_permission_not_materialized(self, django_assert_num_queries):
+        self.user.user_permissions.add(self.view_container)
+        user = User.objects.get(pk=self.user.pk)
+        pk_cache = self.rest_permissions.pk_set_cache
+        with CaptureQueriesContext(connection) as context:
+            assert pk_cache.get_filter_q(self.rest_permissions, ItemA, user, 'view').children == [
+                ('pk__isnull', False)]
+        # permission lookups only, the accessible keys are not fetched
+        assert not any('FROM "app_itema"' in x['sql'] for x in context.captured_queries)
+        with django_assert_num_queries(0):
+            assert pk_cache.has_access(self.rest_permissions, self.items[1], user, 'view')
+        assert self.accessible() == {x.pk for x in self.items}
+
+    def test_shared_cache_needs_shared_versions(self):
+        with pytest.raises(ImproperlyConfigured):
+            RestPermissions(pk_set_cache=PkSetCache(cache_alias='default'))
+        RestPermissions(pk_set_cache=PkSetCache(cache_alias='default'),
+                        permission_versions=PermissionVersions(cache_alias='default'))
@@ -0,0 +1,74 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission
+from guardian.shortcuts import assign_perm
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from tests.app.models import Container, ItemB, ItemC, ItemD
+from tests.test_item_base import BaseTestItemB, BaseTestItemC, BaseTestItemD
+from tests.test_item_permission_base import SelectiveBaseTestItemPermission
+from tests.test_users_base import BaseUsers
+
+query_perms = RestPermissions(add_django_permissions=True)
+query_perms.update_permissions({
+    Container: [],
+    ItemB: DelegatedPermission(query_perms, 'parents', query_object_checks=True),
+    ItemC: DelegatedPermission(query_perms, 'container', query_object_checks=True),
+    ItemD: DelegatedPermission(query_perms, 'containers', query_object_checks=True),
+})
+
+
+class QueryObjectChecks:
+
+    def get_perms(self):
+        return query_perms
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemBQueryObjectChecks(QueryObjectChecks, BaseTestItemB, SelectiveBaseTestItemPermission, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemCQueryObjectChecks(QueryObjectChecks, BaseTestItemC, SelectiveBaseTestItemPermission, BaseUsers):
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestItemDQueryObjectChecks(QueryObjectChecks, BaseTestItemD, SelectiveBaseTestItemPermission, BaseUsers):
+    pass
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestQueryObjectChecksQueryCount:
+
+    def test_queries_do_not_depend_on_related_count(self, django_assert_max_num_queries):
+        user = User.objects.create(username='a')
+        view_permission = Permission.objects.get(codename='view_container')
+        item = ItemB.objects.create(name='b')
+        for i in range(20):
+            container = Container.objects.create(name='c%s' % i)
+            item.parents.add(container)
+        assign_perm(view_permission, user, container)
+
+        req = Mock()
+        req.user = user
+        req.method = 'GET'
+        view = DummyViewSet()
+        view.action = 'view'
+        view.queryset = ItemB.objects.all()
+
+        permission = query_perms.get_model_permissions(ItemB)()
+        with django_assert_max_num_queries(10):
+            assert permission.has_object_permission(req, view, item)
+
+        other_user = User.objects.create(username='b')
+        req.user = other_user
+        with django_assert_max_num_queries(10):
+            assert not permission.has_object_permission(req, view, item)
@@ -0,0 +1,123 @@
+# noinspection PyPackageRequirements
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_condition import Condition
+from rest_framework import viewsets
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from .app.models import Container, ItemA, ItemB, ItemC
+from .app.permissions import OwnerPermission
+from .app.viewsets import ItemASerializer
+
+
+def create_permissions():
+    rest_permissions = RestPermissions(add_django_permissions=True)
+    rest_permissions.update_permissions({
+        ItemC: [],
+        Container: Condition.Or(OwnerPermission(), DelegatedPermission(rest_permissions, 'item_c')),
+        ItemA: DelegatedPermission(rest_permissions, 'parent'),
+        ItemB: DelegatedPermission(rest_permissions, 'parents'),
+    })
+    return rest_permissions
+
+
+def test_delegated_select_related():
+    rest_permissions = create_permissions()
+    assert rest_permissions.get_delegated_select_related(ItemA) == ['parent', 'parent__item_c']
+    assert rest_permissions.get_delegated_select_related(Container) == ['item_c']
+    # to-many delegation is not loaded by select_related
+    assert rest_permissions.get_delegated_select_related(ItemB) == []
+    # dropped when the permissions change
+    rest_permissions.set_model_permissions(Container, OwnerPermission(), overwrite=True)
+    assert rest_permissions.get_delegated_select_related(ItemA) == ['parent']
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSelectRelatedDelegations:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.user = User.objects.create(username='user')
+        self.container = Container.objects.create(name='c', owner=self.user)
+        self.item = ItemA.objects.create(name='a', parent=self.container)
+
+    def retrieve(self, select_related_delegations, queryset=None):
+        rest_permissions = create_permissions()
+
+        base_queryset = queryset if queryset is not None else ItemA.objects.all()
+
+        @rest_permissions.apply(select_related_delegations=select_related_delegations)
+        class ItemAViewSet(viewsets.ModelViewSet):
+            queryset = base_queryset
+            serializer_class = ItemASerializer
+
+        request = APIRequestFactory().get('/item/%s/' % self.item.pk)
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = ItemAViewSet.as_view({'get': 'retrieve'})(request, pk=self.item.pk)
+        assert response.status_code == 200
+        return [x['sql'] for x in context.captured_queries]
+
+    def test_parents_are_not_refetched(self):
+        # fills content type and permission caches
+        self.retrieve(False)
+        without_select_related = self.retrieve(False)
+        queries = self.retrieve(True)
+        assert any('FROM "app_itema" INNER JOIN "app_container"' in x for x in queries)
+        # neither the container nor its item c is fetched by the object checks
+        assert not any(x.startswith('SELECT "app_container"') or x.startswith('SELECT "app_itemc"') for x in queries)
+        assert len(queries) < len(without_select_related)
+
+    def test_list_is_not_joined(self):
+        rest_permissions = create_permissions()
+
+        @rest_permissions.apply()
+        class ItemAViewSet(viewsets.ModelViewSet):
+            queryset = ItemA.objects.all()
+            serializer_class = ItemASerializer
+
+        request = APIRequestFactory().get('/item/')
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = ItemAViewSet.as_view({'get': 'list'})(request)
+        assert response.status_code == 200 and len(response.data) == 1
+        assert 'JOIN "app_itemc"' not in context.captured_queries[-1]['sql']
+
+    @pytest.mark.parametrize('select_related_delegations', [False, True])
+    def test_deferred_fields(self, select_related_delegations):
+        for queryset in (ItemA.objects.only('id', 'name'), ItemA.objects.defer('parent'),
+                         ItemA.objects.only('id', 'name', 'parent', 'parent__name')):
+            queries = self.retrieve(select_related_delegations, queryset)
+            assert not any('JOIN "app_itemc"' in x for x in queries)
+
+    def test_deferred_paths_skipped(self):
+        rest_permissions = create_permissions()
+        assert rest_permissions.select_delegated_related(ItemA.objects.only('id', 'name')).query.select_related \
+            is False
+        qs = rest_permissions.select_delegated_related(ItemA.objects.defer('parent__item_c'))
+        assert qs.query.select_related == {'parent': {}}
+        qs = rest_permissions.select_delegated_related(ItemA.objects.all())
+        assert qs.query.select_related == {'parent': {'item_c': {}}}
+        values = ItemA.objects.values('id')
+        assert rest_permissions.select_delegated_related(values) is values
+
+    def test_off_by_default(self):
+        rest_permissions = create_permissions()
+
+        @rest_permissions.apply()
+        class ItemAViewSet(viewsets.ModelViewSet):
+            queryset = ItemA.objects.all()
+            serializer_class = ItemASerializer
+
+        assert not rest_permissions.filter_backend().select_related_delegations
+        request = APIRequestFactory().get('/item/%s/' % self.item.pk)
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = ItemAViewSet.as_view({'get': 'retrieve'})(request, pk=self.item.pk)
+        assert response.status_code == 200
+        assert not any('INNER JOIN "app_container"' in x['sql'] and x['sql'].startswith('SELECT "app_itema"')
+                       for x in context.captured_queries)
@@ -0,0 +1,122 @@
+# noinspection PyPackageRequirements
+import uuid
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission, Group
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission
+from rest_delegated_permissions.cache import UserPermissionCache
+from rest_delegated_permissions.versions import PermissionVersions
+from .app.models import Container, ItemA
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestUserPermissionCache:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        self.cache = UserPermissionCache(key_prefix='test-%s' % uuid.uuid4())
+        self.view_container = Permission.objects.get(codename='view_container')
+        self.user = User.objects.create(username='user')
+        self.group = Group.objects.create(name='group')
+
+    def fresh_user(self):
+        # a new instance as loaded by token authentication on every request
+        return User.objects.get(pk=self.user.pk)
+
+    def test_cached_across_instances(self, django_assert_num_queries):
+        self.user.user_permissions.add(self.view_container)
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        user = self.fresh_user()
+        with django_assert_num_queries(0):
+            assert self.cache.has_perm(user, 'app.view_container')
+            assert not self.cache.has_perm(user, 'app.change_container')
+            assert not self.cache.has_perms(user, ['app.view_container', 'app.change_container'])
+
+    def test_user_permissions_invalidate(self):
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.user.user_permissions.add(self.view_container)
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.user.user_permissions.clear()
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+
+    def test_groups_invalidate(self):
+        self.group.permissions.add(self.view_container)
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.user.groups.add(self.group)
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.group.permissions.remove(self.view_container)
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.group.permissions.add(self.view_container)
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        self.group.delete()
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+
+    def test_rolled_back(self):
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        with transaction.atomic():
+            self.user.user_permissions.add(self.view_container)
+            assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+            transaction.set_rollback(True)
+        assert not self.cache.has_perm(self.fresh_user(), 'app.view_container')
+
+        with transaction.atomic():
+            self.user.user_permissions.add(self.view_container)
+            assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+
+    def test_shared_cache_needs_shared_versions(self):
+        with pytest.raises(ImproperlyConfigured):
+            UserPermissionCache(cache_alias='default')
+        UserPermissionCache(cache_alias='default', permission_versions=PermissionVersions(cache_alias='default'))
+
+    def test_other_users_not_invalidated(self, django_assert_num_queries):
+        self.user.user_permissions.add(self.view_container)
+        assert self.cache.has_perm(self.fresh_user(), 'app.view_container')
+        other = User.objects.create(username='other')
+        other.user_permissions.add(self.view_container)
+        other.groups.add(self.group)
+        user = self.fresh_user()
+        with django_assert_num_queries(0):
+            assert self.cache.has_perm(user, 'app.view_container')
+
+    def test_inactive_and_superuser(self):
+        self.user.user_permissions.add(self.view_container)
+        user = self.fresh_user()
+        user.is_active = False
+        assert not self.cache.has_perm(user, 'app.view_container')
+        superuser = User.objects.create(username='superuser', is_superuser=True)
+        assert self.cache.has_perm(superuser, 'app.change_container')
+
+    def test_rest_permissions(self, django_assert_num_queries):
+        rest_permissions = RestPermissions(add_django_permissions=True, compile_filters=True,
+                                           user_permission_cache=self.cache)
+        rest_permissions.update_permissions({
+            Container: [],
+            ItemA: DelegatedPermission(rest_permissions, 'parent'),
+        })
+        container = Container.objects.create(name='c')
+        item = ItemA.objects.create(name='a', parent=container)
+        self.user.user_permissions.add(self.view_container)
+
+        factory = rest_permissions.create_queryset_factory(ItemA)
+        assert list(factory(self.fresh_user(), 'view')) == [item]
+        assert list(factory(self.fresh_user(), 'change')) == []
+
+        req = Mock()
+        req.user = self.fresh_user()
+        req.method = 'GET'
+        view = DummyViewSet()
+        view.action = 'retrieve'
+        view.queryset = Container.objects.all()
+        # granted by the cached global permission, guardian tables are not queried
+        with django_assert_num_queries(0):
+            assert rest_permissions.get_model_permissions(Container)().has_object_permission(req, view, container)
@@ -0,0 +1,133 @@
+# noinspection PyPackageRequirements
+from unittest.mock import Mock
+
+import pytest
+from django.contrib.auth.models import User, Permission, Group
+from guardian.shortcuts import assign_perm
+from rest_condition import Condition
+
+from rest_delegated_permissions import RestPermissions, DelegatedPermission, BasePermission
+from rest_delegated_permissions.permissions import DjangoCombinedPermission
+from .app.models import Container, ItemA, ItemB, ItemC, ItemD
+from .app.permissions import OwnerPermission
+from .app.viewsets import perms, perms3, perms4
+
+# ItemB delegates to more Containers, the user must be owner and have django permissions on the same one
+and_perms = RestPermissions(add_django_permissions=False)
+and_perms.update_permissions({
+    Container: Condition.And(OwnerPermission(), DjangoCombinedPermission()),
+    ItemB: DelegatedPermission(and_perms, 'parents'),
+})
+
+
+class FilterOnlyPermission(BasePermission):
+
+    def has_object_permission(self, request, view, obj):
+        return True
+
+    def has_permission(self, request, view):
+        return True
+
+    def filter(self, rest_permissions, filtered_queryset, user, action):
+        yield filtered_queryset
+
+
+class DummyViewSet:
+    pass
+
+
+@pytest.mark.django_db(transaction=True)
+class TestUsersWithPermission:
+
+    # noinspection PyAttributeOutsideInit
+    @pytest.fixture(autouse=True)
+    def environ(self):
+        view_container = Permission.objects.get(codename='view_container')
+        change_container = Permission.objects.get(codename='change_container')
+
+        self.users = {}
+        for name in ('global', 'group', 'guardian', 'group_guardian', 'item', 'owner', 'other_owner',
+                     'inactive', 'superuser', 'nobody'):
+            self.users[name] = User.objects.create(username=name)
+
+        self.container1 = Container.objects.create(name='c1', owner=self.users['owner'])
+        self.container2 = Container.objects.create(name='c2', owner=self.users['other_owner'])
+
+        self.users['global'].user_permissions.add(view_container)
+
+        group = Group.objects.create(name='view')
+        group.permissions.add(view_container)
+        self.users['group'].groups.add(group)
+
+        assign_perm(view_container, self.users['guardian'], self.container1)
+        assign_perm(change_container, self.users['guardian'], self.container2)
+        assign_perm(view_container, self.users['owner'], self.container1)
+        assign_perm(view_container, self.users['other_owner'], self.container1)
+
+        guardian_group = Group.objects.create(name='guardian')
+        assign_perm(view_container, guardian_group, self.container1)
+        self.users['group_guardian'].groups.add(guardian_group)
+
+        self.users['inactive'].user_permissions.add(view_container)
+        self.users['inactive'].is_active = False
+        self.users['inactive'].save()
+
+        self.users['superuser'].is_superuser = True
+        self.users['superuser'].save()
+
+        self.item_a = ItemA.objects.create(name='a', parent=self.container1)
+        assign_perm(Permission.objects.get(codename='view_itema'), self.users['item'], self.item_a)
+
+        self.item_b = ItemB.objects.create(name='b')
+        self.item_b.parents.add(self.container1, self.container2)
+
+        self.item_c = ItemC.objects.create(name='c')
+        self.container2.item_c = self.item_c
+        self.container2.save()
+
+        self.item_d = ItemD.objects.create(name='d')
+        self.container1.items_d.add(self.item_d)
+
+    def expected_users(self, rest_permissions, obj, action):
+        expected = set()
+        for user in self.users.values():
+            if not user.is_active:
+                continue
+            req = Mock()
+            req.user = user
+            req.method = 'GET' if action == 'view' else 'PATCH'
+            view = DummyViewSet()
+            view.action = action
+            view.queryset = type(obj).objects.all()
+            if rest_permissions.get_model_permissions(type(obj))().has_object_permission(req, view, obj):
+                expected.add(user.username)
+        return expected
+
+    @pytest.mark.parametrize('action', ['view', 'change'])
+    @pytest.mark.parametrize('rest_permissions,obj_name', [
+        (perms, 'container1'),
+        (perms, 'item_a'),
+        (perms, 'item_b'),
+        (perms, 'item_c'),
+        (perms, 'item_d'),
+        (perms3, 'item_a'),
+        (perms4, 'item_a'),
+        (and_perms, 'item_b'),
+    ])
+    def test_users_with_permission(self, rest_permissions, obj_name, action):
+        obj = getattr(self, obj_name)
+        expected = self.expected_users(rest_permissions, obj, action)
+        users = rest_permissions.get_users_with_permission(obj, action)
+        assert set(users.values_list('username', flat=True)) == expected
+
+    def test_single_query(self, django_assert_num_queries):
+        users = perms.get_users_with_permission(self.item_b, 'view')
+        with django_assert_num_queries(1):
+            assert set(users.values_list('username', flat=True)) == {
+                'global', 'group', 'guardian', 'group_guardian', 'owner', 'other_owner', 'superuser'
+            }
+
+    def test_not_supported(self):
+        rest_permissions = RestPermissions(initial_permissions={ItemA: FilterOnlyPermission()})
+        with pytest.raises(NotImplementedError):
+            rest_permissions.get_users_with_permission(self.item_a, 'view')